@@ -0,0 +1,73 @@
+# attendance_cache.py
+"""
+Process-local set of (student_id, subject_id, date) keys already marked
+present today. Repeat recognitions of a student short-circuit here instead
+of doing a SELECT on `attendance`; the DB-side check in
+mark_attendance_if_not_exists stays as the correctness backstop.
+"""
+import threading
+from datetime import date
+from typing import Optional
+
+from supabase_client import supabase
+
+
+class MarkedTodayCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = date.today().isoformat()
+        self._keys = set()
+        self._warmed = set()  # subject ids loaded from today's rows
+        self.hits = 0
+
+    def _roll_day(self) -> str:
+        """Forget everything when the date changes. Call with the lock held."""
+        today = date.today().isoformat()
+        if today != self._day:
+            self._day = today
+            self._keys.clear()
+            self._warmed.clear()
+        return today
+
+    def warm(self, subject_id: Optional[str]) -> None:
+        """Load today's attendance rows for a subject once per day (at session start)."""
+        if not subject_id:
+            return
+        with self._lock:
+            today = self._roll_day()
+            if subject_id in self._warmed:
+                return
+
+        resp = (
+            supabase.table("attendance")
+            .select("student_id")
+            .eq("date", today)
+            .eq("subject_id", subject_id)
+            .execute()
+        )
+        with self._lock:
+            if self._roll_day() != today:
+                return
+            for row in (resp.data or []):
+                self._keys.add((row["student_id"], subject_id, today))
+            self._warmed.add(subject_id)
+        print(f"✅ Attendance cache warmed for subject {subject_id}: {len(resp.data or [])} already marked today")
+
+    def contains(self, student_id: str, subject_id: Optional[str]) -> bool:
+        with self._lock:
+            found = (student_id, subject_id, self._roll_day()) in self._keys
+            if found:
+                self.hits += 1
+            return found
+
+    def add(self, student_id: str, subject_id: Optional[str]) -> None:
+        with self._lock:
+            self._keys.add((student_id, subject_id, self._roll_day()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._warmed.clear()
+
+
+attendance_cache = MarkedTodayCache()
@@ -0,0 +1,123 @@
+# attendance_writer.py
+"""
+Write-behind queue for attendance marks.
+
+Recognition only enqueues a (student, subject) mark; a background thread
+coalesces duplicates and writes them with one bulk upsert per subject once
+ATTENDANCE_FLUSH_SIZE marks are pending or the oldest has waited
+ATTENDANCE_FLUSH_SECONDS. Outcomes are reported back to the sessions that
+submitted them, and written keys go into the marked-today cache.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from attendance_cache import attendance_cache
+from db_utils import mark_attendance_batch
+
+ATTENDANCE_FLUSH_SIZE = int(os.getenv("ATTENDANCE_FLUSH_SIZE", "25"))
+ATTENDANCE_FLUSH_SECONDS = float(os.getenv("ATTENDANCE_FLUSH_SECONDS", "1.0"))
+
+
+class AttendanceWriter:
+    def __init__(self, flush_size: int = ATTENDANCE_FLUSH_SIZE, flush_seconds: float = ATTENDANCE_FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._cond = threading.Condition()
+        self._pending: Dict[Tuple[str, str], dict] = {}  # (student_id, subject_id) -> mark
+        self._oldest: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.flushes = 0
+        self.written = 0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Write everything still pending and stop the thread."""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+
+    def submit(self, student_id: str, subject_id: str, conf: float = None, session=None) -> bool:
+        """Queue a mark. Returns False if it was coalesced into one already pending."""
+        with self._cond:
+            key = (student_id, subject_id)
+            mark = self._pending.get(key)
+            if mark is not None:
+                if conf is not None and (mark["conf"] is None or conf > mark["conf"]):
+                    mark["conf"] = conf
+                if session is not None and session not in mark["sessions"]:
+                    mark["sessions"].append(session)
+                return False
+
+            self._pending[key] = {"conf": conf, "sessions": [session] if session is not None else []}
+            if self._oldest is None:
+                # The writer sleeps without a timeout while idle; wake it to start the flush_seconds clock
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            elif len(self._pending) >= self.flush_size:
+                self._cond.notify()
+            return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._pending:
+                        waited = time.monotonic() - self._oldest
+                        if len(self._pending) >= self.flush_size or waited >= self.flush_seconds:
+                            break
+                        self._cond.wait(self.flush_seconds - waited)
+                    else:
+                        self._cond.wait()
+                batch, self._pending, self._oldest = self._pending, {}, None
+                stopping = self._stopping
+
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: Dict[Tuple[str, str], dict]) -> None:
+        by_subject = defaultdict(list)
+        for (student_id, subject_id), mark in batch.items():
+            by_subject[subject_id].append((student_id, mark))
+
+        for subject_id, marks in by_subject.items():
+            try:
+                created = mark_attendance_batch([(student_id, mark["conf"]) for student_id, mark in marks], subject_id)
+            except Exception as e:
+                # Not cached, so the next recognition of these students submits them again
+                print(f"❌ Failed to write {len(marks)} attendance marks for subject {subject_id}: {e}")
+                for student_id, mark in marks:
+                    for session in mark["sessions"]:
+                        session.record_attendance(student_id, "failed")
+                continue
+
+            self.flushes += 1
+            self.written += len(created)
+            print(f"✅ Attendance flush for subject {subject_id}: {len(created)} marked, {len(marks) - len(created)} already present")
+            for student_id, mark in marks:
+                attendance_cache.add(student_id, subject_id)
+                status = "created" if student_id in created else "exists"
+                for session in mark["sessions"]:
+                    session.record_attendance(student_id, status)
+
+
+attendance_writer = AttendanceWriter()
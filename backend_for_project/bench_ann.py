@@ -0,0 +1,85 @@
+"""
+Recall and latency of the IVF gallery index against exact search on a
+synthetic ArcFace-like gallery (see bench_prototypes.synthetic_gallery).
+
+- recall@5: share of the exact top-5 students at or above THRESHOLD (what
+  FaceGallery.search returns) that the index also returns
+- top-1: probes whose true student comes back first, above THRESHOLD
+- raw recall@5: the same without a threshold. On this gallery ranks 2-5
+  are unrelated students within ~0.01 of each other (cosine ~0.18), so no
+  approximate index reproduces their order; shown for reference only
+- unknown: latency for probes of people not enrolled, which end in the
+  exact fallback scan when it is on (+exact)
+
+Usage: python bench_ann.py [vectors] [queries]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from bench_prototypes import THRESHOLD, probes, synthetic_gallery
+from gallery_index import IVFIndex, l2_normalize, rank_students
+
+SAMPLES_PER_STUDENT = 15
+TOP_K = 5
+NO_THRESHOLD = -1.0
+
+
+def timed(search, queries):
+    start = time.perf_counter()
+    results = [search(q) for q in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(found, expected):
+    """Mean share of each expected list that was found (an empty expected list counts as recalled)."""
+    return np.mean([len(set(f) & set(e)) / len(e) if e else 1.0 for f, e in zip(found, expected)])
+
+
+def main():
+    vectors = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    students = max(vectors // SAMPLES_PER_STUDENT, 1)
+    matrix, student_ids, identities = synthetic_gallery(students, SAMPLES_PER_STUDENT)
+    queries, truth = probes(identities, count)
+    strangers = l2_normalize(np.random.default_rng(2).standard_normal((count, matrix.shape[1])))
+    print(f"Gallery: {len(matrix)} vectors ({students} students), {count} probes, threshold {THRESHOLD}\n")
+
+    def exact_search(threshold):
+        return lambda q: [m["student_id"] for m in rank_students(matrix, student_ids, {}, q, threshold, TOP_K)]
+
+    exact, exact_ms = timed(exact_search(THRESHOLD), queries)
+    raw_exact, _ = timed(exact_search(NO_THRESHOLD), queries)
+    top1 = np.mean([bool(f) and f[0] == t for f, t in zip(exact, truth)])
+    print(f"{'exact':<18} recall@5 100.0%   top-1 {top1:6.1%}   raw recall@5 100.0%   {exact_ms:7.3f} ms/query")
+
+    start = time.perf_counter()
+    index = IVFIndex(matrix, student_ids)
+    print(f"IVF build: {len(index.centroids)} lists in {time.perf_counter() - start:.1f}s\n")
+
+    for nprobe in (2, 4, 8, 16, 32):
+        index.nprobe = nprobe
+        for fallback in (False, True):
+            index.exact_fallback = fallback
+            found, ms = timed(lambda q: [sid for sid, _ in index.search(q, THRESHOLD, TOP_K)], queries)
+            raw_found, _ = timed(lambda q: [sid for sid, _ in index.search(q, NO_THRESHOLD, TOP_K)], queries)
+            _, unknown_ms = timed(lambda q: index.search(q, THRESHOLD, TOP_K), strangers)
+            top1 = np.mean([bool(f) and f[0] == t for f, t in zip(found, truth)])
+            label = f"nprobe={nprobe}" + (" +exact" if fallback else "")
+            print(f"{label:<18} recall@5 {recall(found, exact):6.1%}   top-1 {top1:6.1%}   "
+                  f"raw recall@5 {recall(raw_found, raw_exact):6.1%}   {ms:7.3f} ms/query   "
+                  f"unknown {unknown_ms:7.3f} ms/query")
+
+    # Incremental update: one student registers 15 new samples
+    new_student = np.array(["new"] * SAMPLES_PER_STUDENT, dtype=object)
+    grown = np.vstack([matrix, matrix[:SAMPLES_PER_STUDENT]])
+    start = time.perf_counter()
+    index.updated(grown, np.concatenate([student_ids, new_student]), ["new"])
+    print(f"\nIncremental add of one student: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Detection time and recall on the downscaled copy vs the full-resolution
+frame (FACE_DETECTOR backend), over a local folder of photos or webcam frames.
+
+Recall is the share of full-resolution boxes matched (IoU >= 0.5) by a box
+from the downscaled pass, after mapping it back to full resolution.
+
+Usage: python bench_detection.py folder_with_images [max_side ...]
+"""
+
+import os
+import sys
+import time
+
+import cv2
+
+from face_tracker import associate
+from recognition_pipeline import (
+    DETECT_MIN_FACE_PX,
+    MIN_FACE_SIZE,
+    detector_input,
+    downscale,
+    get_face_detector,
+    remap_boxes,
+    scaled_size,
+)
+
+MATCH_IOU = 0.5
+
+
+def load_images(folder):
+    """(names, BGR images) of every readable image in a folder."""
+    names, images = [], []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            names.append(name)
+            images.append(img)
+    return names, images
+
+
+def detect(detector, img, scale):
+    """Strict pass as detect_faces runs it (colour conversion included), full-resolution boxes."""
+    small = downscale(detector_input(img, detector), scale)
+    faces = detector.detect(small, scaled_size(MIN_FACE_SIZE, scale, detector))
+    return [tuple(int(v) for v in box) for box in remap_boxes(faces, scale, img.shape)]
+
+
+def run(detector, images, scale_for):
+    """(boxes per image, ms per image)."""
+    boxes, elapsed = [], 0.0
+    for img in images:
+        scale = scale_for(img)
+        start = time.perf_counter()
+        boxes.append(detect(detector, img, scale))
+        elapsed += time.perf_counter() - start
+    return boxes, elapsed * 1000 / len(images)
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    _, images = load_images(sys.argv[1])
+    if not images:
+        sys.exit(f"No readable images in {sys.argv[1]}")
+    max_sides = [int(v) for v in sys.argv[2:]] or [1280, 960, 640, 480]
+    detector = get_face_detector()
+    pixels = sum(img.shape[0] * img.shape[1] for img in images) / len(images)
+    print(f"{len(images)} images, {pixels / 1e6:.1f} MP on average, {detector.name}, MIN_FACE_SIZE={MIN_FACE_SIZE}\n")
+
+    reference, full_ms = run(detector, images, lambda img: 1.0)
+    total = sum(len(b) for b in reference)
+    print(f"{'full resolution':<24} {full_ms:8.1f} ms/frame   {total} faces (reference)")
+
+    for max_side in max_sides:
+        def scale_for(img, max_side=max_side):
+            return min(1.0, DETECT_MIN_FACE_PX / MIN_FACE_SIZE, max_side / max(img.shape[:2]))
+
+        found, ms = run(detector, images, scale_for)
+        matched = sum(len(associate(ref, got, MATCH_IOU)) for ref, got in zip(reference, found))
+        recall = matched / total if total else 1.0
+        print(f"{'max side ' + str(max_side):<24} {ms:8.1f} ms/frame   recall {recall:6.1%}   "
+              f"{sum(len(b) for b in found) - matched} extra boxes   {full_ms / ms:4.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
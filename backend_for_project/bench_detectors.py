@@ -0,0 +1,72 @@
+"""
+Speed and recall of every face-detector backend (face_detectors.DETECTORS)
+over a local image set, with the production downscaling (detection_scale).
+
+Ground truth is labels.json in the image folder when present:
+    {"image.jpg": [[x, y, w, h], ...], ...}
+Without it, the reference is every face any backend found at full
+resolution (boxes overlapping by IoU >= 0.5 count once), so recall is
+relative to the union of the backends.
+
+Backends whose model file is missing are skipped.
+
+Usage: python bench_detectors.py folder_with_images
+"""
+
+import json
+import os
+import sys
+
+from bench_detection import MATCH_IOU, load_images, run
+from face_detectors import DETECTORS
+from face_tracker import associate, iou
+from recognition_pipeline import detection_scale
+
+
+def union(box_lists):
+    merged = []
+    for boxes in box_lists:
+        for box in boxes:
+            if all(iou(box, kept) < MATCH_IOU for kept in merged):
+                merged.append(box)
+    return merged
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    folder = sys.argv[1]
+    names, images = load_images(folder)
+    if not images:
+        sys.exit(f"No readable images in {folder}")
+
+    detectors = {}
+    for name, cls in DETECTORS.items():
+        try:
+            detectors[name] = cls()
+        except Exception as e:
+            print(f"⏭️ {name}: {e}")
+
+    labels_path = os.path.join(folder, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path) as f:
+            labels = json.load(f)
+        truth = [[tuple(box) for box in labels.get(name, [])] for name in names]
+        source = "labels.json"
+    else:
+        full = [run(detector, images, lambda img: 1.0)[0] for detector in detectors.values()]
+        truth = [union(per_image) for per_image in zip(*full)]
+        source = "union of backends at full resolution"
+    total = sum(len(boxes) for boxes in truth)
+    print(f"{len(images)} images, {total} faces ({source})\n")
+
+    for name, detector in detectors.items():
+        found, ms = run(detector, images, lambda img: detection_scale(img.shape))
+        matched = sum(len(associate(ref, got, MATCH_IOU)) for ref, got in zip(truth, found))
+        recall = matched / total if total else 1.0
+        false_positives = sum(len(b) for b in found) - matched
+        print(f"{name:<8} {ms:8.1f} ms/frame   recall {recall:6.1%}   {false_positives} unmatched boxes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+CPU latency of ArcFace and MiniFASNet: native (DeepFace/TensorFlow, PyTorch)
+vs the float and int8 ONNX exports from export_onnx.py, per batch size.
+Exports that have not been generated are skipped.
+
+Random crops are enough for timing; accuracy is test_onnx_parity.py's job.
+
+Usage: python bench_onnx.py [batch_size ...] [--repeats N]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from face_embedding import embed_faces_native, embed_faces_onnx
+from liveness_engine import LivenessEngine, liveness_model_paths
+from onnx_backend import ARCFACE_ONNX_NAME, OnnxLivenessEngine, onnx_model_path
+
+WARMUP = 2
+
+
+def timed(fn, crops, repeats):
+    """Mean ms per call after WARMUP untimed calls."""
+    for _ in range(WARMUP):
+        fn(crops)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(crops)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    args = sys.argv[1:]
+    repeats = 20
+    if "--repeats" in args:
+        i = args.index("--repeats")
+        repeats = int(args[i + 1])
+        del args[i:i + 2]
+    batch_sizes = [int(v) for v in args] or [1, 4, 16]
+
+    rng = np.random.default_rng(0)
+    paths = liveness_model_paths()
+    arcface = {"native": embed_faces_native}
+    liveness = {"native": LivenessEngine(paths).real_scores}
+    for label, int8 in [("onnx", False), ("onnx int8", True)]:
+        if os.path.exists(onnx_model_path(ARCFACE_ONNX_NAME, int8)):
+            arcface[label] = lambda crops, int8=int8: embed_faces_onnx(crops, int8)
+        if all(os.path.exists(onnx_model_path(path, int8)) for path in paths):
+            liveness[label] = OnnxLivenessEngine(paths, int8).real_scores
+    print(f"{os.cpu_count()} cores, {repeats} repeats, liveness models: {[os.path.basename(p) for p in paths]}\n")
+
+    for batch in batch_sizes:
+        face_crops = [rng.integers(0, 256, size=(160, 160, 3), dtype=np.uint8) for _ in range(batch)]
+        liveness_crops = [rng.integers(0, 256, size=(80, 80, 3), dtype=np.uint8) for _ in range(batch)]
+        for model, backends, crops in [("ArcFace", arcface, face_crops), ("MiniFASNet", liveness, liveness_crops)]:
+            native_ms = timed(backends["native"], crops, repeats)
+            for label, fn in backends.items():
+                ms = native_ms if label == "native" else timed(fn, crops, repeats)
+                print(f"{model:<11} batch {batch:<3} {label:<10} {ms:8.2f} ms   {ms / batch:7.2f} ms/face   "
+                      f"{native_ms / ms:4.1f}x")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Accuracy/latency comparison of exact gallery search vs per-student prototypes
+on a synthetic ArcFace-like gallery (no database, no models).
+
+Each student gets a random identity direction; samples and probes are that
+direction plus noise, tuned so same-student cosine is ~0.5 and different
+students ~0, roughly what ArcFace gives for webcam crops.
+
+Usage: python bench_prototypes.py [students] [samples_per_student] [queries]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from gallery_index import PrototypeIndex, l2_normalize, rank_students
+
+DIM = 512
+NOISE = 1.0  # cos(sample, identity) ~ 1/sqrt(1 + NOISE^2)
+THRESHOLD = 0.5
+
+
+def synthetic_gallery(students, samples, dim=DIM, noise=NOISE, seed=0):
+    """(matrix, student_ids, identities) with `samples` normalised rows per student."""
+    rng = np.random.default_rng(seed)
+    identities = l2_normalize(rng.standard_normal((students, dim)))
+    jitter = rng.standard_normal((students * samples, dim)).astype(np.float32) * (noise / np.sqrt(dim))
+    matrix = l2_normalize(np.repeat(identities, samples, axis=0) + jitter)
+    student_ids = np.array([f"s{i}" for i in range(students) for _ in range(samples)], dtype=object)
+    return matrix, student_ids, identities
+
+
+def probes(identities, count, dim=DIM, noise=NOISE, seed=1):
+    """(queries, true student ids) drawn fresh from random identities."""
+    rng = np.random.default_rng(seed)
+    who = rng.integers(0, len(identities), size=count)
+    jitter = rng.standard_normal((count, dim)).astype(np.float32) * (noise / np.sqrt(dim))
+    return l2_normalize(identities[who] + jitter), [f"s{i}" for i in who]
+
+
+def evaluate(name, search, queries, truth, searched_bytes):
+    correct = 0
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        matches = search(query)
+        correct += bool(matches) and matches[0] == expected
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{name:<28} top-1 {correct / len(queries):6.1%}   {elapsed_ms:7.3f} ms/query   "
+          f"searched {searched_bytes / 1e6:7.2f} MB")
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    matrix, student_ids, identities = synthetic_gallery(students, samples)
+    queries, truth = probes(identities, count)
+    print(f"Gallery: {students} students x {samples} samples = {len(matrix)} vectors, {count} probes\n")
+
+    evaluate("exact (raw samples)",
+             lambda q: [m["student_id"] for m in rank_students(matrix, student_ids, {}, q, THRESHOLD, 5)],
+             queries, truth, matrix.nbytes)
+
+    for k, rerank in [(1, False), (1, True), (3, False), (3, True)]:
+        start = time.perf_counter()
+        index = PrototypeIndex(matrix, student_ids, k=k, rerank=rerank)
+        build_s = time.perf_counter() - start
+        label = f"prototype k={k}" + (" + re-rank" if rerank else "")
+        evaluate(label, lambda q: [sid for sid, _ in index.search(q, THRESHOLD, 5)], queries, truth, index.nbytes)
+        print(f"{'':<28} (built in {build_s:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
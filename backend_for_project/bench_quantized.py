@@ -0,0 +1,54 @@
+"""
+Accuracy, latency and memory of float32 vs float16 vs int8 gallery storage
+(optionally with a float32 re-rank) on a synthetic ArcFace-like gallery
+(see bench_prototypes.synthetic_gallery).
+
+Recall@5 is the share of the float32 top-5 students that each storage
+also returns in its top 5.
+
+Usage: python bench_quantized.py [students] [samples_per_student] [queries]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from bench_prototypes import THRESHOLD, probes, synthetic_gallery
+from gallery_index import quantize, rank_students, resident_nbytes
+
+NO_THRESHOLD = -1.0
+TOP_K = 5
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    matrix, student_ids, identities = synthetic_gallery(students, samples)
+    queries, truth = probes(identities, count)
+    print(f"Gallery: {students} students x {samples} samples = {len(matrix)} vectors, {count} probes\n")
+
+    exact = [[m["student_id"] for m in rank_students(matrix, student_ids, {}, q, NO_THRESHOLD, TOP_K)]
+             for q in queries]
+
+    for dtype, rerank in [("float32", 0), ("float16", 0), ("int8", 0), ("float16", 50), ("int8", 50)]:
+        stored = quantize(matrix, dtype, rerank)
+        correct, found = 0, []
+        start = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            matches = rank_students(stored, student_ids, {}, query, THRESHOLD, TOP_K)
+            correct += bool(matches) and matches[0]["student_id"] == expected
+        elapsed_ms = (time.perf_counter() - start) * 1000 / count
+        for query in queries:
+            found.append([m["student_id"] for m in rank_students(stored, student_ids, {}, query, NO_THRESHOLD, TOP_K)])
+        recall = np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)])
+
+        label = dtype + (f" + re-rank {rerank}" if rerank else "")
+        print(f"{label:<24} top-1 {correct / count:6.1%}   recall@5 {recall:6.1%}   {elapsed_ms:7.3f} ms/query   "
+              f"scanned {stored.nbytes / 1e6:7.2f} MB   resident {resident_nbytes(stored) / 1e6:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
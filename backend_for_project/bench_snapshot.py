@@ -0,0 +1,53 @@
+"""
+Cold-start cost of building the gallery from JSON rows (what a load from the
+`faces` table has to decode) vs mapping a gallery snapshot, on a synthetic
+gallery (see bench_prototypes.synthetic_gallery).
+
+Usage: python bench_snapshot.py [students] [samples_per_student]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_prototypes import DIM, synthetic_gallery
+from gallery_index import l2_normalize, rank_students
+from gallery_snapshot import open_snapshot, write_snapshot
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    matrix, student_ids, identities = synthetic_gallery(students, samples)
+    face_ids = list(range(len(matrix)))
+    rows = [json.dumps(row.tolist()) for row in matrix]  # pgvector columns arrive as strings
+    print(f"Gallery: {len(matrix)} vectors\n")
+
+    start = time.perf_counter()
+    decoded = l2_normalize(np.vstack([np.asarray(json.loads(r), dtype=np.float32) for r in rows]))
+    rank_students(decoded, student_ids, {}, identities[0], 0.5, 5)
+    print(f"{'JSON decode':<20} {(time.perf_counter() - start) * 1000:9.1f} ms to first match")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gallery.snapshot")
+        start = time.perf_counter()
+        write_snapshot(path, matrix, face_ids, list(student_ids), {})
+        print(f"{'snapshot write':<20} {(time.perf_counter() - start) * 1000:9.1f} ms "
+              f"({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        start = time.perf_counter()
+        snapshot = open_snapshot(path, DIM)
+        opened_ms = (time.perf_counter() - start) * 1000
+        rank_students(snapshot.matrix, snapshot.student_ids, {}, identities[0], 0.5, 5)
+        print(f"{'snapshot open':<20} {opened_ms:9.1f} ms, "
+              f"{(time.perf_counter() - start) * 1000:9.1f} ms to first match")
+        del snapshot
+
+
+if __name__ == "__main__":
+    main()
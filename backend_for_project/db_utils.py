@@ -235,35 +235,73 @@ def load_training_data():
     return X, y, id2name
 
 # ---------- Attendance ----------
+# Subject attendance is written as one idempotent upsert. It relies on this
+# unique key (remove existing duplicates first):
+#
+#   DELETE FROM attendance a USING attendance b
+#    WHERE a.student_id = b.student_id AND a.subject_id = b.subject_id
+#      AND a.date = b.date AND a.id > b.id;
+#   ALTER TABLE attendance ADD CONSTRAINT attendance_student_subject_date_key
+#     UNIQUE (student_id, subject_id, date);
+ATTENDANCE_CONFLICT_KEY = "student_id,subject_id,date"
+
+
+def _attendance_row(student_id: str, subject_id: str, today: str, conf: float = None) -> dict:
+    row = {"student_id": student_id, "subject_id": subject_id, "date": today, "status": "present"}
+    if conf is not None:
+        row["confidence"] = float(conf)
+    return row
+
+
+def mark_attendance(student_id: str, subject_id: str, conf: float = None) -> bool:
+    """Mark today's attendance in one round trip. Returns True if a row was created."""
+    return student_id in mark_attendance_batch([(student_id, conf)], subject_id)
+
+
+def mark_attendance_batch(marks, subject_id: str) -> set:
+    """
+    Mark many (student_id, conf) pairs for one subject in a single upsert.
+    Rows that already exist are left untouched; returns the student ids that
+    were newly marked.
+    """
+    today = date.today().isoformat()
+    rows = {}
+    for student_id, conf in marks:
+        rows.setdefault(student_id, _attendance_row(student_id, subject_id, today, conf))
+    if not rows:
+        return set()
+
+    res = supabase.table("attendance").upsert(
+        list(rows.values()), on_conflict=ATTENDANCE_CONFLICT_KEY, ignore_duplicates=True
+    ).execute()
+    return {row["student_id"] for row in (res.data or [])}
+
+
 def mark_attendance_if_not_exists(student_id: str, class_id: str = None, conf: float = None, subject_id: str = None):
-    """Insert attendance for today only if not already present."""
+    """Insert attendance for today only if not already present. Returns {"status": "created" | "exists"}."""
+    if subject_id:
+        created = mark_attendance(student_id, subject_id, conf)
+        return {"status": "created" if created else "exists"}
+
+    # Class attendance has no unique key, keep the check-then-insert
     today = date.today().isoformat()
-    q = supabase.table("attendance").select("*")\
+    q = supabase.table("attendance").select("id")\
         .eq("student_id", student_id).eq("date", today)
-    
-    # Check by subject_id if provided, otherwise class_id
-    if subject_id:
-        q = q.eq("subject_id", subject_id)
-    elif class_id:
+    if class_id:
         q = q.eq("class_id", class_id)
-    
-    chk = q.execute()
-    if chk.data and len(chk.data) > 0:
+
+    chk = q.limit(1).execute()
+    if chk.data:
         return {"status": "exists"}
-    
+
     payload = {"student_id": student_id, "date": today, "status": "present"}
-    
-    # Use subject_id if provided (preferred), otherwise class_id
-    if subject_id:
-        payload["subject_id"] = subject_id
-    elif class_id:
+    if class_id:
         payload["class_id"] = class_id
-    
     if conf is not None:
         payload["confidence"] = float(conf)
-    
-    res = supabase.table("attendance").insert(payload).execute()
-    return res
+
+    supabase.table("attendance").insert(payload).execute()
+    return {"status": "created"}
 
 def attendance_percentage(student_id: str, class_id: str = None):
     """Calculate attendance percentage for a student."""
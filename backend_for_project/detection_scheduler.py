@@ -0,0 +1,187 @@
+# detection_scheduler.py
+"""
+Per-session choice of how much of each frame to scan for faces.
+
+A classroom camera is fixed and students barely move, so most frames only
+scan the regions around the faces found in the previous frame (each box
+grown by DETECT_ROI_MARGIN of its size on every side). A full-frame scan
+runs every DETECT_FULL_EVERY frames, when there is nothing to track, and on
+the frame after an ROI pass lost a face. The slower lenient pass only runs
+on full scans that lost faces the previous scan had, or once every
+DETECT_LENIENT_EVERY empty full scans, instead of on every empty frame.
+
+DetectionTuner narrows the detector's size range to the face sizes this
+camera actually sees (see its docstring).
+"""
+import math
+import os
+from collections import deque
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+DETECT_ROI = os.getenv("DETECT_ROI", "true").lower() == "true"
+DETECT_FULL_EVERY = int(os.getenv("DETECT_FULL_EVERY", "10"))
+DETECT_ROI_MARGIN = float(os.getenv("DETECT_ROI_MARGIN", "0.5"))
+DETECT_LENIENT_EVERY = int(os.getenv("DETECT_LENIENT_EVERY", "10"))
+
+DETECT_TUNE = os.getenv("DETECT_TUNE", "true").lower() == "true"
+DETECT_TUNE_MIN_SAMPLES = int(os.getenv("DETECT_TUNE_MIN_SAMPLES", "30"))  # face sizes seen before tuning
+DETECT_TUNE_MARGIN = float(os.getenv("DETECT_TUNE_MARGIN", "0.3"))  # band widened by this fraction each way
+DETECT_TUNE_LEVELS = int(os.getenv("DETECT_TUNE_LEVELS", "4"))  # pyramid levels spent on the band
+TUNE_PERCENTILES = (5, 95)
+TUNE_SCALE_FACTOR_RANGE = (1.05, 1.3)
+
+Box = Tuple[int, int, int, int]
+
+
+class DetectionPlan(NamedTuple):
+    rois: Optional[List[Box]]  # None = scan the whole frame
+    lenient: bool
+    # Strict-pass overrides in full-resolution pixels; 0 = the pipeline defaults
+    min_size: int = 0
+    max_size: int = 0
+    scale_factor: float = 0.0
+
+
+def expand_roi(box: Sequence[int], margin: float) -> Box:
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    return x - dx, y - dy, w + 2 * dx, h + 2 * dy
+
+
+class DetectionTuner:
+    """
+    Learns the band of face sizes a camera sees (5th-95th percentile of the
+    first DETECT_TUNE_MIN_SAMPLES faces, widened by DETECT_TUNE_MARGIN) and
+    then detects with minSize/maxSize set to that band and a scale factor
+    that covers it in DETECT_TUNE_LEVELS pyramid levels.
+
+    When a tuned scan finds fewer faces than the frame before, the next scan
+    uses the defaults; if that finds more faces, or a face outside the
+    band, the band is dropped and learned again.
+    """
+
+    def __init__(self, enabled: bool = DETECT_TUNE, min_samples: int = DETECT_TUNE_MIN_SAMPLES,
+                 margin: float = DETECT_TUNE_MARGIN, levels: int = DETECT_TUNE_LEVELS):
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self.margin = margin
+        self.levels = levels
+        self.sizes: deque = deque(maxlen=max(min_samples, 1) * 4)
+        self.band: Optional[Tuple[int, int]] = None
+        self.scale_factor = 0.0
+        self._probe_below: Optional[int] = None  # faces the tuned scan found before a default-parameter probe
+        self.resets = 0
+        self._ms = {False: [0, 0.0], True: [0, 0.0]}  # tuned? -> [full scans, detection ms]
+
+    def params(self) -> Tuple[int, int, float]:
+        """(min_size, max_size, scale_factor) for the next scan; zeros = defaults."""
+        if self.band is None or self._probe_below is not None:
+            return 0, 0, 0.0
+        return self.band[0], self.band[1], self.scale_factor
+
+    def _learn(self) -> None:
+        ordered = sorted(self.sizes)
+        lo = ordered[int(len(ordered) * TUNE_PERCENTILES[0] / 100)]
+        hi = ordered[min(int(len(ordered) * TUNE_PERCENTILES[1] / 100), len(ordered) - 1)]
+        lo, hi = int(lo * (1 - self.margin)), int(math.ceil(hi * (1 + self.margin)))
+        low, high = TUNE_SCALE_FACTOR_RANGE
+        self.band = (max(lo, 1), hi)
+        self.scale_factor = min(max((hi / max(lo, 1)) ** (1 / max(self.levels, 1)), low), high)
+        print(f"🎯 Detection tuned to faces of {self.band[0]}-{self.band[1]} px, scaleFactor {self.scale_factor:.2f}")
+
+    def observe(self, plan: DetectionPlan, boxes: List[Box], previous: int, detect_ms: float) -> None:
+        """Record a scan made with `plan`; `previous` is the face count of the frame before."""
+        if not self.enabled:
+            return
+        tuned = plan.min_size > 0
+        if plan.rois is None:
+            stats = self._ms[tuned]
+            stats[0] += 1
+            stats[1] += detect_ms
+
+        sizes = [min(w, h) for _, _, w, h in boxes]
+        if tuned and len(boxes) < previous:
+            self._probe_below = len(boxes)  # faces lost: check with the defaults before trusting the band
+        elif not tuned and self.band is not None:
+            lo, hi = self.band
+            missed = self._probe_below is not None and len(boxes) > self._probe_below
+            if missed or any(size < lo or size > hi for size in sizes):
+                self.band, self.scale_factor = None, 0.0
+                self.sizes.clear()
+                self.resets += 1
+                print("🎯 Detection band no longer fits, back to default parameters")
+            self._probe_below = None
+
+        self.sizes.extend(sizes)
+        if self.band is None and len(self.sizes) >= self.min_samples:
+            self._learn()
+
+    def stats(self) -> dict:
+        (default_scans, default_ms), (tuned_scans, tuned_ms) = self._ms[False], self._ms[True]
+        default_avg = default_ms / default_scans if default_scans else 0.0
+        tuned_avg = tuned_ms / tuned_scans if tuned_scans else 0.0
+        min_size, max_size = self.band or (0, 0)
+        return {
+            "tuned": self.band is not None,
+            "min_size": min_size,
+            "max_size": max_size,
+            "scale_factor": round(self.scale_factor, 3),
+            "resets": self.resets,
+            "default_full_scan_ms": round(default_avg, 2),
+            "tuned_full_scan_ms": round(tuned_avg, 2),
+            "saved_ms": round((default_avg - tuned_avg) * tuned_scans, 1) if default_scans and tuned_scans else 0.0,
+        }
+
+
+class DetectionScheduler:
+    def __init__(self, enabled: bool = DETECT_ROI, full_every: int = DETECT_FULL_EVERY,
+                 roi_margin: float = DETECT_ROI_MARGIN, lenient_every: int = DETECT_LENIENT_EVERY):
+        self.tuner = DetectionTuner()
+        self.enabled = enabled
+        self.full_every = full_every
+        self.roi_margin = roi_margin
+        self.lenient_every = lenient_every
+        self.last_boxes: List[Box] = []
+        self._since_full = 0
+        self._empty_full_scans = 0
+        self._force_full = True
+        self.full_scans = 0
+        self.roi_scans = 0
+        self.lenient_allowed = 0  # full scans allowed to fall back to the lenient pass
+
+    def plan(self) -> DetectionPlan:
+        full = (not self.enabled or self._force_full or not self.last_boxes
+                or self._since_full + 1 >= self.full_every)
+        params = self.tuner.params()
+        if not full:
+            return DetectionPlan([expand_roi(box, self.roi_margin) for box in self.last_boxes], False, *params)
+
+        if not self.enabled:
+            lenient = True
+        elif self.last_boxes:
+            lenient = True  # faces were there a moment ago; look harder before giving up on them
+        else:
+            lenient = self._empty_full_scans % max(self.lenient_every, 1) == 0
+        return DetectionPlan(None, lenient, *params)
+
+    def update(self, plan: DetectionPlan, boxes: Sequence[Sequence[int]], detect_ms: float = 0.0) -> None:
+        """Record what a planned scan found (full-resolution boxes)."""
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        self.tuner.observe(plan, boxes, len(self.last_boxes), detect_ms)
+        if plan.rois is None:
+            self.full_scans += 1
+            self._since_full = 0
+            self._force_full = False
+            self._empty_full_scans = 0 if boxes else self._empty_full_scans + 1
+        else:
+            self.roi_scans += 1
+            self._since_full += 1
+            # A face left its region (or the ROI pass missed it): look at the whole frame next time
+            self._force_full = len(boxes) < len(plan.rois)
+        if plan.lenient:
+            self.lenient_allowed += 1
+        self.last_boxes = boxes
+
+    def stats(self) -> dict:
+        return {"full_scans": self.full_scans, "roi_scans": self.roi_scans, "lenient_allowed": self.lenient_allowed,
+                "tuning": self.tuner.stats()}
@@ -0,0 +1,86 @@
+"""
+Offline export of ArcFace (DeepFace/Keras) and MiniFASNet (SilentFace/PyTorch)
+to ONNX for INFERENCE_BACKEND=onnx, optionally with dynamically quantised
+int8 copies next to them.
+
+Needs the native stack plus the export-only packages:
+    pip install tf2onnx==1.16.1 onnx==1.15.0
+
+Writes ONNX_MODEL_DIR/arcface.onnx and one <model>.onnx per MiniFASNet weight
+file (both LIVENESS_ENSEMBLE_FILES, so either liveness setting works).
+Check the result with test_onnx_parity.py before deploying it.
+
+Usage: python export_onnx.py [--int8] [--opset 13]
+"""
+
+import argparse
+import os
+
+from onnx_backend import ARCFACE_ONNX_NAME, ONNX_MODEL_DIR, onnx_model_path
+
+DEFAULT_OPSET = 13
+
+
+def export_arcface(opset: int) -> str:
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+
+    from face_embedding import FACE_MODEL_NAME
+
+    client = DeepFace.build_model(FACE_MODEL_NAME)
+    height, width = client.input_shape[1], client.input_shape[0]
+    path = onnx_model_path(ARCFACE_ONNX_NAME, int8=False)
+    signature = [tf.TensorSpec((None, height, width, 3), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(client.model, input_signature=signature, opset=opset, output_path=path)
+    return path
+
+
+def export_minifasnet(opset: int):
+    import torch
+
+    from liveness_engine import LIVENESS_ENSEMBLE_FILES, LIVENESS_INPUT_SIZE, LIVENESS_MODEL_DIR, LivenessEngine
+
+    paths = []
+    for name in LIVENESS_ENSEMBLE_FILES:
+        weights = os.path.join(LIVENESS_MODEL_DIR, name)
+        if not os.path.exists(weights):
+            print(f"⚠️ Skipping {weights}: not found")
+            continue
+        model = LivenessEngine([weights]).models[0].cpu()
+        path = onnx_model_path(name, int8=False)
+        dummy = torch.zeros(1, 3, *LIVENESS_INPUT_SIZE)
+        torch.onnx.export(
+            model, dummy, path, opset_version=opset, input_names=["input"], output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        )
+        paths.append(path)
+    return paths
+
+
+def quantize(path: str) -> str:
+    """Dynamic int8 quantisation of the weights (activations stay float, no calibration set needed)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out = path[:-len(".onnx")] + ".int8.onnx"
+    quantize_dynamic(path, out, weight_type=QuantType.QInt8)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--int8", action="store_true", help="also write dynamically quantised *.int8.onnx copies")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    args = parser.parse_args()
+
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    exported = [export_arcface(args.opset)] + export_minifasnet(args.opset)
+    for path in exported:
+        print(f"✅ {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        if args.int8:
+            quantized = quantize(path)
+            print(f"✅ {quantized} ({os.path.getsize(quantized) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# face_detectors.py
+"""
+Interchangeable CPU face detectors, selected with FACE_DETECTOR:
+
+- haar:  OpenCV Haar cascade (data/haarcascade_frontalface_default.xml), the original detector
+- lbp:   OpenCV LBP cascade, several times faster than Haar with somewhat lower recall
+- yunet: YuNet CNN through cv2.FaceDetectorYN, loaded from a local ONNX file
+
+The cascade XML for LBP and the YuNet model are not part of opencv-python;
+download them into data/ (or point LBP_CASCADE_PATH / YUNET_MODEL_PATH at
+them). A backend whose file is missing is replaced by Haar once, at import,
+with a single warning. Detector objects are not thread-safe;
+recognition_pipeline keeps one per thread.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Type
+
+import cv2
+import numpy as np
+
+_LOCAL_HAAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "haarcascade_frontalface_default.xml")
+HAAR_CASCADE_PATH = os.getenv(
+    "HAAR_CASCADE_PATH",
+    _LOCAL_HAAR if os.path.exists(_LOCAL_HAAR) else cv2.data.haarcascades + "haarcascade_frontalface_default.xml",
+)
+LBP_CASCADE_PATH = os.getenv("LBP_CASCADE_PATH", "data/lbpcascade_frontalface_improved.xml")
+YUNET_MODEL_PATH = os.getenv("YUNET_MODEL_PATH", "data/face_detection_yunet_2023mar.onnx")
+YUNET_SCORE_THRESHOLD = float(os.getenv("YUNET_SCORE_THRESHOLD", "0.8"))
+YUNET_LENIENT_SCORE_THRESHOLD = float(os.getenv("YUNET_LENIENT_SCORE_THRESHOLD", "0.6"))
+
+
+def _as_boxes(faces) -> np.ndarray:
+    return np.round(np.asarray(faces, dtype=np.float64).reshape(-1, 4)).astype(int)
+
+
+class FaceDetector(ABC):
+    """
+    detect() returns (x, y, w, h) boxes in the pixels of the image it was
+    given. `lenient` asks for a slower, more permissive pass, used when the
+    strict one found nothing.
+    """
+
+    name = ""
+    color = False  # True = wants the BGR image, False = grayscale
+    min_window = 24  # smallest face (px) the backend can find
+    path = ""  # model file the backend loads
+
+    @abstractmethod
+    def detect(self, image: np.ndarray, min_size: int, max_size: int = 0, lenient: bool = False,
+               scale_factor: float = 0.0) -> np.ndarray:
+        """max_size = 0 means unbounded; scale_factor = 0.0 means the backend's default."""
+
+
+class CascadeDetector(FaceDetector):
+    def __init__(self, path: str = ""):
+        path = path or self.path
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Could not load the {self.name} cascade from {path}")
+
+    def detect(self, image, min_size, max_size=0, lenient=False, scale_factor=0.0):
+        default_scale, min_neighbors = (1.1, 3) if lenient else (1.3, 5)
+        # (0, 0) = no upper bound; OpenCV rejects an empty tuple for maxSize
+        faces = self.cascade.detectMultiScale(
+            image, scale_factor or default_scale, min_neighbors,
+            minSize=(min_size, min_size), maxSize=(max_size, max_size),
+        )
+        return _as_boxes(faces)
+
+
+class HaarDetector(CascadeDetector):
+    name = "haar"
+    path = HAAR_CASCADE_PATH
+
+
+class LBPDetector(CascadeDetector):
+    name = "lbp"
+    path = LBP_CASCADE_PATH
+
+
+class YuNetDetector(FaceDetector):
+    name = "yunet"
+    color = True
+    min_window = 10
+    path = YUNET_MODEL_PATH
+
+    def __init__(self, path: str = ""):
+        path = path or self.path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"YuNet model not found at {path}")
+        self.model = cv2.FaceDetectorYN.create(path, "", (320, 320), YUNET_SCORE_THRESHOLD, 0.3, 5000)
+
+    def detect(self, image, min_size, max_size=0, lenient=False, scale_factor=0.0):
+        # YuNet looks at every scale in one pass, so scale_factor does not apply
+        height, width = image.shape[:2]
+        self.model.setInputSize((width, height))
+        self.model.setScoreThreshold(YUNET_LENIENT_SCORE_THRESHOLD if lenient else YUNET_SCORE_THRESHOLD)
+        _, faces = self.model.detect(image)
+        if faces is None:
+            return _as_boxes(())
+        boxes = _as_boxes(faces[:, :4])
+        boxes[:, 0:2] = np.maximum(boxes[:, 0:2], 0)
+        boxes[:, 2] = np.minimum(boxes[:, 2], width - boxes[:, 0])
+        boxes[:, 3] = np.minimum(boxes[:, 3], height - boxes[:, 1])
+        sizes = np.minimum(boxes[:, 2], boxes[:, 3])
+        keep = sizes >= min_size
+        if max_size:
+            keep &= sizes <= max_size
+        return boxes[keep]
+
+
+DETECTORS: Dict[str, Type[FaceDetector]] = {"haar": HaarDetector, "lbp": LBPDetector, "yunet": YuNetDetector}
+
+
+def resolve_detector(name: str) -> str:
+    """`name` if its model file is present, else "haar" (logged here, so once per process)."""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown FACE_DETECTOR {name!r}; expected one of {', '.join(DETECTORS)}")
+    path = DETECTORS[name].path
+    if name != "haar" and not os.path.exists(path):
+        print(f"⚠️ {name} detector model not found at {path}; using the Haar cascade instead")
+        return "haar"
+    return name
+
+
+FACE_DETECTOR = resolve_detector(os.getenv("FACE_DETECTOR", "haar").lower())
+
+
+def create_detector(name: str = FACE_DETECTOR) -> FaceDetector:
+    """A new detector for `name` (see resolve_detector for the fallback)."""
+    return DETECTORS[resolve_detector(name)]()
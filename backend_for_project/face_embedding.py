@@ -0,0 +1,67 @@
+# face_embedding.py
+import os
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from onnx_backend import ARCFACE_ONNX_NAME, INFERENCE_BACKEND, ONNX_INT8, load_session, onnx_model_path
+
+FACE_MODEL_NAME = "ArcFace"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+def preprocess_face(face_crop: np.ndarray, target_size) -> np.ndarray:
+    """
+    Same preprocessing DeepFace.represent(detector_backend='skip') applies to a
+    BGR ndarray (deepface==0.0.89): plain resize, then scale to [0, 1].
+    """
+    img = cv2.resize(face_crop, target_size)
+    if img.max() > 1:
+        img = img.astype(np.float32) / 255.0
+    return img.astype(np.float32)
+
+
+def embed_faces(face_crops: List[np.ndarray]) -> List[List[float]]:
+    """
+    Embed every face crop with one batched forward pass of the ArcFace model
+    (through ONNX Runtime when INFERENCE_BACKEND=onnx).
+    Returns one embedding list per crop, in order, matching the per-crop
+    output of DeepFace.represent.
+    """
+    if INFERENCE_BACKEND == "onnx":
+        return embed_faces_onnx(face_crops)
+    return embed_faces_native(face_crops)
+
+
+def embed_faces_native(face_crops: List[np.ndarray]) -> List[List[float]]:
+    if not face_crops:
+        return []
+
+    from deepface import DeepFace  # TensorFlow is only loaded on the native backend
+
+    client = DeepFace.build_model(FACE_MODEL_NAME)  # cached singleton inside DeepFace
+    batch = np.stack([preprocess_face(crop, client.input_shape) for crop in face_crops])
+
+    embeddings = []
+    for start in range(0, len(batch), EMBED_BATCH_SIZE):
+        chunk = batch[start:start + EMBED_BATCH_SIZE]
+        embeddings.extend(client.model(chunk, training=False).numpy().tolist())
+    return embeddings
+
+
+def embed_faces_onnx(face_crops: List[np.ndarray], int8: Optional[bool] = None) -> List[List[float]]:
+    """ArcFace exported by export_onnx.py (NHWC input, same preprocessing as the native path)."""
+    if not face_crops:
+        return []
+
+    session = load_session(onnx_model_path(ARCFACE_ONNX_NAME, ONNX_INT8 if int8 is None else int8))
+    model_input = session.get_inputs()[0]
+    target_size = (model_input.shape[2], model_input.shape[1])  # (width, height) = (112, 112)
+    batch = np.stack([preprocess_face(crop, target_size) for crop in face_crops])
+
+    embeddings = []
+    for start in range(0, len(batch), EMBED_BATCH_SIZE):
+        chunk = batch[start:start + EMBED_BATCH_SIZE]
+        embeddings.extend(session.run(None, {model_input.name: chunk})[0].tolist())
+    return embeddings
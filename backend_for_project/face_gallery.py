@@ -0,0 +1,652 @@
+# face_gallery.py
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from gallery_changes import OP_INSERT, OP_REMOVE_FACE, OP_REMOVE_STUDENT, OP_RENAME_STUDENT, gallery_changes
+from gallery_index import (
+    GALLERY_MODE,
+    IVFIndex,
+    PrototypeIndex,
+    float_rows,
+    l2_normalize,
+    quantize,
+    rank_students,
+    resident_nbytes,
+    stack_rows,
+)
+from gallery_snapshot import GallerySnapshot, open_snapshot, write_snapshot
+from metadata_cache import student_name_cache
+from supabase_client import supabase
+
+EMBEDDING_DIM = 512  # ArcFace output size
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "1000"))
+GALLERY_INDEX_PATH = os.getenv("GALLERY_INDEX_PATH", "data/gallery_ivf.npz")  # IVF lists, reused across restarts
+GALLERY_INDEX_SAVE_DELAY = float(os.getenv("GALLERY_INDEX_SAVE_DELAY", "30"))  # changes folded into one index write
+GALLERY_SNAPSHOT_PATH = os.getenv("GALLERY_SNAPSHOT_PATH", "data/gallery.snapshot")  # "" = always load from the DB
+GALLERY_SYNC_BATCH = int(os.getenv("GALLERY_SYNC_BATCH", "1000"))  # change-log rows applied per poll
+GALLERY_SYNC_GAP_SECONDS = float(os.getenv("GALLERY_SYNC_GAP_SECONDS", "10"))  # wait for a missing seq before skipping it
+GALLERY_LOAD_RETRY_SECONDS = 30  # after a failed on-demand load, callers fall back without retrying for this long
+
+
+def parse_embedding(value) -> np.ndarray:
+    """pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _rows_fingerprint(face_ids) -> str:
+    """Identifies the exact row order a saved index was built for."""
+    return hashlib.sha1("\n".join(str(face_id) for face_id in face_ids).encode()).hexdigest()
+
+
+class GalleryRows(NamedTuple):
+    """Everything a search reads, published together so readers never pair old and new arrays."""
+    matrix: Any  # ndarray or QuantizedMatrix
+    face_ids: np.ndarray
+    student_ids: np.ndarray
+    index: Any  # PrototypeIndex / IVFIndex, or None for exact search
+
+
+def _load_student_name(student_id: str) -> str:
+    resp = supabase.table("students").select("name").eq("id", student_id).limit(1).execute()
+    if resp.data:
+        return resp.data[0].get("name") or "Unknown"
+    return "Unknown"
+
+
+class FaceGallery:
+    """
+    Resident, L2-normalised float32 copy of the `faces` table.
+
+    Matching is a single matrix-vector product against this matrix, so no
+    network hop is needed per face. The arrays and index are replaced
+    copy-on-write as one GalleryRows tuple, which lets `search` run without
+    taking the lock. GALLERY_MODE=prototype
+    or ivf searches through an index from gallery_index instead, and
+    GALLERY_DTYPE=float16/int8 stores the rows quantised (QuantizedMatrix).
+    Startup maps the gallery_snapshot file when it exists, so only the rows
+    changed since it was written are read from the database.
+
+    Float32 rows mapped from a snapshot are shared with every worker that
+    maps the same file. Any change copies them into a private heap array
+    (appending to a read-only mapping is not possible), so after a change
+    each worker holds its own copy until the next snapshot write
+    (save_snapshot, GALLERY_SNAPSHOT_SECONDS after a change in gallery_sync).
+    The write maps the rows again, and workers at the same seq adopt the
+    file that is already there instead of each writing their own.
+    Quantised rows and IVF lists are always private copies.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._rows = GalleryRows(quantize(np.zeros((0, dim), dtype=np.float32)), np.zeros(0, dtype=object),
+                                 np.zeros(0, dtype=object), None)
+        self._student_names: Dict[str, str] = {}
+        self.loaded = False
+        self.version = 0  # bumped on every change so subsets know to rebuild
+        self.mode = GALLERY_MODE
+        self._index_dirty = False  # IVF index changed since it was last written
+        self._index_timer: Optional[threading.Timer] = None
+        self._snapshot: Optional[GallerySnapshot] = None
+        self.seq: Optional[int] = None  # last gallery_changes seq applied; None = no change log
+        self._gap: Optional[Tuple[int, float]] = None  # (first missing seq, monotonic time it was first seen)
+        self._sync_lock = threading.RLock()  # serialises change-log and snapshot syncs
+        self._load_lock = threading.Lock()  # single-flight guard for ensure_loaded
+        self._load_error: Optional[Exception] = None
+        self._load_failed_at = 0.0
+
+    def __len__(self) -> int:
+        return self._rows.matrix.shape[0]
+
+    # Read-only views of the current rows; writers replace self._rows as a whole
+    @property
+    def _matrix(self):
+        return self._rows.matrix
+
+    @property
+    def _face_ids(self) -> np.ndarray:
+        return self._rows.face_ids
+
+    @property
+    def _student_ids(self) -> np.ndarray:
+        return self._rows.student_ids
+
+    @property
+    def _index(self):
+        return self._rows.index
+
+    # ---------- Building ----------
+    def load(self) -> int:
+        """
+        Build the gallery, from the local snapshot when there is one (the DB
+        is then only asked for the changes, in the background), otherwise
+        from the `faces` table. Returns the number of vectors.
+        """
+        try:
+            snapshot = open_snapshot(GALLERY_SNAPSHOT_PATH, self.dim)
+        except Exception as e:
+            print(f"⚠️ Could not open gallery snapshot {GALLERY_SNAPSHOT_PATH}: {e}")
+            snapshot = None
+        if snapshot is None:
+            return self.load_from_database()
+
+        self._install(snapshot.matrix, snapshot.face_ids, snapshot.student_ids, dict(snapshot.student_names))
+        self._snapshot = snapshot
+        self.seq = snapshot.seq
+        age = time.time() - snapshot.stamp
+        print(f"✅ Face gallery mapped from snapshot ({age / 60:.0f} min old), syncing changes in the background")
+        threading.Thread(target=self._refresh_snapshot_rows, daemon=True).start()
+        return len(snapshot.face_ids)
+
+    def ensure_loaded(self) -> None:
+        """
+        Load the gallery if it is not loaded yet, once for all concurrent
+        callers. After a failure the error is re-raised without touching the
+        database for GALLERY_LOAD_RETRY_SECONDS, so callers can fall back.
+        """
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
+            if self._load_error is not None and time.monotonic() - self._load_failed_at < GALLERY_LOAD_RETRY_SECONDS:
+                raise self._load_error
+            try:
+                self.load()
+            except Exception as e:
+                self._load_error, self._load_failed_at = e, time.monotonic()
+                raise
+            self._load_error = None
+
+    def load_from_database(self) -> int:
+        """Read every embedding from the `faces` table and write a fresh snapshot."""
+        stamp = time.time()
+        seq = gallery_changes.latest_seq()  # read first: changes made during the load are applied again
+        rows = self._fetch_faces("id, student_id, embedding")
+        names = self._fetch_student_names()
+
+        rows = [r for r in rows if r.get("student_id") and r.get("embedding") is not None]
+        if rows:
+            matrix = l2_normalize(np.vstack([parse_embedding(r["embedding"]) for r in rows]))
+        else:
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        face_ids = np.array([r.get("id") for r in rows], dtype=object)
+        student_ids = np.array([r["student_id"] for r in rows], dtype=object)
+        self._install(matrix, face_ids, student_ids, names)
+        self.seq = seq
+        self._write_snapshot(matrix, face_ids, student_ids, names, stamp, seq)
+        return len(rows)
+
+    def _install(self, matrix: np.ndarray, face_ids: np.ndarray, student_ids: np.ndarray,
+                 names: Dict[str, str]) -> None:
+        matrix = quantize(matrix)
+        index = self._build_index(matrix, student_ids, face_ids)
+
+        with self._lock:
+            self._rows = GalleryRows(matrix, face_ids, student_ids, index)
+            self._student_names = names
+            self.loaded = True
+            self.version += 1
+
+        usage = self.memory_usage()
+        print(f"✅ Face gallery loaded: {len(face_ids)} embeddings for {len(set(student_ids))} students "
+              f"({usage['dtype']}, {(usage['matrix_bytes'] + usage['index_bytes']) / 1e6:.1f} MB)")
+
+    def _fetch_faces(self, columns: str) -> List[Dict[str, Any]]:
+        rows = []
+        start = 0
+        while True:
+            resp = (
+                supabase.table("faces")
+                .select(columns)
+                .range(start, start + GALLERY_PAGE_SIZE - 1)
+                .execute()
+            )
+            page = resp.data or []
+            rows.extend(page)
+            if len(page) < GALLERY_PAGE_SIZE:
+                break
+            start += GALLERY_PAGE_SIZE
+        return rows
+
+    def _fetch_faces_by_id(self, face_ids: List[Any]) -> List[Dict[str, Any]]:
+        rows = []
+        for start in range(0, len(face_ids), GALLERY_PAGE_SIZE):
+            chunk = face_ids[start:start + GALLERY_PAGE_SIZE]
+            resp = supabase.table("faces").select("id, student_id, embedding").in_("id", chunk).execute()
+            rows.extend(r for r in (resp.data or []) if r.get("student_id") and r.get("embedding") is not None)
+        return rows
+
+    def _fetch_student_names(self) -> Dict[str, str]:
+        students_resp = supabase.table("students").select("id, name").execute()
+        return {s["id"]: s.get("name") or "Unknown" for s in (students_resp.data or [])}
+
+    def _add_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Append `faces` rows not already in the gallery, grouped per student."""
+        live = set(self._face_ids)
+        by_student: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            if r["id"] not in live:
+                by_student.setdefault(r["student_id"], []).append(r)
+        for student_id, student_rows in by_student.items():
+            self.add_faces(student_id, [r["embedding"] for r in student_rows], [r["id"] for r in student_rows])
+        return sum(len(student_rows) for student_rows in by_student.values())
+
+    # ---------- Change log (other replicas) ----------
+    def apply_changes(self, changes: List[Dict[str, Any]]) -> int:
+        """
+        Apply gallery_changes rows in seq order: inserted faces are fetched by
+        id, removed faces and students dropped, renamed students' names read
+        again. Idempotent, so this replica's own changes are skipped.
+        Returns the number of gallery rows changed.
+        """
+        if not changes:
+            return 0
+        changed = 0
+        with self._sync_lock:
+            inserted: List[Any] = []
+            removed: List[Any] = []  # face ids are never reused, so these can wait for the end
+            for change in changes:
+                if change["op"] == OP_INSERT:
+                    inserted.append(change["face_id"])
+                elif change["op"] == OP_REMOVE_FACE:
+                    removed.append(change["face_id"])
+                elif change["op"] == OP_REMOVE_STUDENT:
+                    # Keep the log order: faces inserted before the removal go first
+                    changed += self._add_rows(self._fetch_faces_by_id(inserted))
+                    inserted = []
+                    changed += self.remove_student(change["student_id"])
+                elif change["op"] == OP_RENAME_STUDENT:
+                    self._reload_student_name(change["student_id"])
+            changed += self._add_rows(self._fetch_faces_by_id(inserted))
+            changed += self.remove_faces(removed)
+            self.seq = changes[-1]["seq"]
+        return changed
+
+    def _reload_student_name(self, student_id: str) -> None:
+        if student_id in self._student_names:
+            student_name_cache.invalidate(student_id)
+            self.set_student_name(student_id, self._fetch_student_name(student_id))
+
+    def resume_change_log(self) -> bool:
+        """
+        For a gallery loaded while the change log was unavailable (seq is
+        None): once the log answers, reload from the database so changes
+        made in the meantime are not missed. Returns whether it reloaded.
+        """
+        with self._sync_lock:
+            if self.seq is not None or gallery_changes.latest_seq() is None:
+                return False
+            print("🔄 Gallery change log is reachable again, reloading the gallery")
+            self.load_from_database()
+            return True
+
+    def _contiguous(self, changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        The changes before the first gap in seq. Log rows from concurrent
+        registrations can commit out of seq order, so a poll may see N+1
+        before N. A missing seq is waited for GALLERY_SYNC_GAP_SECONDS and
+        then skipped as rolled back.
+        """
+        expected = self.seq + 1
+        for i, change in enumerate(changes):
+            if change["seq"] != expected:
+                now = time.monotonic()
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, now)
+                if now - self._gap[1] < GALLERY_SYNC_GAP_SECONDS:
+                    return changes[:i]
+                print(f"⚠️ Gallery changes {expected}-{change['seq'] - 1} never appeared, skipping them")
+                self._gap = None
+            expected = change["seq"] + 1
+        return changes
+
+    def poll_changes(self, limit: int = GALLERY_SYNC_BATCH) -> int:
+        """Apply up to `limit` changes after self.seq, stopping at a gap. Returns how many were applied."""
+        with self._sync_lock:
+            if self.seq is None:
+                return 0
+            changes = self._contiguous(gallery_changes.since(self.seq, limit))
+            changed = self.apply_changes(changes)
+        if changed:
+            print(f"✅ Gallery synced to change {self.seq}: {changed} rows changed")
+        return len(changes)
+
+    def catch_up(self) -> None:
+        """Apply every pending change."""
+        while self.poll_changes() >= GALLERY_SYNC_BATCH:
+            pass
+
+    # ---------- Snapshot ----------
+    def _refresh_snapshot_rows(self) -> None:
+        """After mapping a snapshot: replay the change log since it, else diff face ids."""
+        if self.seq is not None:
+            try:
+                self.catch_up()
+                return
+            except Exception as e:
+                print(f"⚠️ Gallery change log unavailable ({e}), diffing face ids instead")
+        self.sync_with_database()
+
+    def sync_with_database(self) -> int:
+        """
+        Bring a snapshot-loaded gallery up to date without a change log: list
+        the face ids in the DB, fetch embeddings only for rows the snapshot
+        lacks, drop rows that were deleted, and rewrite the snapshot if
+        anything changed. Returns the number of rows added or removed.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0
+        try:
+            stamp = time.time()
+            seq = gallery_changes.latest_seq()
+            listed = [r for r in self._fetch_faces("id, student_id") if r.get("student_id")]
+            names = self._fetch_student_names()
+            known = set(snapshot.face_ids)
+            listed_ids = {r["id"] for r in listed}
+            removed_ids = known - listed_ids
+            added = self._fetch_faces_by_id([r["id"] for r in listed if r["id"] not in known])
+        except Exception as e:
+            print(f"⚠️ Gallery snapshot sync failed, serving the snapshot as is: {e}")
+            return 0
+
+        with self._sync_lock:
+            with self._lock:
+                self._student_names.update(names)
+            self.remove_faces(removed_ids)
+            self._add_rows(added)  # skips rows registered through this process while syncing
+            self.seq = seq
+        # Faces deleted directly in the database: log them for replicas that only follow the log
+        gallery_changes.record_faces_removed(removed_ids)
+
+        if added or removed_ids:
+            keep = np.fromiter((fid not in removed_ids for fid in snapshot.face_ids), dtype=bool,
+                               count=len(snapshot.face_ids))
+            new_rows = (l2_normalize(np.vstack([parse_embedding(r["embedding"]) for r in added]))
+                        if added else np.zeros((0, self.dim), dtype=np.float32))
+            self._write_snapshot(
+                np.vstack([snapshot.matrix[keep], new_rows]),
+                np.concatenate([snapshot.face_ids[keep], np.array([r["id"] for r in added], dtype=object)]),
+                np.concatenate([snapshot.student_ids[keep], np.array([r["student_id"] for r in added], dtype=object)]),
+                names,
+                stamp,
+                seq,
+            )
+        print(f"✅ Gallery snapshot synced: +{len(added)} / -{len(removed_ids)} rows")
+        return len(added) + len(removed_ids)
+
+    def save_snapshot(self) -> bool:
+        """
+        Rewrite the snapshot from the live gallery so the next start replays
+        fewer changes, and serve the rows from it again (see the class
+        docstring). A snapshot another worker already wrote for the same
+        rows is mapped instead of rewritten. Needs the float32 rows (not kept
+        for quantised storage without GALLERY_RERANK). Returns whether the
+        snapshot on disk now holds the live rows.
+        """
+        with self._sync_lock:
+            (matrix, face_ids, student_ids, _), seq = self._rows, self.seq
+        try:
+            current = open_snapshot(GALLERY_SNAPSHOT_PATH, self.dim)
+        except Exception:
+            current = None
+        if current is not None and current.seq == seq and self._map_rows(current):
+            self._snapshot = current
+            return True
+        rows = float_rows(matrix)
+        if rows is None or any(face_id is None for face_id in face_ids):
+            return False
+        self._write_snapshot(rows, face_ids, student_ids, dict(self._student_names), time.time(), seq)
+        return True
+
+    def _write_snapshot(self, matrix: np.ndarray, face_ids: np.ndarray, student_ids: np.ndarray,
+                        names: Dict[str, str], stamp: float, seq: Optional[int]) -> None:
+        if not GALLERY_SNAPSHOT_PATH:
+            return
+        try:
+            write_snapshot(GALLERY_SNAPSHOT_PATH, matrix, face_ids, student_ids, names, stamp, seq)
+        except Exception as e:
+            print(f"⚠️ Could not write gallery snapshot {GALLERY_SNAPSHOT_PATH}: {e}")
+            return
+        # Map the file just written so later syncs diff against it (and, if unchanged since, search it)
+        self._snapshot = open_snapshot(GALLERY_SNAPSHOT_PATH, self.dim)
+        if self._snapshot is not None:
+            self._map_rows(self._snapshot)
+
+    def _map_rows(self, snapshot: GallerySnapshot) -> bool:
+        """
+        Replace private float32 rows by the snapshot's mapped ones when it
+        holds exactly the live rows (same face ids in the same order; a face
+        id's embedding never changes). Returns whether the rows are mapped.
+        """
+        rows = self._rows
+        if not isinstance(rows.matrix, np.ndarray) or len(snapshot.face_ids) == 0:
+            return False  # quantised storage keeps its own codes
+        if any(face_id is None for face_id in rows.face_ids) or not np.array_equal(rows.face_ids, snapshot.face_ids):
+            return False
+        index = rows.index
+        if isinstance(index, PrototypeIndex):
+            index = index.updated(snapshot.matrix, rows.student_ids)  # re-ranks against the mapped rows
+        with self._lock:
+            if self._rows is not rows:
+                return False  # changed meanwhile; the next snapshot write maps it
+            self._rows = rows._replace(matrix=snapshot.matrix, index=index)
+        return True
+
+    # ---------- Incremental updates ----------
+    def add_faces(self, student_id: str, embeddings: Iterable, face_ids: Optional[List[Any]] = None) -> None:
+        """Append freshly registered embeddings for one student."""
+        embeddings = [parse_embedding(e) for e in embeddings]
+        if not embeddings:
+            return
+        if face_ids is None:
+            face_ids = [None] * len(embeddings)
+
+        new_rows = quantize(l2_normalize(np.vstack(embeddings)))
+        # Fetched off the lock, stored under it before the rows are published, so a search that
+        # sees the new rows also sees the name
+        name = self._fetch_student_name(student_id) if student_id not in self._student_names else None
+
+        with self._lock:
+            if name is not None:
+                self._student_names.setdefault(student_id, name)  # a concurrent rename wins
+            rows = self._rows
+            self._publish(
+                stack_rows(rows.matrix, new_rows),
+                np.concatenate([rows.face_ids, np.array(face_ids, dtype=object)]),
+                np.concatenate([rows.student_ids, np.array([student_id] * len(embeddings), dtype=object)]),
+                [student_id],
+            )
+
+    def remove_faces(self, face_ids: Iterable[Any]) -> int:
+        """Drop rows by face id (faces deleted in the DB). Returns the number removed."""
+        face_ids = set(face_ids)
+        if not face_ids:
+            return 0
+        with self._lock:
+            rows = self._rows
+            drop = np.fromiter((fid in face_ids for fid in rows.face_ids), dtype=bool, count=len(rows.face_ids))
+            removed = int(drop.sum())
+            if removed:
+                keep = ~drop
+                self._publish(rows.matrix[keep], rows.face_ids[keep], rows.student_ids[keep],
+                              list(set(rows.student_ids[drop])))
+        return removed
+
+    def remove_student(self, student_id: str) -> int:
+        """Drop every embedding of a student. Returns the number of rows removed."""
+        with self._lock:
+            rows = self._rows
+            keep = rows.student_ids != student_id
+            removed = int((~keep).sum())
+            if removed:
+                self._publish(rows.matrix[keep], rows.face_ids[keep], rows.student_ids[keep], [student_id])
+            self._student_names.pop(student_id, None)
+        return removed
+
+    # ---------- Search index ----------
+    def _build_index(self, matrix: np.ndarray, student_ids: np.ndarray, face_ids: np.ndarray):
+        if self.mode == "prototype":
+            return PrototypeIndex(matrix, student_ids)
+        if self.mode != "ivf" or matrix.shape[0] == 0:
+            return None
+
+        fingerprint = _rows_fingerprint(face_ids)
+        try:
+            index = IVFIndex.restore(GALLERY_INDEX_PATH, matrix, student_ids, fingerprint)
+        except Exception as e:
+            print(f"⚠️ Could not read gallery index {GALLERY_INDEX_PATH}: {e}")
+            index = None
+        if index is None:
+            index = IVFIndex(matrix, student_ids)
+        print(f"✅ IVF index: {len(index.centroids)} lists, nprobe={index.nprobe}")
+        self._save_index(index, face_ids)
+        return index
+
+    def _save_index(self, index, face_ids: np.ndarray) -> None:
+        if not isinstance(index, IVFIndex) or not GALLERY_INDEX_PATH:
+            return
+        try:
+            index.save(GALLERY_INDEX_PATH, _rows_fingerprint(face_ids))
+        except Exception as e:
+            print(f"⚠️ Could not save gallery index {GALLERY_INDEX_PATH}: {e}")
+
+    def _publish(self, matrix, face_ids: np.ndarray, student_ids: np.ndarray, changed: List[str]) -> None:
+        """
+        Install new rows with the index updated for the changed students'
+        rows. Call with the lock held; writing the IVF file (and retraining)
+        is left to maintain_index.
+        """
+        index = self._index
+        if index is not None:
+            index = index.updated(matrix, student_ids, changed)
+            if isinstance(index, IVFIndex):
+                self._index_dirty = True
+                self._schedule_index_maintenance()
+        else:
+            index = self._build_index(matrix, student_ids, face_ids)
+        self._rows = GalleryRows(matrix, face_ids, student_ids, index)
+        self.version += 1
+
+    def _schedule_index_maintenance(self) -> None:
+        """Run maintain_index GALLERY_INDEX_SAVE_DELAY after the first unsaved change. Call with the lock held."""
+        if self._index_timer is None:
+            self._index_timer = threading.Timer(GALLERY_INDEX_SAVE_DELAY, self.maintain_index)
+            self._index_timer.daemon = True
+            self._index_timer.start()
+
+    def maintain_index(self, retrain: bool = True) -> None:
+        """
+        Retrain an IVF index the gallery has outgrown and write pending index
+        changes to GALLERY_INDEX_PATH, both without holding the gallery lock.
+        """
+        with self._lock:
+            if self._index_timer is not None:
+                self._index_timer.cancel()
+                self._index_timer = None
+            matrix, face_ids, student_ids, index = self._rows
+            version, dirty = self.version, self._index_dirty
+            self._index_dirty = False
+        if not isinstance(index, IVFIndex):
+            return
+
+        if retrain and index.needs_retrain(len(matrix)):
+            print(f"🔄 Gallery grew from {index.trained_rows} to {len(matrix)} vectors, retraining the IVF index")
+            retrained = IVFIndex(matrix, student_ids)
+            with self._lock:
+                if self.version != version:  # rows changed while training; try again later
+                    self._index_dirty = True
+                    self._schedule_index_maintenance()
+                    return
+                self._rows = self._rows._replace(index=retrained)
+                index = retrained
+            print(f"✅ IVF index: {len(index.centroids)} lists, nprobe={index.nprobe}")
+            dirty = True
+        if dirty:
+            self._save_index(index, face_ids)
+
+    def set_student_name(self, student_id: str, name: str) -> None:
+        """Kept even before the student has faces, so a rename racing add_faces is not lost."""
+        with self._lock:
+            self._student_names[student_id] = name
+
+    def _fetch_student_name(self, student_id: str) -> str:
+        try:
+            return student_name_cache.get_or_load(student_id, _load_student_name)
+        except Exception as e:
+            print(f"Warn: could not fetch name for student {student_id}: {e}")
+        return "Unknown"
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Bytes held by the gallery rows and the search index."""
+        matrix, _, _, index = self._rows
+        return {
+            "mode": self.mode,
+            "dtype": str(matrix.dtype),
+            "vectors": len(matrix),
+            "scanned_bytes": matrix.nbytes,
+            "matrix_bytes": resident_nbytes(matrix),
+            "index_bytes": index.nbytes if index is not None else 0,
+        }
+
+    # ---------- Matching ----------
+    def search(self, query, threshold: float, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Top-k students over the whole gallery (see rank_students)."""
+        matrix, _, student_ids, index = self._rows  # one read: matrix, ids and index always belong together
+        if index is not None:
+            names = self._student_names
+            return [
+                {"student_id": student_id, "student_name": names.get(student_id, "Unknown"), "similarity": similarity}
+                for student_id, similarity in index.search(query, threshold, top_k)
+            ]
+        return rank_students(matrix, student_ids, self._student_names, query, threshold, top_k)
+
+    def snapshot(self):
+        """(matrix, student_ids, version) taken together, for building subsets."""
+        with self._lock:
+            return self._rows.matrix, self._rows.student_ids, self.version
+
+    def subset(self, student_ids: Iterable[str]) -> "GallerySubset":
+        return GallerySubset(self, student_ids)
+
+
+class GallerySubset:
+    """
+    The gallery rows of a fixed set of students (a subject roster), kept as
+    their own contiguous matrix and rebuilt when the gallery changes.
+    """
+
+    def __init__(self, gallery: FaceGallery, student_ids: Iterable[str]):
+        self.gallery = gallery
+        self.student_ids = frozenset(student_ids)
+        self._rows = (np.zeros((0, gallery.dim), dtype=np.float32), np.zeros(0, dtype=object), None)
+        self.refresh()
+
+    def __len__(self) -> int:
+        return self._rows[0].shape[0]
+
+    def refresh(self):
+        """Current (matrix, student_ids, version) of the subset, rebuilt if the gallery changed."""
+        rows = self._rows
+        if self.gallery.version == rows[2]:
+            return rows
+        matrix, student_ids, version = self.gallery.snapshot()
+        mask = np.fromiter((sid in self.student_ids for sid in student_ids), dtype=bool, count=len(student_ids))
+        rows = (matrix[mask], student_ids[mask], version)  # boolean indexing copies into a contiguous block
+        self._rows = rows  # swapped as one tuple so concurrent searches see a consistent pair
+        return rows
+
+    def search(self, query, threshold: float, top_k: int = 5) -> List[Dict[str, Any]]:
+        matrix, student_ids, _ = self.refresh()
+        return rank_students(matrix, student_ids, self.gallery._student_names, query, threshold, top_k)
+
+
+face_gallery = FaceGallery()
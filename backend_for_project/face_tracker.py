@@ -0,0 +1,107 @@
+# face_tracker.py
+"""
+Cross-frame face tracking for a camera session.
+
+A seated student shows up at nearly the same box in every frame, so once a
+face has been recognised its identity, liveness and confidence are carried
+forward by IoU association on the detector boxes. Full recognition only runs
+again for new faces or after TRACK_REFRESH_SECONDS.
+"""
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_REFRESH_SECONDS = float(os.getenv("TRACK_REFRESH_SECONDS", "5"))
+TRACK_MAX_AGE_SECONDS = float(os.getenv("TRACK_MAX_AGE_SECONDS", "2"))  # drop tracks not seen for this long
+
+
+def iou(a: Sequence[int], b: Sequence[int]) -> float:
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def associate(boxes: List[Sequence[int]], track_boxes: List[Sequence[int]],
+              iou_threshold: float = TRACK_IOU_THRESHOLD) -> Dict[int, int]:
+    """Greedy one-to-one matching, highest IoU first. Returns {box index: track index}."""
+    pairs = []
+    for i, box in enumerate(boxes):
+        for j, track_box in enumerate(track_boxes):
+            overlap = iou(box, track_box)
+            if overlap >= iou_threshold:
+                pairs.append((overlap, i, j))
+    pairs.sort(reverse=True)
+
+    matched: Dict[int, int] = {}
+    used_tracks = set()
+    for _, i, j in pairs:
+        if i in matched or j in used_tracks:
+            continue
+        matched[i] = j
+        used_tracks.add(j)
+    return matched
+
+
+class Track:
+    def __init__(self, track_id: int, box, result: dict, now: float):
+        self.track_id = track_id
+        self.box = tuple(box)
+        self.result = result  # last full recognition result for this face
+        self.recognized_at = now
+        self.last_seen = now
+
+
+class FaceTracker:
+    def __init__(self, refresh_seconds: float = TRACK_REFRESH_SECONDS,
+                 max_age_seconds: float = TRACK_MAX_AGE_SECONDS,
+                 iou_threshold: float = TRACK_IOU_THRESHOLD):
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.iou_threshold = iou_threshold
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self.recognized = 0  # faces that went through full recognition
+        self.carried = 0     # faces answered from a track
+
+    def _prune(self, now: float) -> None:
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age_seconds]
+
+    def fresh_tracks(self, now: Optional[float] = None) -> List[Track]:
+        """Live tracks whose recognition is recent enough to reuse this frame."""
+        now = time.monotonic() if now is None else now
+        self._prune(now)
+        return [t for t in self.tracks if now - t.recognized_at < self.refresh_seconds]
+
+    def carry_forward(self, track: Track, box, now: Optional[float] = None) -> dict:
+        """Result for a face associated with a fresh track, at its new position."""
+        now = time.monotonic() if now is None else now
+        track.box = tuple(box)
+        track.last_seen = now
+        self.carried += 1
+        x, y, w, h = box
+        return {**track.result, "x": x, "y": y, "w": w, "h": h, "track_id": track.track_id, "tracked": True}
+
+    def observe(self, result: dict, now: Optional[float] = None) -> dict:
+        """Record a full recognition result, refreshing the overlapping track or starting a new one."""
+        now = time.monotonic() if now is None else now
+        box = (result["x"], result["y"], result["w"], result["h"])
+        matched = associate([box], [t.box for t in self.tracks], self.iou_threshold)
+
+        if 0 in matched:
+            track = self.tracks[matched[0]]
+            track.box, track.result, track.recognized_at, track.last_seen = box, result, now, now
+        else:
+            track = Track(self._next_id, box, result, now)
+            self._next_id += 1
+            self.tracks.append(track)
+
+        self.recognized += 1
+        result["track_id"] = track.track_id
+        return result
@@ -0,0 +1,61 @@
+# frame_gate.py
+"""
+Change gate for camera sessions.
+
+Browsers keep posting frames of an unchanged scene (an empty room, a class
+sitting still). Each JPEG is first decoded at 1/8 scale in grayscale, shrunk
+to a FRAME_GATE_SIZE thumbnail and compared with the thumbnail of the last
+frame that was actually processed. If the mean absolute difference is below
+FRAME_GATE_THRESHOLD grey levels the frame is skipped and the session's
+previous result is returned, without a full decode or any detection.
+At least one frame every FRAME_GATE_MAX_SKIP_SECONDS is processed anyway.
+"""
+import os
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+FRAME_GATE = os.getenv("FRAME_GATE", "true").lower() == "true"
+FRAME_GATE_THRESHOLD = float(os.getenv("FRAME_GATE_THRESHOLD", "2.0"))  # mean |diff| in grey levels (0-255)
+FRAME_GATE_MAX_SKIP_SECONDS = float(os.getenv("FRAME_GATE_MAX_SKIP_SECONDS", "3"))
+FRAME_GATE_SIZE = (64, 48)
+
+
+def frame_thumbnail(data: bytes) -> Optional[np.ndarray]:
+    """Small blurred grayscale thumbnail of an encoded frame, or None if it does not decode."""
+    small = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    thumb = cv2.resize(small, FRAME_GATE_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(thumb, (3, 3), 0)  # sensor noise should not count as change
+
+
+class FrameGate:
+    def __init__(self, threshold: float = FRAME_GATE_THRESHOLD,
+                 max_skip_seconds: float = FRAME_GATE_MAX_SKIP_SECONDS):
+        self.threshold = threshold
+        self.max_skip_seconds = max_skip_seconds
+        self._last: Optional[np.ndarray] = None
+        self._last_processed = 0.0
+        self.checked = 0
+        self.skipped = 0
+
+    def unchanged(self, thumb: Optional[np.ndarray], now: Optional[float] = None) -> bool:
+        """True if `thumb` is close enough to the last processed frame to skip this one."""
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        if thumb is None or self._last is None or now - self._last_processed >= self.max_skip_seconds:
+            return False
+        if float(cv2.absdiff(thumb, self._last).mean()) >= self.threshold:
+            return False
+        self.skipped += 1
+        return True
+
+    def processed(self, thumb: Optional[np.ndarray], now: Optional[float] = None) -> None:
+        self._last = thumb
+        self._last_processed = time.monotonic() if now is None else now
+
+    def stats(self) -> dict:
+        return {"checked": self.checked, "skipped": self.skipped}
@@ -0,0 +1,85 @@
+# gallery_changes.py
+"""
+Change log of the face gallery, shared by every API replica.
+
+Each face registration appends one `insert` row per face, each student
+deletion one `remove_student` row, each rename one `rename_student` row and
+each face deleted on its own one `remove_face` row to GALLERY_CHANGES_TABLE:
+
+    seq bigserial primary key, op text, face_id, student_id, created_at
+
+`seq` only grows, so a replica that has applied everything up to some seq
+asks for `seq > last` and applies the rows in order (gallery_sync). Rows
+can become visible out of seq order, so replicas stop at a gap until it is
+filled or times out (FaceGallery._contiguous). The API writes each change
+to `faces`/`students` before its log row, so a full load that reads
+latest_seq() first already contains every change up to it. Rows
+carry ids only; inserted embeddings are read from `faces` by id. A database
+trigger on `faces` could write the same rows instead of the API.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from supabase_client import supabase
+
+GALLERY_CHANGES_TABLE = os.getenv("GALLERY_CHANGES_TABLE", "face_changes")
+
+OP_INSERT = "insert"
+OP_REMOVE_STUDENT = "remove_student"
+OP_REMOVE_FACE = "remove_face"
+OP_RENAME_STUDENT = "rename_student"  # the new name is read from `students`
+
+
+class GalleryChangeLog:
+    def __init__(self, table: str = GALLERY_CHANGES_TABLE):
+        self.table = table
+
+    def _append(self, rows: List[Dict[str, Any]]) -> None:
+        # Registration already succeeded; a missing log only delays other replicas
+        # until their next full load, so it must not fail the request
+        try:
+            supabase.table(self.table).insert(rows).execute()
+        except Exception as e:
+            print(f"⚠️ Could not record gallery change in {self.table}: {e}")
+
+    def record_inserts(self, student_id: str, face_ids: Iterable[Any]) -> None:
+        rows = [{"op": OP_INSERT, "face_id": face_id, "student_id": student_id}
+                for face_id in face_ids if face_id is not None]
+        if rows:
+            self._append(rows)
+
+    def record_student_removed(self, student_id: str) -> None:
+        self._append([{"op": OP_REMOVE_STUDENT, "face_id": None, "student_id": student_id}])
+
+    def record_faces_removed(self, face_ids: Iterable[Any]) -> None:
+        rows = [{"op": OP_REMOVE_FACE, "face_id": face_id, "student_id": None}
+                for face_id in face_ids if face_id is not None]
+        if rows:
+            self._append(rows)
+
+    def record_student_renamed(self, student_id: str) -> None:
+        self._append([{"op": OP_RENAME_STUDENT, "face_id": None, "student_id": student_id}])
+
+    def since(self, seq: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Changes with seq > `seq`, oldest first."""
+        resp = (
+            supabase.table(self.table)
+            .select("seq, op, face_id, student_id")
+            .gt("seq", seq)
+            .order("seq")
+            .limit(limit)
+            .execute()
+        )
+        return resp.data or []
+
+    def latest_seq(self) -> Optional[int]:
+        """Highest seq in the log (0 when empty), or None if the log is unavailable."""
+        try:
+            resp = supabase.table(self.table).select("seq").order("seq", desc=True).limit(1).execute()
+        except Exception as e:
+            print(f"⚠️ Gallery change log {self.table} unavailable: {e}")
+            return None
+        return resp.data[0]["seq"] if resp.data else 0
+
+
+gallery_changes = GalleryChangeLog()
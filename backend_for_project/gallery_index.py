@@ -0,0 +1,495 @@
+# gallery_index.py
+"""
+Search structures over the L2-normalised gallery matrix (NumPy only, no
+database access). FaceGallery owns the rows; these build on top of them.
+
+- QuantizedMatrix: float16 / int8 storage for the gallery rows
+- rank_students: exact top-k over a matrix
+- PrototypeIndex: one or a few prototype vectors per student, searched
+  first, with the top candidates re-ranked against their raw samples
+- IVFIndex: approximate search (inverted lists over k-means centroids)
+  for galleries of tens of thousands of vectors
+
+Indexes share one interface: search(query, threshold, top_k) returns
+[(student_id, similarity)], and updated(matrix, student_ids, changed)
+returns a new index after the rows of `changed` students were added or
+removed, so FaceGallery can swap them copy-on-write.
+"""
+import os
+import tempfile
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+GALLERY_MODE = os.getenv("GALLERY_MODE", "exact").lower()  # exact | prototype | ivf
+GALLERY_PROTOTYPES = int(os.getenv("GALLERY_PROTOTYPES", "1"))  # 1 = normalised mean, >1 = k-medoids
+PROTOTYPE_RERANK = os.getenv("PROTOTYPE_RERANK", "true").lower() == "true"
+PROTOTYPE_CANDIDATES = int(os.getenv("PROTOTYPE_CANDIDATES", "10"))  # prototypes re-ranked per query
+
+KMEDOIDS_ITERATIONS = 10
+
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # inverted lists; 0 = 4 * sqrt(gallery size)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))  # lists scanned per query
+IVF_EXACT_FALLBACK = os.getenv("IVF_EXACT_FALLBACK", "true").lower() == "true"  # scan everything when the probe finds no match
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "2.0"))  # retrain once the gallery is this many times the trained size
+IVF_TRAIN_ITERATIONS = 8
+IVF_FILE_FORMAT = 2  # 2 = lists per student; older index files are retrained
+IVF_TRAIN_POINTS_PER_LIST = 64
+
+GALLERY_DTYPE = os.getenv("GALLERY_DTYPE", "float32").lower()  # float32 | float16 | int8
+GALLERY_RERANK = int(os.getenv("GALLERY_RERANK", "0"))  # top rows re-scored in float32; 0 = float32 rows not kept
+SCORE_BLOCK_ROWS = 512  # quantised rows upcast at a time; the float32 block (1 MB) stays in L2 cache
+
+
+def l2_normalize(mat: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalisation (works for a single vector too)."""
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class QuantizedMatrix:
+    """
+    Gallery rows stored as float16, or as int8 codes with one float32 scale
+    per row (row ~= codes * scale). Provides what the search code uses from
+    an ndarray: shape, row indexing, `@` against float32 vectors/matrices
+    (upcast block by block) and np.asarray (dequantised).
+
+    int8 scans a quarter of the bytes and scores faster than float32.
+    float16 only halves memory: NumPy has no fast float16 -> float32
+    conversion, so scoring it is several times slower than float32.
+
+    With rerank > 0 the float32 rows are kept as well and `scores` re-scores
+    the `rerank` best rows exactly; otherwise only the codes are resident.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None,
+                 exact: Optional[np.ndarray] = None, rerank: int = 0):
+        self.codes = codes
+        self.scales = scales
+        self.exact = exact
+        self.rerank = rerank if exact is not None else 0
+
+    @classmethod
+    def from_float(cls, matrix: np.ndarray, dtype: str, rerank: int = 0) -> "QuantizedMatrix":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        exact = matrix if rerank > 0 else None
+        if dtype == "float16":
+            return cls(matrix.astype(np.float16), None, exact, rerank)
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(matrix / scales[:, None]).astype(np.int8)
+        return cls(codes, scales.astype(np.float32), exact, rerank)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.codes.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.codes.dtype
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes scanned per query (codes and scales)."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def resident_nbytes(self) -> int:
+        return self.nbytes + (self.exact.nbytes if self.exact is not None else 0)
+
+    def __getitem__(self, idx) -> "QuantizedMatrix":
+        return QuantizedMatrix(
+            self.codes[idx],
+            self.scales[idx] if self.scales is not None else None,
+            self.exact[idx] if self.exact is not None else None,
+            self.rerank,
+        )
+
+    def __matmul__(self, other) -> np.ndarray:
+        other = np.asarray(other, dtype=np.float32)
+        out = np.empty((len(self),) + other.shape[1:], dtype=np.float32)
+        # Upcast into one reused, cache-sized buffer and let BLAS write straight into `out`
+        block = np.empty((min(SCORE_BLOCK_ROWS, len(self)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            codes = self.codes[start:start + SCORE_BLOCK_ROWS]
+            rows = block[:len(codes)]
+            np.copyto(rows, codes, casting="unsafe")
+            np.dot(rows, other, out=out[start:start + len(codes)])
+        if self.scales is not None:
+            out *= self.scales if other.ndim == 1 else self.scales[:, None]
+        return out
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        out = self.codes.astype(np.float32)
+        if self.scales is not None:
+            out *= self.scales[:, None]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Similarities to a normalised query, the best `rerank` rows re-scored in float32."""
+        scores = self @ query
+        if self.rerank and len(scores):
+            count = min(self.rerank, len(scores))
+            top = np.argpartition(-scores, count - 1)[:count]
+            scores[top] = self.exact[top] @ query
+        return scores
+
+
+def quantize(matrix: np.ndarray, dtype: str = GALLERY_DTYPE, rerank: int = GALLERY_RERANK):
+    """Normalised rows in the gallery storage dtype (float32 stays a plain ndarray)."""
+    if dtype == "float32":
+        return np.asarray(matrix, dtype=np.float32)
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"Unsupported GALLERY_DTYPE: {dtype}")
+    return QuantizedMatrix.from_float(matrix, dtype, rerank)
+
+
+def stack_rows(top, bottom):
+    """Rows of `bottom` appended to `top` (both in the same storage)."""
+    if not isinstance(top, QuantizedMatrix):
+        return np.vstack([top, bottom])
+    return QuantizedMatrix(
+        np.vstack([top.codes, bottom.codes]),
+        np.concatenate([top.scales, bottom.scales]) if top.scales is not None else None,
+        np.vstack([top.exact, bottom.exact]) if top.exact is not None else None,
+        top.rerank,
+    )
+
+
+def score_rows(matrix, query: np.ndarray) -> np.ndarray:
+    """Similarity of every row to a normalised query."""
+    if isinstance(matrix, QuantizedMatrix):
+        return matrix.scores(query)
+    return matrix @ query
+
+
+def float_rows(matrix) -> Optional[np.ndarray]:
+    """The exact float32 rows of a gallery matrix, or None if only quantised codes are kept."""
+    if isinstance(matrix, QuantizedMatrix):
+        return matrix.exact
+    return matrix
+
+
+def resident_nbytes(matrix) -> int:
+    """Memory held by a gallery matrix, including kept float32 rows."""
+    return getattr(matrix, "resident_nbytes", matrix.nbytes)
+
+
+def rank_students(matrix: np.ndarray, student_ids: np.ndarray, names: Dict[str, str],
+                  query, threshold: float, top_k: int) -> List[Dict[str, Any]]:
+    """
+    Up to `top_k` students whose best cosine similarity is >= threshold,
+    in the same shape as the `match_face` RPC rows.
+    """
+    if matrix.shape[0] == 0:
+        return []
+
+    scores = score_rows(matrix, l2_normalize(query))
+    candidates = np.flatnonzero(scores >= threshold)
+    if candidates.size == 0:
+        return []
+    candidates = candidates[np.argsort(-scores[candidates])]
+
+    matches = []
+    seen = set()
+    for idx in candidates:
+        student_id = student_ids[idx]
+        if student_id in seen:
+            continue
+        seen.add(student_id)
+        matches.append({
+            "student_id": student_id,
+            "student_name": names.get(student_id, "Unknown"),
+            "similarity": float(scores[idx]),
+        })
+        if len(matches) >= top_k:
+            break
+    return matches
+
+
+def group_rows(student_ids: np.ndarray) -> Dict[Hashable, np.ndarray]:
+    """{student_id: indices of that student's rows}."""
+    rows: Dict[Hashable, List[int]] = {}
+    for idx, student_id in enumerate(student_ids):
+        rows.setdefault(student_id, []).append(idx)
+    return {student_id: np.array(idx, dtype=np.int64) for student_id, idx in rows.items()}
+
+
+def student_prototypes(samples: np.ndarray, k: int = 1) -> np.ndarray:
+    """
+    Prototype vectors for one student's normalised samples: the normalised
+    mean for k=1, otherwise k medoids (cosine similarity, PAM-style swaps).
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if k <= 1:
+        return l2_normalize(samples.mean(axis=0, keepdims=True))
+    if len(samples) <= k:
+        return samples.copy()
+
+    sim = samples @ samples.T
+    # Most central sample first, then farthest-first for the rest
+    medoids = [int(sim.sum(axis=1).argmax())]
+    while len(medoids) < k:
+        medoids.append(int(sim[:, medoids].max(axis=1).argmin()))
+
+    for _ in range(KMEDOIDS_ITERATIONS):
+        assign = sim[:, medoids].argmax(axis=1)
+        updated = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.flatnonzero(assign == cluster)
+            if members.size == 0:
+                updated.append(medoid)
+                continue
+            updated.append(int(members[sim[np.ix_(members, members)].sum(axis=1).argmax()]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return samples[medoids]
+
+
+class PrototypeIndex:
+    """
+    Prototypes for every student of a gallery matrix. Immutable: updates
+    return a new index that reuses the prototypes of unchanged students.
+    """
+
+    def __init__(self, matrix: np.ndarray, student_ids: np.ndarray, k: int = GALLERY_PROTOTYPES,
+                 rerank: bool = PROTOTYPE_RERANK, candidates: int = PROTOTYPE_CANDIDATES,
+                 reuse: Optional[Dict[Hashable, np.ndarray]] = None):
+        self.matrix = matrix  # raw rows, kept for re-ranking
+        self.k = k
+        self.rerank = rerank
+        self.candidates = candidates
+        self.rows = group_rows(student_ids)
+
+        reuse = reuse or {}
+        self.by_student: Dict[Hashable, np.ndarray] = {}
+        for student_id, idx in self.rows.items():
+            protos = reuse.get(student_id)
+            self.by_student[student_id] = protos if protos is not None else student_prototypes(matrix[idx], k)
+
+        if self.by_student:
+            self.prototypes = np.ascontiguousarray(np.vstack(list(self.by_student.values())))
+            self.prototype_student_ids = np.array(
+                [sid for sid, protos in self.by_student.items() for _ in range(len(protos))], dtype=object
+            )
+        else:
+            self.prototypes = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+            self.prototype_student_ids = np.zeros(0, dtype=object)
+
+    def updated(self, matrix: np.ndarray, student_ids: np.ndarray, changed=()) -> "PrototypeIndex":
+        """Index for the new rows, recomputing prototypes only for `changed` students."""
+        changed = set(changed)
+        reuse = {sid: protos for sid, protos in self.by_student.items() if sid not in changed}
+        return PrototypeIndex(matrix, student_ids, self.k, self.rerank, self.candidates, reuse=reuse)
+
+    @property
+    def nbytes(self) -> int:
+        return self.prototypes.nbytes
+
+    def search(self, query, threshold: float, top_k: int = 5) -> List[Tuple[Hashable, float]]:
+        """[(student_id, similarity)] best first, similarity >= threshold."""
+        if self.prototypes.shape[0] == 0:
+            return []
+        query = l2_normalize(query)
+        scores = self.prototypes @ query
+
+        count = min(max(self.candidates, top_k), scores.shape[0])
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+
+        best: Dict[Hashable, float] = {}
+        for idx in top:
+            student_id = self.prototype_student_ids[idx]
+            if student_id in best:
+                continue
+            if self.rerank:
+                best[student_id] = float(score_rows(self.matrix[self.rows[student_id]], query).max())
+            else:
+                best[student_id] = float(scores[idx])
+
+        ranked = sorted(((sid, s) for sid, s in best.items() if s >= threshold), key=lambda m: -m[1])
+        return ranked[:top_k]
+
+
+def _top_students(scores: np.ndarray, student_ids: np.ndarray, threshold: float, top_k: int):
+    """[(student_id, best score)] over candidate rows, best first."""
+    candidates = np.flatnonzero(scores >= threshold)
+    candidates = candidates[np.argsort(-scores[candidates])]
+    ranked, seen = [], set()
+    for idx in candidates:
+        student_id = student_ids[idx]
+        if student_id in seen:
+            continue
+        seen.add(student_id)
+        ranked.append((student_id, float(scores[idx])))
+        if len(ranked) >= top_k:
+            break
+    return ranked
+
+
+def train_centroids(matrix: np.ndarray, nlist: int, iterations: int = IVF_TRAIN_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the gallery rows."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(matrix.shape[0], nlist * IVF_TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(matrix[rng.choice(matrix.shape[0], sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = (sample @ centroids.T).argmax(axis=1)
+        order = np.argsort(assign, kind="stable")
+        present, starts = np.unique(assign[order], return_index=True)
+        sums = sample[rng.choice(sample_size, nlist)]  # empty lists are reseeded from random rows
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+def assign_lists(matrix: np.ndarray, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+    """Nearest centroid of every row."""
+    assign = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], batch):
+        assign[start:start + batch] = (matrix[start:start + batch] @ centroids.T).argmax(axis=1)
+    return assign
+
+
+def student_means(matrix: np.ndarray, student_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(normalised mean of every student's rows, index of each row's student in it)."""
+    _, inverse = np.unique(student_ids, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    sums = np.add.reduceat(np.asarray(matrix[order], dtype=np.float32), starts, axis=0)
+    return l2_normalize(sums), inverse
+
+
+def assign_students(matrix: np.ndarray, student_ids: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """List of every row: the centroid nearest its student's mean, so a student's rows share one list."""
+    means, inverse = student_means(matrix, student_ids)
+    return assign_lists(means, centroids)[inverse]
+
+
+class IVFIndex:
+    """
+    IVF-flat over students: centroids are trained on the students' mean
+    vectors and all rows of a student go to the list nearest that mean, so a
+    probe finds a student's samples together or not at all. A query scans
+    its `nprobe` nearest lists, and the whole gallery when they hold nothing
+    above the threshold (exact_fallback), so an enrolled face is never
+    reported unknown only because its list was not probed. Scores are exact
+    cosine similarities; only the ranking below the threshold is approximate.
+    """
+
+    def __init__(self, matrix: np.ndarray, student_ids: np.ndarray, centroids: Optional[np.ndarray] = None,
+                 assign: Optional[np.ndarray] = None, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE,
+                 trained_rows: int = 0, exact_fallback: bool = IVF_EXACT_FALLBACK):
+        self.nprobe = nprobe
+        self.exact_fallback = exact_fallback
+        if centroids is None:
+            if nlist <= 0:
+                nlist = int(4 * np.sqrt(max(matrix.shape[0], 1)))
+            if matrix.shape[0]:
+                means, _ = student_means(matrix, student_ids)
+                centroids = train_centroids(means, max(1, min(nlist, len(means))))
+            else:
+                centroids = np.zeros((1, matrix.shape[1]), np.float32)
+            trained_rows = matrix.shape[0]
+        self.centroids = centroids
+        self.trained_rows = trained_rows  # gallery size the centroids (and nlist) were trained for
+        self.assign = assign_students(matrix, student_ids, centroids) if assign is None else assign
+
+        # Pack every list contiguously so a probe is one slice + one matrix-vector product
+        order = np.argsort(self.assign, kind="stable")
+        self.packed = matrix[order]  # fancy indexing copies, so the lists are contiguous
+        self.packed_student_ids = student_ids[order]
+        self.offsets = np.searchsorted(self.assign[order], np.arange(len(centroids) + 1))
+        self._student_ids = student_ids
+
+    @property
+    def nbytes(self) -> int:
+        return self.packed.nbytes + self.centroids.nbytes
+
+    def needs_retrain(self, rows: int, growth: float = IVF_RETRAIN_GROWTH) -> bool:
+        """True once the gallery has outgrown the size the centroids were trained for."""
+        return rows > max(self.trained_rows, 1) * growth
+
+    def updated(self, matrix: np.ndarray, student_ids: np.ndarray, changed=()) -> "IVFIndex":
+        """
+        Keep the list of every unchanged row (they keep their relative order
+        across appends and removals) and assign the changed students' rows
+        by their new mean.
+        Centroids are not retrained here (see needs_retrain).
+        """
+        changed = set(changed)
+        old_keep = np.fromiter((sid not in changed for sid in self._student_ids), dtype=bool,
+                               count=len(self._student_ids))
+        new_keep = np.fromiter((sid not in changed for sid in student_ids), dtype=bool, count=len(student_ids))
+        assign = np.empty(len(student_ids), dtype=np.int32)
+        assign[new_keep] = self.assign[old_keep]
+        if (~new_keep).any():
+            assign[~new_keep] = assign_students(matrix[~new_keep], student_ids[~new_keep], self.centroids)
+        return IVFIndex(matrix, student_ids, self.centroids, assign, nprobe=self.nprobe,
+                        trained_rows=self.trained_rows, exact_fallback=self.exact_fallback)
+
+    def search(self, query, threshold: float, top_k: int = 5) -> List[Tuple[Hashable, float]]:
+        if self.packed.shape[0] == 0:
+            return []
+        query = l2_normalize(query)
+        centroid_scores = self.centroids @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        scores, ids = [], []
+        for lst in probe:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            scores.append(score_rows(self.packed[start:end], query))
+            ids.append(self.packed_student_ids[start:end])
+        ranked = _top_students(np.concatenate(scores), np.concatenate(ids), threshold, top_k) if scores else []
+        if not ranked and self.exact_fallback and nprobe < len(centroid_scores):
+            ranked = _top_students(score_rows(self.packed, query), self.packed_student_ids, threshold, top_k)
+        return ranked
+
+    # ---------- Persistence ----------
+    def save(self, path: str, fingerprint: str) -> None:
+        """Write centroids and list assignments atomically (the vectors come from the gallery)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, centroids=self.centroids, assign=self.assign, fingerprint=np.array(fingerprint),
+                         trained_rows=np.array(self.trained_rows), format=np.array(IVF_FILE_FORMAT))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def restore(cls, path: str, matrix: np.ndarray, student_ids: np.ndarray, fingerprint: str,
+                nprobe: int = IVF_NPROBE) -> Optional["IVFIndex"]:
+        """
+        Index from a saved file, only when the gallery rows are exactly the
+        ones it was saved for (and it has not outgrown its training size).
+        Otherwise None: the caller trains new centroids for the current rows.
+        """
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            if "format" not in saved.files or int(saved["format"]) != IVF_FILE_FORMAT:
+                return None
+            centroids = saved["centroids"]
+            if centroids.shape[1] != matrix.shape[1]:
+                return None
+            if str(saved["fingerprint"]) != fingerprint or len(saved["assign"]) != matrix.shape[0]:
+                return None
+            trained_rows = int(saved["trained_rows"])
+            if trained_rows <= 0 or matrix.shape[0] > trained_rows * IVF_RETRAIN_GROWTH:
+                return None  # an outgrown index
+            return cls(matrix, student_ids, centroids, saved["assign"], nprobe=nprobe, trained_rows=trained_rows)
@@ -0,0 +1,94 @@
+# gallery_snapshot.py
+"""
+Binary snapshot of the face gallery for fast startup.
+
+Layout of one file:
+  64-byte header   magic, row count, dimension, offset and length of the ids block
+  float32 matrix   rows x dim, L2-normalised, C order (opened with np.memmap)
+  ids block        JSON: stamp, seq, face_ids, student_ids, student_names
+
+Every process that opens the same snapshot maps the same pages, so N API
+workers share one page-cache copy of the matrix instead of N heap copies.
+A registration or removal copies the rows to the heap; they are shared
+again once a snapshot holding them is written and mapped (FaceGallery.save_snapshot).
+Snapshots are written to a temp file and renamed into place, so readers
+never see a partial file and keep their old mapping after a rewrite.
+"""
+import json
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"AVGALv01"
+HEADER = struct.Struct("<8sQIIQQ")  # magic, rows, dim, reserved, ids offset, ids length
+HEADER_SIZE = 64
+
+
+class GallerySnapshot(NamedTuple):
+    matrix: np.ndarray  # read-only np.memmap (or an empty array)
+    face_ids: np.ndarray
+    student_ids: np.ndarray
+    student_names: Dict[str, str]
+    stamp: float  # time.time() when the rows were read from the database
+    seq: Optional[int] = None  # gallery_changes seq the rows include, None if the log was unavailable
+
+
+def write_snapshot(path: str, matrix: np.ndarray, face_ids: List[Any], student_ids: List[Any],
+                   student_names: Dict[str, str], stamp: Optional[float] = None,
+                   seq: Optional[int] = None) -> None:
+    """Write a snapshot atomically (temp file in the same directory + rename)."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    ids = json.dumps({
+        "stamp": time.time() if stamp is None else stamp,
+        "seq": seq,
+        "face_ids": list(face_ids),
+        "student_ids": list(student_ids),
+        "student_names": student_names,
+    }).encode()
+    ids_offset = HEADER_SIZE + matrix.nbytes
+    header = HEADER.pack(SNAPSHOT_MAGIC, matrix.shape[0], matrix.shape[1], 0, ids_offset, len(ids))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            f.write(matrix.tobytes())
+            f.write(ids)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def open_snapshot(path: str, dim: int) -> Optional[GallerySnapshot]:
+    """Map a snapshot read-only. None when there is none or it does not match `dim`."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        magic, rows, file_dim, _, ids_offset, ids_length = HEADER.unpack(f.read(HEADER.size))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a gallery snapshot")
+        if file_dim != dim:
+            return None
+        f.seek(ids_offset)
+        ids = json.loads(f.read(ids_length))
+
+    if rows:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER_SIZE, shape=(rows, dim))
+    else:
+        matrix = np.zeros((0, dim), dtype=np.float32)
+    return GallerySnapshot(
+        matrix,
+        np.array(ids["face_ids"], dtype=object),
+        np.array(ids["student_ids"], dtype=object),
+        ids["student_names"],
+        ids["stamp"],
+        ids.get("seq"),
+    )
@@ -0,0 +1,81 @@
+# gallery_sync.py
+"""
+Keeps this replica's face gallery in step with faces registered or deleted
+through other replicas.
+
+A background thread polls gallery_changes every GALLERY_SYNC_SECONDS for
+rows after the last applied seq and applies them (FaceGallery.apply_changes),
+so only the changed faces are downloaded. Every GALLERY_SNAPSHOT_SECONDS
+after a change the snapshot is rewritten, so a restart replays less. If the
+log was unavailable when the gallery loaded, the log is asked again every
+GALLERY_RESUME_SECONDS and the gallery reloaded once it answers.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from face_gallery import FaceGallery, face_gallery
+
+GALLERY_SYNC_SECONDS = float(os.getenv("GALLERY_SYNC_SECONDS", "2"))  # 0 = no polling
+GALLERY_SNAPSHOT_SECONDS = float(os.getenv("GALLERY_SNAPSHOT_SECONDS", "300"))
+GALLERY_RESUME_SECONDS = float(os.getenv("GALLERY_RESUME_SECONDS", "30"))  # retry interval for an unavailable log
+
+
+class GallerySync:
+    def __init__(self, gallery: FaceGallery, interval: float = GALLERY_SYNC_SECONDS,
+                 snapshot_interval: float = GALLERY_SNAPSHOT_SECONDS):
+        self.gallery = gallery
+        self.interval = interval
+        self.snapshot_interval = snapshot_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._unsaved_since: Optional[float] = None
+        self._resume_at = 0.0  # monotonic time of the next change-log retry while the gallery has no seq
+        self.polls = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gallery-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+
+    def poll(self) -> None:
+        """Apply every change after the gallery's seq."""
+        seq = self.gallery.seq
+        self.gallery.catch_up()
+        self.polls += 1
+        if self.gallery.seq != seq and self._unsaved_since is None:
+            self._unsaved_since = time.monotonic()
+        if self._unsaved_since is not None and time.monotonic() - self._unsaved_since >= self.snapshot_interval:
+            self._unsaved_since = None
+            self.gallery.save_snapshot()
+
+    def tick(self) -> None:
+        """One round of the sync thread: poll the log, or retry it if the gallery has no position in it."""
+        if not self.gallery.loaded:
+            return
+        if self.gallery.seq is not None:
+            self.poll()
+        elif time.monotonic() >= self._resume_at:
+            self._resume_at = time.monotonic() + GALLERY_RESUME_SECONDS
+            self.gallery.resume_change_log()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Gallery sync poll failed: {e}")
+
+
+gallery_sync = GallerySync(face_gallery)
@@ -0,0 +1,142 @@
+# inference_pool.py
+"""
+Inference backends used by the API endpoints.
+
+LocalInference runs the recognition stages on the in-process thread executor.
+InferencePool runs them in N spawned worker processes that each load
+MiniFASNet and ArcFace once, so the API process itself only handles HTTP,
+decoding and database work. Either runs the native models or their ONNX
+exports, per INFERENCE_BACKEND (see onnx_backend).
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+import recognition_pipeline
+from detection_scheduler import DetectionPlan
+from recognition_pipeline import run_inference
+
+
+def configured_worker_count() -> int:
+    """INFERENCE_WORKERS: 0 = in-process threads (default), 'auto' = one per core, or a number."""
+    value = os.getenv("INFERENCE_WORKERS", "0").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(int(value), 0)
+
+
+INFERENCE_WORKERS = configured_worker_count()
+
+
+# ---------- Worker process side ----------
+_worker_liveness = None
+
+
+def _init_worker(model_paths: List[str], device_id, threads_per_worker: int) -> None:
+    """Runs once in each worker process: pin thread counts and load every model."""
+    global _worker_liveness
+
+    from onnx_backend import (ARCFACE_ONNX_NAME, INFERENCE_BACKEND, create_liveness_engine, load_session,
+                              onnx_model_path, set_onnx_threads)
+
+    if INFERENCE_BACKEND == "onnx":
+        set_onnx_threads(threads_per_worker)
+        _worker_liveness = create_liveness_engine(model_paths)
+        load_session(onnx_model_path(ARCFACE_ONNX_NAME))
+    else:
+        import torch
+        import tensorflow as tf
+        from deepface import DeepFace
+        from face_embedding import FACE_MODEL_NAME
+
+        torch.set_num_threads(threads_per_worker)
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+        _worker_liveness = create_liveness_engine(model_paths, device_id=device_id)
+        DeepFace.build_model(FACE_MODEL_NAME)
+    print(f"✅ Inference worker {os.getpid()} ready ({INFERENCE_BACKEND}, {threads_per_worker} threads)")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _analyze_frame(img: np.ndarray, tracked_boxes: Optional[List] = None, plan: Optional[DetectionPlan] = None):
+    return recognition_pipeline.analyze_frame(img, _worker_liveness, tracked_boxes, plan)
+
+
+def _analyze_registration_image(img: np.ndarray, skip_liveness: bool):
+    return recognition_pipeline.analyze_registration_image(img, _worker_liveness, skip_liveness)
+
+
+def _analyze_registration_batch(images: List[Optional[np.ndarray]], skip_liveness: bool):
+    return recognition_pipeline.analyze_registration_batch(images, _worker_liveness, skip_liveness)
+
+
+# ---------- API process side ----------
+class LocalInference:
+    """Recognition stages on the in-process inference thread executor."""
+
+    def __init__(self, liveness_detector):
+        self.liveness_detector = liveness_detector
+
+    async def analyze_frame(self, img: np.ndarray, tracked_boxes: Optional[List] = None,
+                            plan: Optional[DetectionPlan] = None):
+        return await run_inference(
+            recognition_pipeline.analyze_frame, img, self.liveness_detector, tracked_boxes, plan
+        )
+
+    async def analyze_registration_image(self, img: np.ndarray, skip_liveness: bool):
+        return await run_inference(
+            recognition_pipeline.analyze_registration_image, img, self.liveness_detector, skip_liveness
+        )
+
+    async def analyze_registration_batch(self, images: List[Optional[np.ndarray]], skip_liveness: bool):
+        return await run_inference(
+            recognition_pipeline.analyze_registration_batch, images, self.liveness_detector, skip_liveness
+        )
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InferencePool:
+    """Worker processes that each hold the models once; frames are sent over the executor's queue."""
+
+    def __init__(self, workers: int, model_paths: List[str], device_id):
+        self.workers = workers
+        threads_per_worker = max((os.cpu_count() or 1) // workers, 1)
+        # torch and TensorFlow are not fork-safe once initialised
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_paths, device_id, threads_per_worker),
+        )
+
+    async def _submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def warm_up(self) -> None:
+        """Start every worker (and load its models) before the first frame arrives."""
+        pids = await asyncio.gather(*[self._submit(_ping) for _ in range(self.workers)])
+        print(f"✅ Inference pool started: {len(set(pids))} worker processes")
+
+    async def analyze_frame(self, img: np.ndarray, tracked_boxes: Optional[List] = None,
+                            plan: Optional[DetectionPlan] = None):
+        return await self._submit(_analyze_frame, img, tracked_boxes, plan)
+
+    async def analyze_registration_image(self, img: np.ndarray, skip_liveness: bool):
+        return await self._submit(_analyze_registration_image, img, skip_liveness)
+
+    async def analyze_registration_batch(self, images: List[Optional[np.ndarray]], skip_liveness: bool):
+        return await self._submit(_analyze_registration_batch, images, skip_liveness)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+# liveness_engine.py
+import os
+import sys
+from typing import List
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# --- SilentFace (vendored under anti_spoofing/) ---
+LIVENESS_REPO_PATH = 'anti_spoofing'
+# Add both anti_spoofing and anti_spoofing/src to path for relative imports
+sys.path.insert(0, LIVENESS_REPO_PATH)
+sys.path.insert(0, os.path.join(LIVENESS_REPO_PATH, 'src'))
+from src.anti_spoof_predict import AntiSpoofPredict  # noqa: E402
+
+LIVENESS_MODEL_DIR = os.path.join(LIVENESS_REPO_PATH, 'resources', 'anti_spoof_models')
+LIVENESS_MODEL_FILE = '2.7_80x80_MiniFASNetV2.pth'
+# The upstream SilentFace demo averages MiniFASNetV2 with MiniFASNetV1SE
+LIVENESS_ENSEMBLE_FILES = ['2.7_80x80_MiniFASNetV2.pth', '4_0_0_80x80_MiniFASNetV1SE.pth']
+LIVENESS_ENSEMBLE = os.getenv("LIVENESS_ENSEMBLE", "false").lower() == "true"
+LIVENESS_INPUT_SIZE = (80, 80)
+
+
+def build_minifasnet(predictor: AntiSpoofPredict, path: str) -> torch.nn.Module:
+    """
+    A MiniFASNet in eval mode with the weights from `path`.
+
+    SilentFace has no public builder, so this is the one place that uses the
+    private AntiSpoofPredict._load_model. It is pinned to the vendored
+    minivision-ai/Silent-Face-Anti-Spoofing src/anti_spoof_predict.py, where
+    _load_model(path) parses the architecture from the file name, loads the
+    state dict and leaves the network in `predictor.model`. Re-check this
+    helper whenever anti_spoofing/ is updated; it fails loudly if that
+    contract changes.
+    """
+    load_model = getattr(predictor, "_load_model", None)
+    if load_model is None:
+        raise RuntimeError("Vendored SilentFace AntiSpoofPredict has no _load_model; update build_minifasnet")
+    predictor.model = None
+    load_model(path)
+    model = getattr(predictor, "model", None)
+    if not isinstance(model, torch.nn.Module):
+        raise RuntimeError(f"AntiSpoofPredict._load_model({path!r}) did not leave a network in .model; "
+                           "the vendored SilentFace code changed, update build_minifasnet")
+    return model.eval()
+
+
+class LivenessEngine:
+    """
+    MiniFASNet anti-spoofing models loaded once and kept in eval mode.
+
+    `AntiSpoofPredict.predict` rebuilds the network and re-reads the weights
+    from disk on every call; here each model is built once and a whole frame's
+    80x80 crops are scored in one forward pass per model. With several models
+    (the V2 + V1SE ensemble) the softmax outputs are averaged, as upstream does.
+    """
+
+    def __init__(self, model_paths: List[str], device_id=0):
+        self.model_paths = list(model_paths)
+        predictor = AntiSpoofPredict(device_id=device_id)
+        self.device = predictor.device
+        self.models = []
+        for path in self.model_paths:
+            self.models.append(build_minifasnet(predictor, path))
+
+    def predict_per_model(self, crops_per_model: List[List[np.ndarray]]) -> np.ndarray:
+        """
+        Score the same N faces with every model, each from its own list of
+        80x80 BGR crops (models are trained on different crop scales, see
+        recognition_pipeline.liveness_scores). Returns (N, 3) softmax
+        probabilities averaged over the models; column 1 is "Real".
+        """
+        if not crops_per_model or not crops_per_model[0]:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        probs = 0
+        with torch.inference_mode():
+            for model, crops in zip(self.models, crops_per_model):
+                # SilentFace's ToTensor is HWC -> CHW float without scaling to [0, 1]
+                batch = np.stack(crops).transpose(0, 3, 1, 2).astype(np.float32)
+                probs = probs + F.softmax(model(torch.from_numpy(batch).to(self.device)), dim=1)
+        return (probs / len(self.models)).cpu().numpy()
+
+    def predict_batch(self, crops: List[np.ndarray]) -> np.ndarray:
+        """predict_per_model with the same crops for every model."""
+        return self.predict_per_model([crops] * len(self.models))
+
+    def real_scores_per_model(self, crops_per_model: List[List[np.ndarray]]) -> np.ndarray:
+        """Probability of "Real" for each face."""
+        return self.predict_per_model(crops_per_model)[:, 1]
+
+    def real_scores(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Probability of "Real" for each crop, the same crop given to every model."""
+        return self.predict_batch(crops)[:, 1]
+
+
+def liveness_model_paths() -> List[str]:
+    files = LIVENESS_ENSEMBLE_FILES if LIVENESS_ENSEMBLE else [LIVENESS_MODEL_FILE]
+    return [os.path.join(LIVENESS_MODEL_DIR, name) for name in files]
@@ -1,9 +1,8 @@
 import os
 import time
+import asyncio
 import sys
-import tempfile
 import torch
-from deepface import DeepFace
 from datetime import datetime
 from supabase import create_client, Client
 import cv2
@@ -11,8 +10,22 @@ import cv2
 from db_utils import check_and_record_low_attendance
 from email_utils import send_email
 from supabase_client import supabase
+from face_gallery import face_gallery
+from gallery_changes import gallery_changes
+from gallery_sync import gallery_sync
+from attendance_cache import attendance_cache
+from attendance_writer import attendance_writer
+from spoof_alerts import spoof_alerts
+from metadata_cache import student_name_cache, subject_cache, teacher_cache
+from subject_roster import ROSTER_GLOBAL_FALLBACK, invalidate_roster, roster_gallery
+from recognition_pipeline import FaceRejected, run_inference
+from inference_pool import INFERENCE_WORKERS, InferencePool, LocalInference
+from recognition_session import RecognitionSession, get_session
+from detection_scheduler import DetectionPlan
+from frame_gate import FRAME_GATE, frame_thumbnail
 # import pickle
-from fastapi import FastAPI, File, HTTPException, UploadFile, Form
+from fastapi import FastAPI, File, HTTPException, UploadFile, Form, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import uuid
@@ -65,14 +78,11 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # IDENTITY_WINDOW_SECONDS = float(os.getenv("IDENTITY_WINDOW_SECONDS", "8"))
 
 # --- 2. SETUP LIVENESS MODEL (SilentFace) ---
-LIVENESS_REPO_PATH = 'anti_spoofing'
-# Add both anti_spoofing and anti_spoofing/src to path for relative imports
-sys.path.insert(0, LIVENESS_REPO_PATH)
-sys.path.insert(0, os.path.join(LIVENESS_REPO_PATH, 'src'))
 try:
-    from src.anti_spoof_predict import AntiSpoofPredict
+    from liveness_engine import LIVENESS_REPO_PATH, liveness_model_paths
+    from onnx_backend import INFERENCE_BACKEND, create_liveness_engine
 except ImportError as e:
-    print(f"Error: Could not import AntiSpoofPredict. Check path: {LIVENESS_REPO_PATH}")
+    print(f"Error: Could not import AntiSpoofPredict. Check path: anti_spoofing")
     print(f"Import error details: {e}")
     sys.exit(1)
 
@@ -85,34 +95,12 @@ print("Loading models, please wait...")
 # # CRITICAL: Face recognition thresholds - tuned for accuracy
 # MIN_CONFIDENCE = float(os.getenv("FACE_MIN_CONFIDENCE", "0.85"))  # Require VERY high confidence (was 0.70)
 # MIN_CONFIDENCE_MARGIN = float(os.getenv("FACE_MIN_CONFIDENCE_MARGIN", "0.20"))  # Strong margin between candidates (was 0.10)
-MIN_FACE_SIZE = int(os.getenv("MIN_FACE_SIZE", "80"))  # Larger minimum face size for better quality (was 60)
-BLUR_THRESHOLD = float(os.getenv("BLUR_THRESHOLD", "30.0"))  # More lenient blur detection for webcam (was 100.0)
-MAX_FACE_SIZE = int(os.getenv("MAX_FACE_SIZE", "1200"))  # Allow much larger faces for smartphone photos (was 400)
 # MIN_SAMPLES_PER_STUDENT = int(os.getenv("MIN_SAMPLES_PER_STUDENT", "10"))  # Minimum training samples required
 
 # --- 4. DEFINE GLOBAL CONSTANTS ---
 # AI Constants
-FACE_MODEL_NAME = "ArcFace"
 RECOGNITION_THRESHOLD = 0.50  # 50% similarity - Lowered to debug matching issues
-LIVENESS_THRESHOLD = 0.5      # 50% - Balanced threshold for real webcam feeds (real faces typically score 0.5-0.7)
-
-SPOOF_ALERT_TABLE = os.getenv("SPOOF_ALERT_TABLE", "attendance_alerts")
-
-# --- 3. HELPER FUNCTIONS ---
-def expand_bbox(x, y, w, h, scale=1.3, img_w=0, img_h=0):
-    """Expand bounding box by scale factor for better liveness detection"""
-    new_w = int(w * scale)
-    new_h = int(h * scale)
-    new_x = max(x - (new_w - w) // 2, 0)
-    new_y = max(y - (new_h - h) // 2, 0)
-    new_w = min(new_w, img_w - new_x)
-    new_h = min(new_h, img_h - new_y)
-    return new_x, new_y, new_w, new_h
-
-# --- 4. INITIALIZE MODELS ---
-# Load face detector (Haar Cascade)
-CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-facedetect = cv2.CascadeClassifier(CASCADE_PATH)
+
 # recent_recognitions: Dict[str, Dict[str, Any]] = {}
 
 # Auto-detect GPU (for Colab) or CPU (for local)
@@ -120,58 +108,122 @@ DEVICE_ID = 0 if torch.cuda.is_available() else 'cpu'
 print(f"Using device: {DEVICE_ID}")
 
 
-# Load Liveness Model
+# Load Liveness Model (each MiniFASNet is built once and reused for every frame)
 try:
-    LIVENESS_MODEL_PATH = os.path.join(LIVENESS_REPO_PATH, 'resources', 'anti_spoof_models', '2.7_80x80_MiniFASNetV2.pth')
-    print(f"🔍 Looking for liveness model at: {LIVENESS_MODEL_PATH}")
+    LIVENESS_MODEL_PATHS = liveness_model_paths()
+    print(f"🔍 Looking for liveness models at: {LIVENESS_MODEL_PATHS}")
     print(f"🔍 Current working directory: {os.getcwd()}")
     print(f"🔍 Files in current directory: {os.listdir('.')}")
     
-    if not os.path.exists(LIVENESS_MODEL_PATH):
-        print(f"❌ FATAL: Liveness model not found at {LIVENESS_MODEL_PATH}")
+    missing_models = [path for path in LIVENESS_MODEL_PATHS if not os.path.exists(path)]
+    if missing_models:
+        print(f"❌ FATAL: Liveness model not found at {missing_models}")
         if os.path.exists(LIVENESS_REPO_PATH):
             print(f"✅ anti_spoofing folder exists")
             print(f"📁 Contents: {os.listdir(LIVENESS_REPO_PATH)}")
         else:
             print(f"❌ anti_spoofing folder does NOT exist!")
         liveness_detector = None
+        inference = None
     else:
-        print(f"✅ Model file found! Size: {os.path.getsize(LIVENESS_MODEL_PATH)} bytes")
-        print(f"🔄 Initializing AntiSpoofPredict...")
-        liveness_detector = AntiSpoofPredict(device_id=DEVICE_ID)
-        print("✅ Liveness Detector loaded successfully!")
+        for path in LIVENESS_MODEL_PATHS:
+            print(f"✅ Model file found: {path} ({os.path.getsize(path)} bytes)")
+        if INFERENCE_WORKERS > 0:
+            # Models are loaded inside the worker processes, not in the API process
+            liveness_detector = None
+            inference = InferencePool(INFERENCE_WORKERS, LIVENESS_MODEL_PATHS, device_id=DEVICE_ID)
+            print(f"🔄 Inference pool configured with {INFERENCE_WORKERS} worker processes")
+        else:
+            print(f"🔄 Initializing liveness engine ({INFERENCE_BACKEND} backend)...")
+            liveness_detector = create_liveness_engine(LIVENESS_MODEL_PATHS, device_id=DEVICE_ID)
+            inference = LocalInference(liveness_detector)
+            print(f"✅ Liveness Detector loaded successfully! ({len(LIVENESS_MODEL_PATHS)} model(s))")
 except Exception as e:
     print(f"❌ Failed to load Liveness Detector: {e}")
     print(f"❌ Exception type: {type(e).__name__}")
     import traceback
     print(f"❌ Traceback: {traceback.format_exc()}")
     liveness_detector = None
+    inference = None
 
 
-def record_spoof_alert(
-    student_id: Optional[str],
-    student_name: Optional[str],
-    liveness_score: float,
-    reason: str,
-    subject_id: Optional[str] = None,
-    subject_code: Optional[str] = None
-) -> None:
-    """Persist spoof attempts for auditing."""
-    payload = {
-        "subject_id": subject_id,
-        "subject_code": subject_code,
-        "student_id": student_id,
-        "student_name": student_name,
-        "liveness_score": liveness_score,
-        "reason": reason,
-        "created_at": datetime.utcnow().isoformat()
-    }
+@app.on_event("startup")
+async def start_inference_pool():
+    if isinstance(inference, InferencePool):
+        await inference.warm_up()
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    if inference is not None:
+        inference.shutdown()
+
+
+@app.on_event("startup")
+def start_attendance_writer():
+    attendance_writer.start()
+
+
+@app.on_event("shutdown")
+def stop_attendance_writer():
+    attendance_writer.stop()  # flushes marks still queued
+
 
+@app.on_event("startup")
+def start_spoof_alerts():
+    spoof_alerts.start()
+
+
+@app.on_event("shutdown")
+def stop_spoof_alerts():
+    spoof_alerts.stop()  # writes events still open
+
+
+@app.on_event("startup")
+def load_face_gallery():
+    """Build the in-process embedding gallery once so matching needs no DB round trip."""
     try:
-        supabase.table(SPOOF_ALERT_TABLE).insert(payload).execute()
-        print(f"Logged spoof alert: {reason}")
-    except Exception as alert_error:
-        print(f"Warning: failed to record spoof alert: {alert_error}")
+        face_gallery.ensure_loaded()
+    except Exception as e:
+        print(f"⚠️ Could not load face gallery, falling back to match_face RPC: {e}")
+
+
+@app.on_event("startup")
+def start_gallery_sync():
+    gallery_sync.start()
+
+
+@app.on_event("shutdown")
+def stop_gallery_sync():
+    gallery_sync.stop()
+    face_gallery.maintain_index(retrain=False)  # write index changes still waiting for their timer
+
+
+def match_embedding(embedding, top_k: int = 5, subject_id: Optional[str] = None) -> list:
+    """
+    Top-k matches for one embedding, using the resident gallery when available.
+    With a subject_id only students on its roster are searched (see subject_roster).
+    """
+    if not face_gallery.loaded:
+        try:
+            face_gallery.ensure_loaded()  # one load shared by every face and request waiting on it
+        except Exception as e:
+            print(f"⚠️ Gallery unavailable ({e}), using match_face RPC")
+            match_params = {
+                "query_embedding": embedding,
+                "match_threshold": RECOGNITION_THRESHOLD,
+                "match_count": top_k
+            }
+            return supabase.rpc("match_face", match_params).execute().data or []
+
+    roster = roster_gallery(subject_id)
+    if roster is not None:
+        matches = roster.search(embedding, RECOGNITION_THRESHOLD, top_k=top_k)
+        if matches or not ROSTER_GLOBAL_FALLBACK:
+            return matches
+        print(f"ℹ️ No roster match for subject {subject_id}, searching the whole gallery")
+
+    return face_gallery.search(embedding, RECOGNITION_THRESHOLD, top_k=top_k)
 
 
 # def should_confirm_identity(student_id: Optional[str], subject_id: Optional[str], confidence: float) -> bool:
@@ -272,7 +324,7 @@ async def register_face(
         skip_liveness: If True, skips liveness detection (recommended for uploaded photos).
                       Set to False only if registering from live camera feed.
     """
-    if liveness_detector is None:
+    if inference is None:
         raise HTTPException(status_code=500, detail="Liveness detector is not loaded.")
 
     contents = await file.read()
@@ -282,45 +334,20 @@ async def register_face(
         raise HTTPException(status_code=400, detail="Invalid image file.")
 
     try:
-        # Pre-filtering
-        gray = cv2.cvtColor(img_np, cv2.COLOR_BGR2GRAY)
-        faces = facedetect.detectMultiScale(gray, 1.3, 5, minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE))
-        if len(faces) == 0:
-            raise HTTPException(status_code=400, detail="No face detected in image.")
-
-        (x, y, w, h) = faces[0] # Take the first and best face
-        
-        # Expand bbox and crop for liveness detection
-        img_h, img_w = img_np.shape[:2]
-        x2, y2, w2, h2 = expand_bbox(x, y, w, h, scale=1.35, img_w=img_w, img_h=img_h)
-        face_crop_expanded = img_np[y2:y2+h2, x2:x2+w2, :]
-        face_crop_resized = cv2.resize(face_crop_expanded, (80, 80))
-
-        # Liveness Check (optional for registration)
-        if not skip_liveness:
-            prediction = liveness_detector.predict(face_crop_resized, LIVENESS_MODEL_PATH)
-            real_score = prediction[0][1] # Probability of "Real"
-
-            if real_score < LIVENESS_THRESHOLD:
-                raise HTTPException(status_code=400, detail=f"Spoof detected. Liveness check failed (Score: {real_score:.2f}). Please use a live, well-lit photo.")
-            print(f"✅ Liveness passed (score: {real_score:.2f})")
-        else:
-            print(f"⏭️ Liveness check skipped (registration mode)")
-
-        # Liveness passed, generate embedding
-        face_crop = img_np[y:y+h, x:x+w]
-        embedding = DeepFace.represent(
-            img_path=face_crop, 
-            model_name=FACE_MODEL_NAME, 
-            enforce_detection=False, # We already found the face
-            detector_backend='skip'
-        )[0]["embedding"]
+        # Detection, liveness and ArcFace run on the inference executor
+        try:
+            embedding = await inference.analyze_registration_image(img_np, skip_liveness)
+        except FaceRejected as rejected:
+            raise HTTPException(status_code=400, detail=str(rejected))
 
         # Store in Supabase
         data_to_insert = {"student_id": student_id, "embedding": embedding}
-        response = supabase.table("faces").insert(data_to_insert).execute()
+        response = await run_in_threadpool(supabase.table("faces").insert(data_to_insert).execute)
 
         if response.data:
+            face_ids = [response.data[0].get("id")]
+            await run_in_threadpool(face_gallery.add_faces, student_id, [embedding], face_ids=face_ids)
+            await run_in_threadpool(gallery_changes.record_inserts, student_id, face_ids)
             return {"status": "success", "message": f"Face for student {student_id} registered."}
         else:
             raise HTTPException(status_code=500, detail=f"Supabase error: {str(response.error)}")
@@ -329,14 +356,19 @@ async def register_face(
         return HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     
 @app.post("/recognize_frame")
-async def recognize_frame(frame: UploadFile = File(...), subject_id: str = Form(None)):
+async def recognize_frame(frame: UploadFile = File(...), subject_id: str = Form(None), session_id: str = Form(None)):
     """
     This is the new SOTA pipeline.
     1. Detects faces
     2. Runs Liveness Check on each face
     3. If real, runs ArcFace Recognition
-    4. Matches against `pgvector` database ("match_face" RPC)
+    4. Matches against the in-process face gallery (pgvector RPC as fallback)
     5. Marks attendance
+
+    Frames sent with the same session_id (one per camera feed) share a face
+    tracker, detection scheduler and frame gate, so already recognised faces
+    are carried forward between frames. Without a session_id every frame is
+    processed on its own.
     """
     print(f"\n{'='*60}")
     print(f"🎥 RECOGNIZE_FRAME ENDPOINT CALLED")
@@ -344,24 +376,25 @@ async def recognize_frame(frame: UploadFile = File(...), subject_id: str = Form(
     print(f"   Subject ID: {subject_id}")
     print(f"{'='*60}\n")
     
-    if liveness_detector is None:
+    if inference is None:
         print("❌ ERROR: Liveness detector is not loaded!")
         raise HTTPException(status_code=500, detail="Liveness detector is not loaded.")
 
-    subject_code = None
-    if subject_id:
-        try:
-            subject_resp = supabase.table("subjects").select("code").eq("id", subject_id).execute()
-            if subject_resp.data:
-                subject_code = subject_resp.data[0].get("code")
-        except Exception as e:
-            print(f"Warn: Could not fetch subject code: {e}")
+    # Blocking Supabase calls go through the threadpool, CPU stages through the inference executor
+    subject_code = await run_in_threadpool(start_subject_session, subject_id)
 
     contents = await frame.read()
     print(f"📥 Received frame: {len(contents)} bytes")
-    
+
+    # Never fall back to subject_id: feeds of the same subject must not share tracks or replays
+    session = get_session(f"http:{session_id}") if session_id else None
+    thumb = await gate_thumbnail(session, contents)
+    if thumb is not None and session.gate.unchanged(thumb):
+        print("⏭️ Frame unchanged since the last processed one, returning the previous result")
+        return session.replay_last()
+
     npimg = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    img = await run_inference(cv2.imdecode, npimg, cv2.IMREAD_COLOR)
     
     if img is None:
         print("❌ Failed to decode image")
@@ -369,164 +402,260 @@ async def recognize_frame(frame: UploadFile = File(...), subject_id: str = Form(
     
     print(f"✅ Image decoded: {img.shape[1]}x{img.shape[0]} pixels")
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    faces_detected = facedetect.detectMultiScale(gray, 1.3, 5, minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE))
+    return await recognize_image(img, subject_id, subject_code, session, thumb)
 
-    print(f"🔍 Face detection result: {len(faces_detected)} faces detected (minSize={MIN_FACE_SIZE})")
-    
-    if len(faces_detected) == 0:
-        print("❌ No faces detected - trying with more lenient parameters...")
-        # Try again with more lenient parameters
-        faces_detected = facedetect.detectMultiScale(gray, 1.1, 3, minSize=(60, 60))
-        print(f"🔍 Second attempt: {len(faces_detected)} faces detected")
-        
-        if len(faces_detected) == 0:
-            return {"status": "no_face", "faces": [], "message": "No faces detected."}
+
+async def gate_thumbnail(session: Optional[RecognitionSession], contents: bytes):
+    """
+    Change-gate thumbnail of a session frame (None without a session or with
+    FRAME_GATE off). Sessions are per feed (client session_id or one
+    WebSocket), so a skipped frame only ever replays its own feed's result.
+    """
+    if session is None or not FRAME_GATE:
+        return None
+    return await run_inference(frame_thumbnail, contents)
+
+
+async def recognize_image(
+    img: np.ndarray,
+    subject_id: Optional[str],
+    subject_code: Optional[str],
+    session: Optional[RecognitionSession] = None,
+    thumb: Optional[np.ndarray] = None
+) -> dict:
+    """
+    Detection → liveness → ArcFace → match → mark for one decoded frame.
+    `thumb` is the frame's change-gate thumbnail, kept to compare later frames against.
+    """
+    tracker = session.tracker if session else None
+    if session:
+        session.touch()
+    fresh_tracks = tracker.fresh_tracks() if tracker else []
+
+    plan = session.detection.plan() if session else DetectionPlan(None, True)
+    analysis = await inference.analyze_frame(img, [t.box for t in fresh_tracks], plan)
+    if session:
+        session.detection.update(plan, analysis["boxes"], analysis["detect_ms"])
+    if analysis["detected"] == 0:
+        response = {"status": "no_face", "faces": [], "message": "No faces detected."}
+        if session:
+            session.gate.processed(thumb)
+            session.last_response = response
+        return response
+
+    tracked = [face for face in analysis["faces"] if "track" in face]
+    untracked = [face for face in analysis["faces"] if "track" not in face]
 
     results = []
+    if untracked:
+        results = await run_in_threadpool(resolve_faces, untracked, subject_id, subject_code, session)
+    if tracker:
+        results = [tracker.observe(result) for result in results]
+        for face in tracked:
+            box = (face["x"], face["y"], face["w"], face["h"])
+            results.append(tracker.carry_forward(fresh_tracks[face["track"]], box))
+
+    # Spoof sightings (fresh or carried by a track) fold into one alert event per track/region of one feed.
+    # Without a session nothing identifies the feed, so the frame gets a scope of its own rather than
+    # sharing the subject's with other cameras
+    scope = session.key if session else f"frame:{uuid.uuid4().hex}"
+    for result in results:
+        if result.get("liveness_passed") is False:
+            spoof_alerts.record(
+                scope, (result["x"], result["y"], result["w"], result["h"]), result["liveness_score"],
+                "low_liveness_score", subject_id=subject_id, subject_code=subject_code,
+                track_id=result.get("track_id"),
+            )
 
-    for (x, y, w, h) in faces_detected:
-        try:
-            # Extract face crop first
-            face_crop = img[y:y+h, x:x+w, :]
-            
-            # --- STAGE 2: PRE-FILTERING (Blur/Size) ---
-            if w > MAX_FACE_SIZE or h > MAX_FACE_SIZE:
-                print(f"Skipping too large face: {w}x{h}")
+    response = {"status": "recognized", "faces": results}
+    if session:
+        session.gate.processed(thumb)
+        session.last_response = response
+    attendance = session.drain_attendance() if session else []
+    if attendance:
+        response["attendance"] = attendance  # outcomes of marks written since the last frame
+    return response
+
+
+def compact_face(face: dict) -> dict:
+    """Short per-face payload for the streaming endpoint."""
+    compact = {
+        "box": [face["x"], face["y"], face["w"], face["h"]],
+        "name": face["name"],
+        "live": face["liveness_passed"],
+    }
+    if face.get("student_id"):
+        compact["id"] = face["student_id"]
+        compact["conf"] = face["confidence"]
+    return compact
+
+
+@app.websocket("/ws/recognize/{subject_id}")
+async def recognize_stream(websocket: WebSocket, subject_id: str):
+    """
+    One connection per camera session. The client sends binary JPEG frames;
+    each processed frame gets back {"seq", "status", "dropped", "faces", "attendance"}.
+    Only the newest frame is kept while one is being processed, so when the
+    server falls behind stale frames are dropped instead of queueing up.
+    """
+    await websocket.accept()
+    if inference is None:
+        await websocket.close(code=1011, reason="Liveness detector is not loaded.")
+        return
+
+    subject_code = await run_in_threadpool(start_subject_session, subject_id)
+    session = RecognitionSession(f"ws:{subject_id}:{uuid.uuid4().hex}")  # per connection: tracks and spoof events stay apart
+    print(f"🔌 Streaming session opened for subject {subject_id}")
+
+    slot = {"frame": None, "seq": 0, "dropped": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data:
                 continue
-            
-            # --- STAGE 1: LIVENESS GATEKEEPER (FIXED) ---
-            # Expand bounding box for better liveness detection (SilentFace requirement)
-            img_h, img_w = img.shape[:2]
-            x2, y2, w2, h2 = expand_bbox(x, y, w, h, scale=1.35, img_w=img_w, img_h=img_h)
-            
-            print(f"🔍 Original bbox: [{x}, {y}, {w}, {h}] → Expanded: [{x2}, {y2}, {w2}, {h2}]")
-            
-            # Crop the expanded region for liveness detection
-            face_crop_expanded = img[y2:y2+h2, x2:x2+w2, :]
-            
-            # Resize to 80x80 for MiniFASNet model
-            face_crop_resized = cv2.resize(face_crop_expanded, (80, 80))
-            
-            # Run liveness detection
-            prediction = liveness_detector.predict(face_crop_resized, LIVENESS_MODEL_PATH)
-            real_score = prediction[0][1]  # Probability of "Real" (index 1)
-            
-            print(f"🔍 Liveness score: {real_score:.3f} (threshold: {LIVENESS_THRESHOLD})")
+            if slot["frame"] is not None:
+                slot["dropped"] += 1  # previous frame was never picked up
+            slot["frame"] = data
+            slot["seq"] += 1
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not frame_ready.is_set():
+                waiter.cancel()
+                break  # client disconnected
+
+            frame_ready.clear()
+            contents, seq = slot["frame"], slot["seq"]
+            slot["frame"] = None
+
+            thumb = await gate_thumbnail(session, contents)
+            if thumb is not None and session.gate.unchanged(thumb):
+                response = session.replay_last()
+            else:
+                img = await run_inference(cv2.imdecode, np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    await websocket.send_json({"seq": seq, "status": "error", "message": "Invalid image data"})
+                    continue
+                response = await recognize_image(img, subject_id, subject_code, session, thumb)
+            await websocket.send_json({
+                "seq": seq,
+                "status": response["status"],
+                "dropped": slot["dropped"],
+                "faces": [compact_face(face) for face in response["faces"]],
+                "attendance": response.get("attendance", []),
+                "skipped": response.get("skipped", False),
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        print(f"🔌 Streaming session closed for subject {subject_id} ({slot['seq']} frames, {slot['dropped']} dropped, {session.stats()})")
+
+
+def start_subject_session(subject_id: Optional[str]) -> Optional[str]:
+    """
+    Per-session setup (blocking I/O): warm today's attendance keys, prebuild the
+    roster gallery and return the subject code.
+    """
+    try:
+        attendance_cache.warm(subject_id)
+    except Exception as e:
+        print(f"Warn: Could not warm attendance cache: {e}")
+    try:
+        roster_gallery(subject_id)
+    except Exception as e:
+        print(f"Warn: Could not build roster gallery: {e}")
+    return get_subject_code(subject_id)
+
+
+def fetch_subject(subject_id: str) -> Optional[dict]:
+    response = supabase.table("subjects").select("*").eq("id", subject_id).execute()
+    return response.data[0] if response.data else None
 
-            if real_score < LIVENESS_THRESHOLD:
-                print(f"⛔ SPOOF DETECTED at [{x}, {y}]. Score: {real_score:.3f} < {LIVENESS_THRESHOLD}. Skipping.")
+
+def get_subject_code(subject_id: Optional[str]) -> Optional[str]:
+    if not subject_id:
+        return None
+    try:
+        subject = subject_cache.get_or_load(subject_id, fetch_subject)
+        if subject:
+            return subject.get("code")
+    except Exception as e:
+        print(f"Warn: Could not fetch subject code: {e}")
+    return None
+
+
+def resolve_faces(
+    faces: list,
+    subject_id: Optional[str],
+    subject_code: Optional[str],
+    session: Optional[RecognitionSession] = None
+) -> list:
+    """
+    Match analysed faces against the gallery and queue attendance marks
+    (blocking I/O). Subject marks are written behind by
+    attendance_writer and their outcome is reported to `session`.
+    """
+    results = []
+    for face in faces:
+        x, y, w, h = face["x"], face["y"], face["w"], face["h"]
+        try:
+            if not face["liveness_passed"]:
                 results.append({
                     "name": "SPOOF", 
                     "liveness_passed": False, 
-                    "x": int(x), "y": int(y), "w": int(w), "h": int(h),
-                    "liveness_score": float(real_score)
+                    "x": x, "y": y, "w": w, "h": h,
+                    "liveness_score": face["liveness_score"]
                 })
-                record_spoof_alert(
-                    student_id=None, student_name="Unknown (Spoof Attempt)", 
-                    liveness_score=float(real_score), reason="low_liveness_score", 
-                    subject_id=subject_id, subject_code=subject_code
-                )
-                continue
-            
-            print(f"✅ Liveness PASSED at [{x}, {y}]. Score: {real_score:.3f}")
-            
-            gray_crop = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-            laplacian_var = cv2.Laplacian(gray_crop, cv2.CV_64F).var()
-            if laplacian_var < BLUR_THRESHOLD:
-                print(f"Skipping blurry face: {laplacian_var:.2f}")
-                continue
+                continue  # alerted by recognize_image once the face has a track
 
-            # --- STAGE 3: RECOGNITION (ArcFace) ---
-            print(f"🔍 Starting face recognition...")
-            
-            # Save face crop to temporary file for DeepFace (it requires file path)
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                cv2.imwrite(tmp_file.name, face_crop)
-                temp_path = tmp_file.name
-            
-            try:
-                embedding = DeepFace.represent(
-                    img_path=temp_path, model_name=FACE_MODEL_NAME, 
-                    enforce_detection=False, detector_backend='skip'
-                )[0]["embedding"]
-                print(f"✅ Embedding generated (length: {len(embedding)})")
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-
-            # --- STAGE 4: DATABASE MATCH (pgvector) ---
-            print(f"🔍 Searching database for match (threshold: {RECOGNITION_THRESHOLD})...")
-            
-            # Try RPC function first
-            try:
-                match_params = {
-                    "query_embedding": embedding,
-                    "match_threshold": RECOGNITION_THRESHOLD, 
-                    "match_count": 5  # Get top 5 matches for debugging
-                }
-                match_response = supabase.rpc("match_face", match_params).execute()
-                
-                print(f"📊 RPC returned {len(match_response.data) if match_response.data else 0} matches")
-                if match_response.data:
-                    for i, match in enumerate(match_response.data[:3]):
-                        print(f"   Match {i+1}: {match.get('student_name', 'Unknown')} - Similarity: {match.get('similarity', 0):.3f}")
-            except Exception as rpc_error:
-                print(f"⚠️ RPC function failed: {rpc_error}")
-                print(f"🔄 Falling back to direct query...")
-                
-                # Fallback: Get all faces and compute similarity manually
-                faces_response = supabase.table("faces").select("id, student_id, embedding").execute()
-                students_response = supabase.table("students").select("id, name").execute()
-                
-                student_map = {s["id"]: s.get("name", "Unknown") for s in (students_response.data or [])}
-                
-                # Compute cosine similarity manually
-                from numpy.linalg import norm
-                matches = []
-                for face in (faces_response.data or []):
-                    db_embedding = np.array(face["embedding"])
-                    query_embedding = np.array(embedding)
-                    
-                    # Cosine similarity
-                    similarity = np.dot(query_embedding, db_embedding) / (norm(query_embedding) * norm(db_embedding))
-                    
-                    if similarity >= RECOGNITION_THRESHOLD:
-                        matches.append({
-                            "student_id": face["student_id"],
-                            "student_name": student_map.get(face["student_id"], "Unknown"),
-                            "similarity": float(similarity)
-                        })
-                
-                matches.sort(key=lambda x: x["similarity"], reverse=True)
-                match_response.data = matches[:5]
-                
-                print(f"📊 Manual search returned {len(matches)} matches")
-                if matches:
-                    for i, match in enumerate(matches[:3]):
-                        print(f"   Match {i+1}: {match['student_name']} - Similarity: {match['similarity']:.3f}")
+            # --- STAGE 4: GALLERY MATCH (in-process) ---
+            print(f"🔍 Searching gallery for match (threshold: {RECOGNITION_THRESHOLD})...")
+            matches = match_embedding(face["embedding"], subject_id=subject_id)
 
-            if not match_response.data:
+            print(f"📊 Gallery returned {len(matches)} matches")
+            for i, match in enumerate(matches[:3]):
+                print(f"   Match {i+1}: {match.get('student_name', 'Unknown')} - Similarity: {match.get('similarity', 0):.3f}")
+
+            if not matches:
                 print(f"❌ No match found above threshold {RECOGNITION_THRESHOLD}")
-                results.append({"name": "Unknown", "liveness_passed": True, "x": int(x), "y": int(y), "w": int(w), "h": int(h)})
+                results.append({"name": "Unknown", "liveness_passed": True, "x": x, "y": y, "w": w, "h": h})
                 continue
 
             # --- STAGE 5: SUCCESS ---
-            match = match_response.data[0]
+            match = matches[0]
             student_id = match["student_id"]
             student_name = match["student_name"]
             similarity = match["similarity"]
 
             results.append({
                 "name": student_name, "student_id": student_id, "confidence": round(similarity, 3),
-                "x": int(x), "y": int(y), "w": int(w), "h": int(h),
+                "x": x, "y": y, "w": w, "h": h,
                 "liveness_passed": True
             })
             
             # --- STAGE 6: MARK ATTENDANCE ---
+            if attendance_cache.contains(student_id, subject_id):
+                print(f"ℹ️ Attendance already marked for today (cached)")
+                continue
+
+            if subject_id:
+                if attendance_writer.submit(student_id, subject_id, similarity, session):
+                    print(f"📝 Queued attendance for {student_name} (ID: {student_id})")
+                continue
+
             print(f"📝 Marking attendance for {student_name} (ID: {student_id})...")
             result = mark_attendance_if_not_exists(student_id, subject_id=subject_id, conf=similarity)
+            attendance_cache.add(student_id, subject_id)
             if result.get("status") == "exists":
                 print(f"ℹ️ Attendance already marked for today")
             else:
@@ -538,7 +667,7 @@ async def recognize_frame(frame: UploadFile = File(...), subject_id: str = Form(
             traceback.print_exc()
             continue
 
-    return {"status": "recognized", "faces": results}
+    return results
 
 
 @app.get("/debug/full_database")
@@ -608,6 +737,20 @@ def debug_full_database():
     except Exception as e:
         return {"error": str(e), "timestamp": str(np.datetime64("now"))}
 
+@app.get("/gallery/changes")
+def gallery_change_feed(since: int = 0, limit: int = 1000):
+    """Face inserts/removals and student renames after change `since`, oldest first, for replicas catching up"""
+    try:
+        changes = gallery_changes.since(since, min(max(limit, 1), 1000))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Gallery change log unavailable: {e}")
+    return {"changes": changes, "latest": changes[-1]["seq"] if changes else since, "applied": face_gallery.seq}
+
+@app.get("/debug/gallery")
+def debug_gallery():
+    """Size and memory use of the resident face gallery"""
+    return {"loaded": face_gallery.loaded, **face_gallery.memory_usage()}
+
 @app.get("/debug/table/{table_name}")
 def debug_specific_table(table_name: str):
     """Debug specific table with all data"""
@@ -889,6 +1032,9 @@ def update_student(
             student_payload["avatar_url"] = avatar_url
         
         supabase.table("students").update(student_payload).eq("id", student_id).execute()
+        face_gallery.set_student_name(student_id, full_name)
+        gallery_changes.record_student_renamed(student_id)
+        student_name_cache.invalidate(student_id)
         
         print(f"=== STUDENT UPDATE SUCCESS ===")
         return {
@@ -908,6 +1054,9 @@ def delete_student(student_id: str):
     try:
         # Delete from students table (user will be cascade deleted due to foreign key)
         supabase.table("students").delete().eq("id", student_id).execute()
+        face_gallery.remove_student(student_id)
+        gallery_changes.record_student_removed(student_id)
+        student_name_cache.invalidate(student_id)
         return {"status": "success", "message": "Student deleted successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -917,6 +1066,7 @@ def delete_attendance_record(attendance_id: str):
     """Delete an attendance record"""
     try:
         supabase.table("attendance").delete().eq("id", attendance_id).execute()
+        attendance_cache.clear()  # the deleted row may have been cached as marked
         return {"status": "success", "message": "Attendance record deleted successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -962,8 +1112,7 @@ def get_all_subjects():
 def get_subject(subject_id: str):
     """Get a single subject"""
     try:
-        response = supabase.table("subjects").select("*").eq("id", subject_id).execute()
-        subject = response.data[0] if response.data else None
+        subject = subject_cache.get_or_load(subject_id, fetch_subject)
         if not subject:
             raise HTTPException(status_code=404, detail="Subject not found")
         return {"status": "success", "subject": subject}
@@ -985,6 +1134,7 @@ def update_subject(subject_id: str, subject: SubjectUpdate):
             update_data["description"] = subject.description
         
         response = supabase.table("subjects").update(update_data).eq("id", subject_id).execute()
+        subject_cache.invalidate(subject_id)
         return {"status": "success", "subject": response.data[0] if response.data else None}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -994,6 +1144,8 @@ def delete_subject(subject_id: str):
     """Delete a subject"""
     try:
         supabase.table("subjects").delete().eq("id", subject_id).execute()
+        subject_cache.invalidate(subject_id)
+        invalidate_roster(subject_id)
         return {"status": "success", "message": "Subject deleted successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1084,36 +1236,39 @@ def get_subject_attendance(subject_id: str):
 def get_all_teachers():
     """Get all teachers with their details"""
     try:
-        # Get teachers with user details
-        teachers_resp = supabase.table("teachers").select("""
-            id,
-            teacher_code,
-            department,
-            avatar_url,
-            created_at,
-            users!inner(full_name, email, phone)
-        """).execute()
-        
-        teachers = []
-        for teacher in (teachers_resp.data or []):
-            # Combine teacher and user data
-            user_data = teacher.get("users", {})
-            teachers.append({
-                "id": teacher["id"],
-                "name": user_data.get("full_name", ""),
-                "teacherId": teacher.get("teacher_code", ""),
-                "email": user_data.get("email", ""),
-                "phone": user_data.get("phone", ""),
-                "subject": teacher.get("department", ""),
-                "status": "active",  # Default status
-                "avatar": teacher.get("avatar_url") or f"https://picsum.photos/seed/{teacher['id']}/100/100",
-                "created_at": teacher.get("created_at")
-            })
-        
-        return {"status": "success", "teachers": teachers}
+        return {"status": "success", "teachers": teacher_cache.get_or_load("all", fetch_teachers)}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+
+def fetch_teachers(_key=None) -> list:
+    """Teachers joined with their user details (cached by get_all_teachers)."""
+    teachers_resp = supabase.table("teachers").select("""
+        id,
+        teacher_code,
+        department,
+        avatar_url,
+        created_at,
+        users!inner(full_name, email, phone)
+    """).execute()
+    
+    teachers = []
+    for teacher in (teachers_resp.data or []):
+        # Combine teacher and user data
+        user_data = teacher.get("users", {})
+        teachers.append({
+            "id": teacher["id"],
+            "name": user_data.get("full_name", ""),
+            "teacherId": teacher.get("teacher_code", ""),
+            "email": user_data.get("email", ""),
+            "phone": user_data.get("phone", ""),
+            "subject": teacher.get("department", ""),
+            "status": "active",  # Default status
+            "avatar": teacher.get("avatar_url") or f"https://picsum.photos/seed/{teacher['id']}/100/100",
+            "created_at": teacher.get("created_at")
+        })
+    return teachers
+
 @app.post("/teachers")
 def create_teacher(
     name: str = Form(...),
@@ -1158,6 +1313,7 @@ def create_teacher(
         }
         
         teacher_resp = supabase.table("teachers").insert(teacher_payload).execute()
+        teacher_cache.clear()
         if not teacher_resp.data:
             raise RuntimeError("Failed to create teacher")
         
@@ -1236,6 +1392,7 @@ def update_teacher(
             teacher_payload["avatar_url"] = avatar_url
         
         supabase.table("teachers").update(teacher_payload).eq("id", teacher_id).execute()
+        teacher_cache.clear()
         
         print(f"=== TEACHER UPDATE SUCCESS ===")
         return {
@@ -1255,6 +1412,7 @@ def delete_teacher(teacher_id: str):
     try:
         # Delete from teachers table (user will be cascade deleted due to foreign key)
         supabase.table("teachers").delete().eq("id", teacher_id).execute()
+        teacher_cache.clear()
         return {"status": "success", "message": "Teacher deleted successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1754,7 +1912,7 @@ async def register_face_batch(
         skip_liveness: If True, skips liveness detection (recommended for registration).
                       Set to False only if registering from live camera feed.
     """
-    if liveness_detector is None:
+    if inference is None:
         raise HTTPException(status_code=500, detail="Liveness detector not loaded")
 
     if len(files) < 3:
@@ -1764,106 +1922,37 @@ async def register_face_batch(
         raise HTTPException(status_code=400, detail="Maximum 15 images allowed")
 
     registered_count = 0
-    rejected_count = 0
-    errors = []
 
+    # Read and decode every upload, then run detection/quality/liveness/ArcFace off the event loop
+    images = []
     for idx, file in enumerate(files):
-        try:
-            print(f"\n🔍 Processing image {idx+1}: {file.filename}")
-            
-            # Read image
-            contents = await file.read()
-            nparr = np.frombuffer(contents, np.uint8)
-            img_np = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img_np is None:
-                rejected_count += 1
-                errors.append(f"Image {idx+1}: Invalid file format")
-                print(f"❌ Image {idx+1}: Invalid file format")
-                continue
-
-            print(f"✅ Image {idx+1}: Loaded successfully ({img_np.shape})")
-
-            # Detect face
-            gray = cv2.cvtColor(img_np, cv2.COLOR_BGR2GRAY)
-            faces = facedetect.detectMultiScale(gray, 1.3, 5, minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE))
-            
-            if len(faces) == 0:
-                rejected_count += 1
-                errors.append(f"Image {idx+1}: No face detected")
-                print(f"❌ Image {idx+1}: No face detected")
-                continue
-
-            (x, y, w, h) = faces[0]  # Take the first face
-            face_crop = img_np[y:y+h, x:x+w]
-            print(f"✅ Image {idx+1}: Face detected ({w}x{h})")
-
-            # Quality checks
-            if w > MAX_FACE_SIZE or h > MAX_FACE_SIZE:
-                rejected_count += 1
-                errors.append(f"Image {idx+1}: Face too large ({w}x{h})")
-                print(f"❌ Image {idx+1}: Face too large ({w}x{h})")
-                continue
-
-            # Blur check
-            gray_crop = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-            laplacian_var = cv2.Laplacian(gray_crop, cv2.CV_64F).var()
-            if laplacian_var < BLUR_THRESHOLD:
-                rejected_count += 1
-                errors.append(f"Image {idx+1}: Image too blurry (score: {laplacian_var:.1f})")
-                print(f"❌ Image {idx+1}: Too blurry (score: {laplacian_var:.1f}, threshold: {BLUR_THRESHOLD})")
-                continue
-
-            print(f"✅ Image {idx+1}: Quality checks passed (blur: {laplacian_var:.1f})")
-
-            # Liveness check - OPTIONAL for registration (static photos)
-            if not skip_liveness:
-                print(f"🔍 Image {idx+1}: Running liveness detection...")
-                # Resize face crop to 80x80 (required by MiniFASNet)
-                face_crop_resized = cv2.resize(face_crop, (80, 80))
-                prediction = liveness_detector.predict(face_crop_resized, LIVENESS_MODEL_PATH)
-                real_score = prediction[0][1]
-
-                if real_score < LIVENESS_THRESHOLD:
-                    rejected_count += 1
-                    errors.append(f"Image {idx+1}: Spoof detected (liveness: {real_score:.2f})")
-                    print(f"❌ Image {idx+1}: Liveness failed (score: {real_score:.2f}, threshold: {LIVENESS_THRESHOLD})")
-                    continue
-
-                print(f"✅ Image {idx+1}: Liveness passed (score: {real_score:.2f})")
-            else:
-                print(f"⏭️ Image {idx+1}: Liveness check skipped (registration mode)")
+        print(f"\n🔍 Processing image {idx+1}: {file.filename}")
+        contents = await file.read()
+        images.append(await run_inference(cv2.imdecode, np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR))
 
-            # Generate embedding
-            print(f"🔍 Image {idx+1}: Generating DeepFace embedding...")
-            embedding = DeepFace.represent(
-                img_path=face_crop,
-                model_name=FACE_MODEL_NAME,
-                enforce_detection=False,
-                detector_backend='skip'
-            )[0]["embedding"]
-
-            print(f"✅ Image {idx+1}: Embedding generated (length: {len(embedding)})")
+    embeddings, errors = await inference.analyze_registration_batch(images, skip_liveness)
+    rejected_count = len(errors)
 
+    if embeddings:
+        try:
             # Store in database
-            data_to_insert = {
-                "student_id": student_id,
-                "embedding": embedding
-            }
-            response = supabase.table("faces").insert(data_to_insert).execute()
-            
+            rows = [{"student_id": student_id, "embedding": embedding} for embedding in embeddings]
+            response = await run_in_threadpool(supabase.table("faces").insert(rows).execute)
+
             if response.data:
-                registered_count += 1
-                print(f"✅ Image {idx+1}: Successfully stored in database")
+                face_ids = [r.get("id") for r in response.data]
+                await run_in_threadpool(face_gallery.add_faces, student_id, embeddings, face_ids=face_ids)
+                await run_in_threadpool(gallery_changes.record_inserts, student_id, face_ids)
+                registered_count += len(response.data)
+                print(f"✅ Stored {len(response.data)} face samples in database")
             else:
-                rejected_count += 1
-                errors.append(f"Image {idx+1}: Database error")
-                print(f"❌ Image {idx+1}: Database insertion failed")
-
+                rejected_count += len(embeddings)
+                errors.append("Database error")
+                print(f"❌ Database insertion failed")
         except Exception as e:
-            rejected_count += 1
-            errors.append(f"Image {idx+1}: {str(e)}")
-            print(f"❌ Error processing image {idx+1}: {e}")
+            rejected_count += len(embeddings)
+            errors.append(f"Storage failed: {str(e)}")
+            print(f"❌ Error storing faces: {e}")
             import traceback
             traceback.print_exc()
 
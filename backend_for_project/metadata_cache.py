@@ -0,0 +1,63 @@
+# metadata_cache.py
+"""
+Process-local TTL caches for small, hot metadata rows (subjects, student
+names, teachers) that are read on every frame or page load but rarely
+change. Endpoints that modify a row invalidate its entry explicitly; the
+TTL bounds staleness for changes made outside this process.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+METADATA_CACHE_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_SECONDS", "300"))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "4096"))
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl_seconds: float = METADATA_CACHE_TTL_SECONDS,
+                 max_entries: int = METADATA_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """Cached value for `key`, calling loader(key) on a miss. Loader errors are not cached."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader(key)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+subject_cache = TTLCache("subjects")            # subject_id -> subjects row (or None)
+student_name_cache = TTLCache("student_names")  # student_id -> name
+teacher_cache = TTLCache("teachers")            # "all" -> /teachers listing
@@ -0,0 +1,103 @@
+# onnx_backend.py
+"""
+ONNX Runtime path for ArcFace and MiniFASNet, selected with
+INFERENCE_BACKEND=onnx (default "native": DeepFace/TensorFlow for ArcFace,
+PyTorch for MiniFASNet).
+
+The .onnx files are produced offline by export_onnx.py into ONNX_MODEL_DIR.
+With ONNX_INT8=true the dynamically quantised copies (*.int8.onnx) are used
+instead. test_onnx_parity.py checks them against the native models and
+bench_onnx.py compares latency. With the ONNX backend TensorFlow and DeepFace
+are never imported.
+"""
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "native").lower()  # native | onnx
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/onnx")
+ONNX_INT8 = os.getenv("ONNX_INT8", "false").lower() == "true"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # intra-op threads per session, 0 = ONNX Runtime default
+
+ARCFACE_ONNX_NAME = "arcface"
+
+_sessions: Dict[str, object] = {}
+_sessions_lock = threading.Lock()
+
+
+def onnx_model_path(name: str, int8: bool = ONNX_INT8) -> str:
+    """Path of an exported model; `name` is a bare name or a .pth/.onnx file it was exported from."""
+    base = os.path.splitext(os.path.basename(name))[0]
+    return os.path.join(ONNX_MODEL_DIR, f"{base}.int8.onnx" if int8 else f"{base}.onnx")
+
+
+def set_onnx_threads(threads: int) -> None:
+    """Thread count for sessions created after this call (inference workers pin their share of cores)."""
+    global ONNX_THREADS
+    ONNX_THREADS = threads
+
+
+def load_session(path: str):
+    """One CPU InferenceSession per model file and process; sessions are safe to share between threads."""
+    with _sessions_lock:
+        session = _sessions.get(path)
+        if session is None:
+            import onnxruntime as ort
+
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"ONNX model not found at {path}; run export_onnx.py first")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if ONNX_THREADS:
+                options.intra_op_num_threads = ONNX_THREADS
+                options.inter_op_num_threads = 1
+            session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            _sessions[path] = session
+            print(f"✅ ONNX Runtime session loaded: {path}")
+        return session
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class OnnxLivenessEngine:
+    """Same interface as liveness_engine.LivenessEngine, on the exported MiniFASNet graphs."""
+
+    def __init__(self, model_paths: List[str], int8: bool = ONNX_INT8):
+        self.model_paths = list(model_paths)
+        self.sessions = [load_session(onnx_model_path(path, int8)) for path in self.model_paths]
+
+    def predict_per_model(self, crops_per_model: List[List[np.ndarray]]) -> np.ndarray:
+        """(N, 3) softmax probabilities, each model scoring its own crops, averaged over the models."""
+        if not crops_per_model or not crops_per_model[0]:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        probs = 0
+        for session, crops in zip(self.sessions, crops_per_model):
+            # HWC -> CHW float without scaling, as SilentFace's ToTensor does
+            batch = np.stack(crops).transpose(0, 3, 1, 2).astype(np.float32)
+            probs = probs + softmax(session.run(None, {session.get_inputs()[0].name: batch})[0])
+        return (probs / len(self.sessions)).astype(np.float32)
+
+    def predict_batch(self, crops: List[np.ndarray]) -> np.ndarray:
+        return self.predict_per_model([crops] * len(self.sessions))
+
+    def real_scores_per_model(self, crops_per_model: List[List[np.ndarray]]) -> np.ndarray:
+        return self.predict_per_model(crops_per_model)[:, 1]
+
+    def real_scores(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Probability of "Real" for each crop, the same crop given to every model."""
+        return self.predict_batch(crops)[:, 1]
+
+
+def create_liveness_engine(model_paths: List[str], device_id=0):
+    """The INFERENCE_BACKEND's liveness engine; the native one needs PyTorch."""
+    if INFERENCE_BACKEND == "onnx":
+        return OnnxLivenessEngine(model_paths)
+    from liveness_engine import LivenessEngine
+
+    return LivenessEngine(model_paths, device_id=device_id)
@@ -0,0 +1,398 @@
+# recognition_pipeline.py
+"""
+CPU-bound stages of face recognition: face detection, MiniFASNet liveness,
+blur filtering and ArcFace embedding. Everything here is synchronous and is
+meant to run on `inference_executor`, never on the asyncio event loop.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detection_scheduler import DetectionPlan
+from face_detectors import FACE_DETECTOR, FaceDetector, create_detector
+from face_embedding import embed_faces
+from face_tracker import associate, iou
+
+MIN_FACE_SIZE = int(os.getenv("MIN_FACE_SIZE", "80"))  # Larger minimum face size for better quality (was 60)
+BLUR_THRESHOLD = float(os.getenv("BLUR_THRESHOLD", "30.0"))  # More lenient blur detection for webcam (was 100.0)
+MAX_FACE_SIZE = int(os.getenv("MAX_FACE_SIZE", "1200"))  # Allow much larger faces for smartphone photos (was 400)
+LIVENESS_THRESHOLD = 0.5      # 50% - Balanced threshold for real webcam feeds (real faces typically score 0.5-0.7)
+LIVENESS_BBOX_SCALE = 1.35  # crop scale for liveness models whose file name does not carry one
+
+# Detection runs on a downscaled copy: small enough that a MIN_FACE_SIZE face is
+# still DETECT_MIN_FACE_PX wide, and never more than DETECT_MAX_SIDE on its long side
+DETECT_DOWNSCALE = os.getenv("DETECT_DOWNSCALE", "true").lower() == "true"
+DETECT_MIN_FACE_PX = int(os.getenv("DETECT_MIN_FACE_PX", "40"))
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", "960"))
+
+# torch and TensorFlow already parallelise each forward pass, so keep this small
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "2"))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+
+_thread_state = threading.local()
+
+
+class FaceRejected(ValueError):
+    """A registration image that failed detection, quality or liveness checks."""
+
+
+async def run_inference(fn, *args, **kwargs):
+    """Run a CPU-bound stage on the bounded inference executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, functools.partial(fn, *args, **kwargs))
+
+
+def get_face_detector(name: str = FACE_DETECTOR) -> FaceDetector:
+    """Detectors (cascades, cv2.dnn nets) are not safe to share between threads; each thread gets its own."""
+    detectors = getattr(_thread_state, "detectors", None)
+    if detectors is None:
+        detectors = _thread_state.detectors = {}
+    detector = detectors.get(name)
+    if detector is None:
+        detector = detectors[name] = create_detector(name)
+    return detector
+
+
+def detector_input(img: np.ndarray, detector: FaceDetector) -> np.ndarray:
+    return img if detector.color else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+# --- HELPER FUNCTIONS ---
+def liveness_crop_scale(model_path: str) -> Optional[float]:
+    """
+    Crop scale a SilentFace model was trained on, from its file name as
+    SilentFace's parse_model_name reads it: "2.7_80x80_MiniFASNetV2.pth" ->
+    2.7, "4_0_0_80x80_MiniFASNetV1SE.pth" -> 4.0, "org_..." -> None (whole
+    frame). Names without a scale get LIVENESS_BBOX_SCALE.
+    """
+    prefix = os.path.basename(model_path).split("_")[0]
+    if prefix == "org":
+        return None
+    try:
+        return float(prefix)
+    except ValueError:
+        return LIVENESS_BBOX_SCALE
+
+
+def liveness_crop(img: np.ndarray, box, scale: Optional[float] = LIVENESS_BBOX_SCALE,
+                  size: Tuple[int, int] = (80, 80)) -> np.ndarray:
+    """
+    MiniFASNet input for one face, cut the way SilentFace's CropImage does:
+    the box grown `scale` times around its centre (less if the frame is too
+    small), shifted rather than clipped at the frame edges, resized to
+    `size`. scale=None resizes the whole frame.
+    """
+    if scale is None:
+        return cv2.resize(img, size)
+    img_h, img_w = img.shape[:2]
+    x, y, w, h = box
+    scale = min((img_h - 1) / h, (img_w - 1) / w, scale)
+    new_w, new_h = w * scale, h * scale
+    cx, cy = x + w / 2, y + h / 2
+    x0, y0, x1, y1 = cx - new_w / 2, cy - new_h / 2, cx + new_w / 2, cy + new_h / 2
+    if x0 < 0:
+        x1, x0 = x1 - x0, 0
+    if y0 < 0:
+        y1, y0 = y1 - y0, 0
+    if x1 > img_w - 1:
+        x0, x1 = x0 - (x1 - img_w + 1), img_w - 1
+    if y1 > img_h - 1:
+        y0, y1 = y0 - (y1 - img_h + 1), img_h - 1
+    x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+    return cv2.resize(img[y0:y1 + 1, x0:x1 + 1], size)
+
+
+def liveness_scores(liveness_detector, img: np.ndarray, boxes) -> np.ndarray:
+    """Probability of "Real" for each face box, every model scoring crops at its own training scale."""
+    return batch_liveness_scores(liveness_detector, [(img, box) for box in boxes])
+
+
+def batch_liveness_scores(liveness_detector, faces) -> np.ndarray:
+    """liveness_scores for (image, box) pairs from any number of images, in one batch per model."""
+    scales = [liveness_crop_scale(path) for path in liveness_detector.model_paths]
+    crops = [[liveness_crop(img, box, scale) for img, box in faces] for scale in scales]
+    return liveness_detector.real_scores_per_model(crops)
+
+
+def blur_score(face_crop: np.ndarray) -> float:
+    gray_crop = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray_crop, cv2.CV_64F).var()
+
+
+def detection_scale(shape, min_face: int = MIN_FACE_SIZE) -> float:
+    """Factor (<= 1) the frame is resized by before detection."""
+    if not DETECT_DOWNSCALE:
+        return 1.0
+    height, width = shape[:2]
+    return min(1.0, DETECT_MIN_FACE_PX / min_face, DETECT_MAX_SIDE / max(height, width))
+
+
+def downscale(image: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def remap_boxes(faces, scale: float, shape) -> np.ndarray:
+    """Boxes found on the downscaled copy, in full-resolution (x, y, w, h)."""
+    faces = np.asarray(faces, dtype=np.float64).reshape(-1, 4)
+    if scale >= 1.0 or len(faces) == 0:
+        return faces.astype(int)
+    height, width = shape[:2]
+    boxes = np.round(faces / scale).astype(int)
+    boxes[:, 0] = np.clip(boxes[:, 0], 0, width - 1)
+    boxes[:, 1] = np.clip(boxes[:, 1], 0, height - 1)
+    boxes[:, 2] = np.minimum(boxes[:, 2], width - boxes[:, 0])
+    boxes[:, 3] = np.minimum(boxes[:, 3], height - boxes[:, 1])
+    return boxes
+
+
+def scaled_size(size: int, scale: float, detector: FaceDetector) -> int:
+    """A full-resolution face size on the downscaled copy, never below what the detector can see."""
+    return max(int(round(size * scale)), detector.min_window)
+
+
+def strict_pass(detector: FaceDetector, image: np.ndarray, min_size: int = 0, max_size: int = 0,
+                scale_factor: float = 0.0) -> np.ndarray:
+    """
+    Strict pass on a downscaled copy of `image`, full-resolution boxes.
+    min_size/max_size are full-resolution face sizes (0 = MIN_FACE_SIZE /
+    unbounded); a larger min_size lets the frame be shrunk further.
+    """
+    min_size = max(min_size, MIN_FACE_SIZE)
+    scale = detection_scale(image.shape, min_size)
+    small_max = int(np.ceil(max_size * min(scale, 1.0))) if max_size else 0
+    faces = detector.detect(downscale(image, scale), scaled_size(min_size, scale, detector), small_max,
+                            scale_factor=scale_factor)
+    return remap_boxes(faces, scale, image.shape)
+
+
+def detect_faces(img: np.ndarray, lenient_fallback: bool = False, min_size: int = 0, max_size: int = 0,
+                 scale_factor: float = 0.0):
+    """
+    Detection on a downscaled copy with the FACE_DETECTOR backend; boxes are
+    in full-resolution pixels. min_size/max_size/scale_factor override the
+    strict pass (see strict_pass); the lenient pass always uses the defaults.
+    """
+    detector = get_face_detector()
+    image = detector_input(img, detector)
+    faces = strict_pass(detector, image, min_size, max_size, scale_factor)
+    print(f"🔍 Face detection result: {len(faces)} faces detected "
+          f"({detector.name}, minSize={max(min_size, MIN_FACE_SIZE)}, maxSize={max_size or '-'})")
+
+    if len(faces) == 0 and lenient_fallback:
+        print("❌ No faces detected - trying with more lenient parameters...")
+        scale = detection_scale(img.shape)
+        faces = detector.detect(downscale(image, scale), scaled_size(60, scale, detector), lenient=True)
+        print(f"🔍 Second attempt: {len(faces)} faces detected")
+        faces = remap_boxes(faces, scale, img.shape)
+    return faces
+
+
+def detect_faces_in_rois(img: np.ndarray, rois: List[Tuple[int, int, int, int]], min_size: int = 0,
+                         max_size: int = 0, scale_factor: float = 0.0) -> np.ndarray:
+    """
+    Strict detection pass over each region only (full-resolution (x, y, w, h)
+    regions, clipped to the frame); cost follows the number of faces.
+    """
+    detector = get_face_detector()
+    image = detector_input(img, detector)
+    img_h, img_w = image.shape[:2]
+    boxes: List[Tuple[int, int, int, int]] = []
+    for rx, ry, rw, rh in rois:
+        x0, y0 = max(rx, 0), max(ry, 0)
+        x1, y1 = min(rx + rw, img_w), min(ry + rh, img_h)
+        if x1 - x0 < MIN_FACE_SIZE or y1 - y0 < MIN_FACE_SIZE:
+            continue
+        region = image[y0:y1, x0:x1]
+        for x, y, w, h in strict_pass(detector, region, min_size, max_size, scale_factor):
+            box = (int(x) + x0, int(y) + y0, int(w), int(h))
+            if all(iou(box, kept) < 0.5 for kept in boxes):  # neighbouring regions overlap
+                boxes.append(box)
+    print(f"🔍 ROI detection: {len(boxes)} faces in {len(rois)} regions")
+    return np.array(boxes, dtype=int).reshape(-1, 4)
+
+
+# --- RECOGNITION ---
+def analyze_frame(img: np.ndarray, liveness_detector, tracked_boxes: Optional[List] = None,
+                  plan: Optional[DetectionPlan] = None) -> Dict[str, Any]:
+    """
+    Detection -> liveness -> blur -> ArcFace for one frame.
+
+    `plan` (see detection_scheduler) says whether to scan only its ROIs or
+    the whole frame, whether the lenient second pass may run, and the
+    detector parameters learned for the session. Without one the whole
+    frame is scanned with the defaults and the lenient pass.
+
+    Returns {"detected": n, "boxes": [...], "faces": [...], "detect_ms": t}
+    where boxes are every detected (x, y, w, h) and each face has its box,
+    liveness score and, if it passed every check, its embedding. Too large
+    and blurry faces are dropped, as before. Faces that overlap one of
+    `tracked_boxes` (recently recognised tracks) skip liveness and ArcFace
+    and come back as {"track": index into tracked_boxes, box}.
+    """
+    plan = plan or DetectionPlan(None, True)
+    start = time.perf_counter()
+    if plan.rois is not None:
+        faces_detected = detect_faces_in_rois(img, plan.rois, plan.min_size, plan.max_size, plan.scale_factor)
+    else:
+        faces_detected = detect_faces(img, plan.lenient, plan.min_size, plan.max_size, plan.scale_factor)
+    detect_ms = (time.perf_counter() - start) * 1000
+    detected_boxes = [tuple(int(v) for v in box) for box in faces_detected]
+    if len(faces_detected) == 0:
+        return {"detected": 0, "boxes": [], "faces": [], "detect_ms": detect_ms}
+
+    # --- STAGE 1: PRE-FILTERING (Size) + LIVENESS CROPS ---
+    boxes = []
+    for (x, y, w, h) in faces_detected:
+        if w > MAX_FACE_SIZE or h > MAX_FACE_SIZE:
+            print(f"Skipping too large face: {w}x{h}")
+            continue
+        boxes.append((int(x), int(y), int(w), int(h)))
+
+    faces = []
+    if tracked_boxes:
+        matched = associate(boxes, tracked_boxes)
+        for i, track_index in matched.items():
+            x, y, w, h = boxes[i]
+            faces.append({"x": x, "y": y, "w": w, "h": h, "track": track_index})
+        boxes = [box for i, box in enumerate(boxes) if i not in matched]
+        print(f"🔁 {len(matched)} faces carried by tracks, {len(boxes)} need recognition")
+
+    # --- STAGE 2: LIVENESS GATEKEEPER (all faces in one forward pass) ---
+    real_scores = liveness_scores(liveness_detector, img, boxes)
+
+    candidates = []  # faces that passed liveness + quality, embedded together below
+    for (x, y, w, h), real_score in zip(boxes, real_scores):
+        face = {"x": x, "y": y, "w": w, "h": h, "liveness_score": float(real_score), "embedding": None}
+        print(f"🔍 Liveness score: {real_score:.3f} (threshold: {LIVENESS_THRESHOLD})")
+
+        if real_score < LIVENESS_THRESHOLD:
+            print(f"⛔ SPOOF DETECTED at [{x}, {y}]. Score: {real_score:.3f} < {LIVENESS_THRESHOLD}. Skipping.")
+            face["liveness_passed"] = False
+            faces.append(face)
+            continue
+
+        print(f"✅ Liveness PASSED at [{x}, {y}]. Score: {real_score:.3f}")
+        face["liveness_passed"] = True
+
+        face_crop = img[y:y+h, x:x+w, :]
+        laplacian_var = blur_score(face_crop)
+        if laplacian_var < BLUR_THRESHOLD:
+            print(f"Skipping blurry face: {laplacian_var:.2f}")
+            continue
+
+        faces.append(face)
+        candidates.append((face, face_crop))
+
+    # --- STAGE 3: RECOGNITION (ArcFace, one batched forward pass) ---
+    if candidates:
+        print(f"🔍 Embedding {len(candidates)} faces in one batch...")
+        embeddings = embed_faces([crop for _, crop in candidates])
+        for (face, _), embedding in zip(candidates, embeddings):
+            face["embedding"] = embedding
+
+    return {"detected": len(faces_detected), "boxes": detected_boxes, "faces": faces, "detect_ms": detect_ms}
+
+
+# --- REGISTRATION ---
+def analyze_registration_image(img: np.ndarray, liveness_detector, skip_liveness: bool) -> List[float]:
+    """Embedding of the first face in a single registration photo; raises FaceRejected."""
+    faces = detect_faces(img)
+    if len(faces) == 0:
+        raise FaceRejected("No face detected in image.")
+
+    (x, y, w, h) = faces[0]  # Take the first and best face
+
+    # Liveness Check (optional for registration)
+    if not skip_liveness:
+        real_score = liveness_scores(liveness_detector, img, [(x, y, w, h)])[0]  # Probability of "Real"
+        if real_score < LIVENESS_THRESHOLD:
+            raise FaceRejected(f"Spoof detected. Liveness check failed (Score: {real_score:.2f}). Please use a live, well-lit photo.")
+        print(f"✅ Liveness passed (score: {real_score:.2f})")
+    else:
+        print(f"⏭️ Liveness check skipped (registration mode)")
+
+    return embed_faces([img[y:y+h, x:x+w]])[0]
+
+
+def analyze_registration_batch(
+    images: List[Optional[np.ndarray]], liveness_detector, skip_liveness: bool
+) -> Tuple[List[List[float]], List[str]]:
+    """
+    Quality-check every uploaded image (None = undecodable), score liveness and
+    embed the survivors in one batch. Returns (embeddings, errors).
+    """
+    errors = []
+    accepted = []  # (index, image, face box) that passed checks, embedded together below
+
+    for idx, img_np in enumerate(images):
+        try:
+            if img_np is None:
+                errors.append(f"Image {idx+1}: Invalid file format")
+                print(f"❌ Image {idx+1}: Invalid file format")
+                continue
+
+            print(f"✅ Image {idx+1}: Loaded successfully ({img_np.shape})")
+
+            faces = detect_faces(img_np)
+            if len(faces) == 0:
+                errors.append(f"Image {idx+1}: No face detected")
+                print(f"❌ Image {idx+1}: No face detected")
+                continue
+
+            (x, y, w, h) = faces[0]  # Take the first face
+            face_crop = img_np[y:y+h, x:x+w]
+            print(f"✅ Image {idx+1}: Face detected ({w}x{h})")
+
+            # Quality checks
+            if w > MAX_FACE_SIZE or h > MAX_FACE_SIZE:
+                errors.append(f"Image {idx+1}: Face too large ({w}x{h})")
+                print(f"❌ Image {idx+1}: Face too large ({w}x{h})")
+                continue
+
+            laplacian_var = blur_score(face_crop)
+            if laplacian_var < BLUR_THRESHOLD:
+                errors.append(f"Image {idx+1}: Image too blurry (score: {laplacian_var:.1f})")
+                print(f"❌ Image {idx+1}: Too blurry (score: {laplacian_var:.1f}, threshold: {BLUR_THRESHOLD})")
+                continue
+
+            print(f"✅ Image {idx+1}: Quality checks passed (blur: {laplacian_var:.1f})")
+            accepted.append((idx, img_np, (x, y, w, h)))
+
+        except Exception as e:
+            errors.append(f"Image {idx+1}: {str(e)}")
+            print(f"❌ Error processing image {idx+1}: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # Liveness check - OPTIONAL for registration (static photos), one batch for all images
+    if accepted and not skip_liveness:
+        print(f"🔍 Running liveness detection on {len(accepted)} images...")
+        # Same per-model crops as recognition (liveness_crop at each model's scale)
+        real_scores = batch_liveness_scores(liveness_detector, [(img, box) for _, img, box in accepted])
+        live = []
+        for (idx, img, box), real_score in zip(accepted, real_scores):
+            if real_score < LIVENESS_THRESHOLD:
+                errors.append(f"Image {idx+1}: Spoof detected (liveness: {real_score:.2f})")
+                print(f"❌ Image {idx+1}: Liveness failed (score: {real_score:.2f}, threshold: {LIVENESS_THRESHOLD})")
+                continue
+            print(f"✅ Image {idx+1}: Liveness passed (score: {real_score:.2f})")
+            live.append((idx, img, box))
+        accepted = live
+    elif accepted:
+        print(f"⏭️ Liveness check skipped (registration mode)")
+
+    if not accepted:
+        return [], errors
+
+    # Generate all embeddings in one batched forward pass
+    print(f"🔍 Generating DeepFace embeddings for {len(accepted)} images...")
+    return embed_faces([img[y:y+h, x:x+w] for _, img, (x, y, w, h) in accepted]), errors
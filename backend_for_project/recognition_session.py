@@ -0,0 +1,81 @@
+# recognition_session.py
+"""Per-camera-session state kept between frames."""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from detection_scheduler import DetectionScheduler
+from face_tracker import FaceTracker
+from frame_gate import FrameGate
+
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "600"))
+
+
+class RecognitionSession:
+    def __init__(self, key: str):
+        self.key = key
+        self.tracker = FaceTracker()
+        self.detection = DetectionScheduler()
+        self.gate = FrameGate()
+        self.last_response: Optional[dict] = None  # returned again for frames the gate skips
+        self.frames = 0
+        self.last_used = time.monotonic()
+        self.attendance_counts = {"created": 0, "exists": 0, "failed": 0}
+        self._attendance_events = deque(maxlen=200)
+        self._attendance_lock = threading.Lock()
+
+    def record_attendance(self, student_id: str, status: str) -> None:
+        """Outcome of a queued attendance mark (called from the attendance writer thread)."""
+        with self._attendance_lock:
+            self.attendance_counts[status] += 1
+            self._attendance_events.append({"student_id": student_id, "status": status})
+
+    def drain_attendance(self) -> List[dict]:
+        """Attendance outcomes reported since the last call."""
+        with self._attendance_lock:
+            events = list(self._attendance_events)
+            self._attendance_events.clear()
+        return events
+
+    def replay_last(self) -> dict:
+        """The previous frame's result for a skipped frame, with any new attendance outcomes."""
+        self.touch()
+        response = {key: value for key, value in self.last_response.items() if key != "attendance"}
+        response["skipped"] = True
+        attendance = self.drain_attendance()
+        if attendance:
+            response["attendance"] = attendance
+        return response
+
+    def touch(self) -> None:
+        self.frames += 1
+        self.last_used = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "tracks": len(self.tracker.tracks),
+            "recognized": self.tracker.recognized,
+            "carried_forward": self.tracker.carried,
+            "attendance": dict(self.attendance_counts),
+            "detection": self.detection.stats(),
+            "frame_gate": self.gate.stats(),
+        }
+
+
+_sessions: Dict[str, RecognitionSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(key: str) -> RecognitionSession:
+    """Session for one HTTP camera feed, keyed by the client's session_id; idle ones expire."""
+    now = time.monotonic()
+    with _sessions_lock:
+        for stale_key in [k for k, s in _sessions.items() if now - s.last_used > SESSION_IDLE_SECONDS]:
+            _sessions.pop(stale_key, None)
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = RecognitionSession(key)
+        return session
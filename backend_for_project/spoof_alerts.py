@@ -0,0 +1,184 @@
+# spoof_alerts.py
+"""
+Spoof alert aggregation.
+
+A photo held up to the camera fails liveness on every frame it is in. Instead
+of one insert per frame, sightings are folded into one event per track (or
+overlapping box region) of a session. The event keeps the frame count,
+min/max liveness score and first/last seen time. It closes
+SPOOF_ALERT_WINDOW_SECONDS after it opened, and a background thread writes
+closed events to SPOOF_ALERT_TABLE in one batch insert.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from face_tracker import iou
+from supabase_client import supabase
+
+SPOOF_ALERT_TABLE = os.getenv("SPOOF_ALERT_TABLE", "attendance_alerts")
+SPOOF_ALERT_WINDOW_SECONDS = float(os.getenv("SPOOF_ALERT_WINDOW_SECONDS", "10"))
+SPOOF_ALERT_FLUSH_SECONDS = float(os.getenv("SPOOF_ALERT_FLUSH_SECONDS", "2"))
+SPOOF_ALERT_IOU_THRESHOLD = float(os.getenv("SPOOF_ALERT_IOU_THRESHOLD", "0.3"))
+
+# Columns the original per-frame alert rows had; used if the table lacks the aggregate ones
+LEGACY_COLUMNS = ("subject_id", "subject_code", "student_id", "student_name", "liveness_score", "reason", "created_at")
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.utcfromtimestamp(seconds).isoformat()
+
+
+class SpoofEvent:
+    def __init__(self, scope: str, box, score: float, reason: str,
+                 subject_id: Optional[str], subject_code: Optional[str], track_id: Optional[int], now: float):
+        self.scope = scope
+        self.box = tuple(box)
+        self.reason = reason
+        self.subject_id = subject_id
+        self.subject_code = subject_code
+        self.track_id = track_id
+        self.count = 1
+        self.min_score = self.max_score = score
+        self.first_seen = self.last_seen = now
+
+    def add(self, box, score: float, track_id: Optional[int], now: float) -> None:
+        self.box = tuple(box)
+        self.track_id = track_id if track_id is not None else self.track_id
+        self.count += 1
+        self.min_score = min(self.min_score, score)
+        self.max_score = max(self.max_score, score)
+        self.last_seen = now
+
+    def row(self) -> dict:
+        return {
+            "subject_id": self.subject_id,
+            "subject_code": self.subject_code,
+            "student_id": None,
+            "student_name": "Unknown (Spoof Attempt)",
+            "liveness_score": self.min_score,
+            "reason": self.reason,
+            "created_at": _timestamp(self.first_seen),
+            "frame_count": self.count,
+            "min_liveness_score": self.min_score,
+            "max_liveness_score": self.max_score,
+            "first_seen": _timestamp(self.first_seen),
+            "last_seen": _timestamp(self.last_seen),
+        }
+
+
+class SpoofAlertAggregator:
+    def __init__(self, window_seconds: float = SPOOF_ALERT_WINDOW_SECONDS,
+                 flush_seconds: float = SPOOF_ALERT_FLUSH_SECONDS,
+                 iou_threshold: float = SPOOF_ALERT_IOU_THRESHOLD):
+        self.window_seconds = window_seconds
+        self.flush_seconds = flush_seconds
+        self.iou_threshold = iou_threshold
+        self._lock = threading.Lock()
+        self._open: List[SpoofEvent] = []
+        self._closed: List[SpoofEvent] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._legacy_columns = False
+        self.sightings = 0
+        self.persisted = 0
+
+    def record(self, scope: str, box, score: float, reason: str,
+               subject_id: Optional[str] = None, subject_code: Optional[str] = None,
+               track_id: Optional[int] = None) -> None:
+        """Fold one spoof sighting into the open event for its track/region (no I/O)."""
+        now = time.time()
+        with self._lock:
+            self.sightings += 1
+            self._close_expired(now)
+            event = self._find(scope, box, track_id)
+            if event is None:
+                self._open.append(SpoofEvent(scope, box, score, reason, subject_id, subject_code, track_id, now))
+                print(f"⛔ Spoof event opened ({scope}) at {list(box)}")
+            else:
+                event.add(box, score, track_id, now)
+
+    def _find(self, scope: str, box, track_id: Optional[int]) -> Optional[SpoofEvent]:
+        candidates = [e for e in self._open if e.scope == scope]
+        if track_id is not None:
+            for event in candidates:
+                if event.track_id == track_id:
+                    return event
+        best, best_iou = None, self.iou_threshold
+        for event in candidates:
+            overlap = iou(event.box, box)
+            if overlap >= best_iou:
+                best, best_iou = event, overlap
+        return best
+
+    def _close_expired(self, now: float) -> None:
+        """Move events whose window has passed to the write queue. Call with the lock held."""
+        still_open = []
+        for event in self._open:
+            if now - event.first_seen >= self.window_seconds:
+                self._closed.append(event)
+            else:
+                still_open.append(event)
+        self._open = still_open
+
+    def flush(self, include_open: bool = False) -> int:
+        """Write closed events (and open ones when stopping) in one insert."""
+        with self._lock:
+            self._close_expired(time.time())
+            if include_open:
+                self._closed.extend(self._open)
+                self._open = []
+            events, self._closed = self._closed, []
+        if not events:
+            return 0
+
+        rows = [event.row() for event in events]
+        try:
+            self._insert(rows)
+        except Exception as alert_error:
+            print(f"Warning: failed to record {len(rows)} spoof alerts: {alert_error}")
+            return 0
+        self.persisted += len(rows)
+        print(f"Logged {len(rows)} spoof alerts ({sum(e.count for e in events)} frames)")
+        return len(rows)
+
+    def _insert(self, rows: List[dict]) -> None:
+        if not self._legacy_columns:
+            try:
+                supabase.table(SPOOF_ALERT_TABLE).insert(rows).execute()
+                return
+            except Exception as e:
+                if "column" not in str(e).lower():
+                    raise
+                print(f"⚠️ Spoof alert aggregate columns rejected ({e}), writing legacy columns only")
+                self._legacy_columns = True
+        legacy_rows = []
+        for row in rows:
+            legacy = {column: row[column] for column in LEGACY_COLUMNS}
+            legacy["reason"] = f"{row['reason']} x{row['frame_count']}"
+            legacy_rows.append(legacy)
+        supabase.table(SPOOF_ALERT_TABLE).insert(legacy_rows).execute()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spoof-alerts", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write every pending event."""
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+        self.flush(include_open=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+
+spoof_alerts = SpoofAlertAggregator()
@@ -0,0 +1,74 @@
+# subject_roster.py
+"""
+Roster-scoped matching: faces seen in a subject's session are matched only
+against the gallery rows of students enrolled in that subject.
+
+Enrollment is read from SUBJECT_ENROLLMENT_TABLE (subject_id, student_id).
+When a subject has no enrollment rows (or the table does not exist) matching
+stays global, as before.
+"""
+import os
+import threading
+from typing import Dict, FrozenSet, Optional
+
+from face_gallery import GallerySubset, face_gallery
+from metadata_cache import TTLCache
+from supabase_client import supabase
+
+SUBJECT_ENROLLMENT_TABLE = os.getenv("SUBJECT_ENROLLMENT_TABLE", "subject_enrollments")
+ROSTER_MATCHING = os.getenv("ROSTER_MATCHING", "true").lower() == "true"
+# Search the whole gallery when nobody on the roster matches (e.g. an unenrolled guest)
+ROSTER_GLOBAL_FALLBACK = os.getenv("ROSTER_GLOBAL_FALLBACK", "false").lower() == "true"
+ROSTER_PAGE_SIZE = 1000
+
+roster_cache = TTLCache("rosters")  # subject_id -> frozenset of enrolled student ids
+
+_subsets: Dict[str, GallerySubset] = {}
+_subsets_lock = threading.Lock()
+
+
+def fetch_roster(subject_id: str) -> FrozenSet[str]:
+    """Enrolled student ids for a subject; empty if none or the table is unavailable."""
+    student_ids = set()
+    start = 0
+    try:
+        while True:
+            resp = (
+                supabase.table(SUBJECT_ENROLLMENT_TABLE)
+                .select("student_id")
+                .eq("subject_id", subject_id)
+                .range(start, start + ROSTER_PAGE_SIZE - 1)
+                .execute()
+            )
+            page = resp.data or []
+            student_ids.update(row["student_id"] for row in page if row.get("student_id"))
+            if len(page) < ROSTER_PAGE_SIZE:
+                break
+            start += ROSTER_PAGE_SIZE
+    except Exception as e:
+        print(f"⚠️ Could not load roster for subject {subject_id} from {SUBJECT_ENROLLMENT_TABLE}: {e}")
+        return frozenset()
+    return frozenset(student_ids)
+
+
+def roster_gallery(subject_id: Optional[str]) -> Optional[GallerySubset]:
+    """Prebuilt gallery subset for a subject's roster, or None to match globally."""
+    if not ROSTER_MATCHING or not subject_id:
+        return None
+    roster = roster_cache.get_or_load(subject_id, fetch_roster)
+    if not roster:
+        return None
+
+    with _subsets_lock:
+        subset = _subsets.get(subject_id)
+        if subset is None or subset.student_ids != roster:
+            subset = _subsets[subject_id] = face_gallery.subset(roster)
+            print(f"✅ Roster gallery for subject {subject_id}: {len(roster)} students, "
+                  f"{len(subset)} of {len(face_gallery)} vectors")
+        return subset
+
+
+def invalidate_roster(subject_id: str) -> None:
+    roster_cache.invalidate(subject_id)
+    with _subsets_lock:
+        _subsets.pop(subject_id, None)
@@ -0,0 +1,91 @@
+"""
+Timing of the attendance write-behind queue, against a stand-in for
+db_utils.mark_attendance_batch (no network).
+
+A single mark must be written within ATTENDANCE_FLUSH_SECONDS even though
+the batch never reaches ATTENDANCE_FLUSH_SIZE, and a full batch must be
+written without waiting for the timer.
+
+Usage: python test_attendance_writer.py   (runs pytest on this file)
+"""
+
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+
+class FakeDatabase:
+    """Stand-in for db_utils.mark_attendance_batch: records each batch written."""
+
+    def __init__(self):
+        self.writes = []
+        self.written = threading.Event()
+
+    def mark_attendance_batch(self, marks, subject_id):
+        self.writes.append((subject_id, sorted(student_id for student_id, _ in marks)))
+        self.written.set()
+        return {student_id for student_id, _ in marks}
+
+
+def fresh_import(monkeypatch, name):
+    """Import `name` again (against the stubbed modules); monkeypatch restores or drops the old entry afterwards."""
+    monkeypatch.setitem(sys.modules, name, sys.modules.get(name))
+    monkeypatch.delitem(sys.modules, name)
+    return importlib.import_module(name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    attendance_writer imported against the stand-in; monkeypatch restores
+    the real modules (and attendance_cache.add) after each test.
+    """
+    db = FakeDatabase()
+    monkeypatch.setitem(sys.modules, "supabase_client", types.SimpleNamespace(supabase=None))
+    monkeypatch.setitem(sys.modules, "db_utils", types.SimpleNamespace(mark_attendance_batch=db.mark_attendance_batch))
+    cache = fresh_import(monkeypatch, "attendance_cache").attendance_cache
+    monkeypatch.setattr(cache, "add", lambda student_id, subject_id: None)  # keep the stand-in offline
+    db.AttendanceWriter = fresh_import(monkeypatch, "attendance_writer").AttendanceWriter
+    return db
+
+
+def test_single_mark_is_written_within_flush_seconds(db):
+    writer = db.AttendanceWriter(flush_size=25, flush_seconds=0.2)
+    writer.start()
+    try:
+        time.sleep(0.1)  # let the writer go idle first
+        writer.submit("s1", "math", 0.9)
+        assert db.written.wait(1.0), f"mark not written, {writer.pending()} still pending"
+        assert db.writes == [("math", ["s1"])]
+        assert writer.pending() == 0
+    finally:
+        writer.stop()
+
+
+def test_full_batch_is_written_without_waiting_for_the_timer(db):
+    writer = db.AttendanceWriter(flush_size=3, flush_seconds=60)
+    writer.start()
+    try:
+        for student_id in ("s1", "s2", "s3"):
+            writer.submit(student_id, "math")
+        assert db.written.wait(1.0), "full batch not written"
+        assert db.writes == [("math", ["s1", "s2", "s3"])]
+    finally:
+        writer.stop()
+
+
+def test_stop_writes_what_is_pending(db):
+    writer = db.AttendanceWriter(flush_size=25, flush_seconds=60)
+    writer.start()
+    writer.submit("s1", "math")
+    writer.submit("s1", "math", 0.8)  # coalesced
+    writer.stop()
+    assert db.writes == [("math", ["s1"])]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
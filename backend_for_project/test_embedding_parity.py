@@ -0,0 +1,90 @@
+"""
+Regression check for the in-memory recognition path.
+Embeddings from face_embedding.embed_faces (batched, ndarray in, no temp files)
+must match DeepFace.represent called on the same ndarray crop.
+
+Usage: python test_embedding_parity.py [folder_with_face_images]
+"""
+
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+from face_embedding import FACE_MODEL_NAME, embed_faces
+
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+MIN_COSINE = 0.9999  # batched vs per-crop forward pass, only float rounding differs
+
+
+def cosine(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def load_crops(folder=None, count=8):
+    """Face crops from a folder of photos, or random BGR crops when none is given."""
+    crops = []
+    if folder:
+        detector = cv2.CascadeClassifier(CASCADE_PATH)
+        for name in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, name))
+            if img is None:
+                continue
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            for (x, y, w, h) in detector.detectMultiScale(gray, 1.3, 5, minSize=(60, 60)):
+                crops.append(img[y:y+h, x:x+w])
+    if not crops:
+        rng = np.random.default_rng(0)
+        crops = [rng.integers(0, 256, size=(int(s), int(s), 3), dtype=np.uint8)
+                 for s in rng.integers(80, 240, size=count)]
+    return crops
+
+
+def represent_array(crop):
+    return DeepFace.represent(img_path=crop, model_name=FACE_MODEL_NAME,
+                              enforce_detection=False, detector_backend='skip')[0]["embedding"]
+
+
+def represent_jpeg_file(crop):
+    """The old recognize_frame path: JPEG temp file handed to DeepFace."""
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
+        cv2.imwrite(tmp_file.name, crop)
+        temp_path = tmp_file.name
+    try:
+        return DeepFace.represent(img_path=temp_path, model_name=FACE_MODEL_NAME,
+                                  enforce_detection=False, detector_backend='skip')[0]["embedding"]
+    finally:
+        os.remove(temp_path)
+
+
+def test_batched_embeddings_match_array_path(folder=None):
+    crops = load_crops(folder)
+    batched = embed_faces(crops)
+    assert len(batched) == len(crops)
+
+    worst = 1.0
+    for idx, (crop, embedding) in enumerate(zip(crops, batched)):
+        sim = cosine(embedding, represent_array(crop))
+        jpeg_sim = cosine(embedding, represent_jpeg_file(crop))
+        worst = min(worst, sim)
+        print(f"   Crop {idx+1} {crop.shape[1]}x{crop.shape[0]}: array={sim:.6f}  jpeg temp file={jpeg_sim:.6f}")
+
+    print(f"\n📊 Worst cosine vs DeepFace.represent(ndarray): {worst:.6f} (required ≥ {MIN_COSINE})")
+    assert worst >= MIN_COSINE, f"Batched embeddings drifted from the array path ({worst:.6f})"
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    print("=" * 60)
+    print("EMBEDDING PARITY: batched in-memory vs DeepFace.represent")
+    print("=" * 60)
+    test_batched_embeddings_match_array_path(folder)
+    print("✅ Embeddings match the array path")
+
+
+if __name__ == "__main__":
+    main()
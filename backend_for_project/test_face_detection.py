@@ -0,0 +1,79 @@
+"""
+End-to-end detection on decoded frames (ndarrays), for every detector
+backend whose model file is present: full-frame scan with and without the
+lenient pass, tuned min/max size, and ROI scans must all run and return
+full-resolution (x, y, w, h) boxes inside the frame.
+
+Usage: python test_face_detection.py [folder_with_face_images]   (or pytest test_face_detection.py)
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+import recognition_pipeline
+from face_detectors import DETECTORS, create_detector, resolve_detector
+from recognition_pipeline import detect_faces, detect_faces_in_rois
+
+
+def load_frames(folder=None):
+    """BGR frames from a folder, or a blank and a noisy 480x640 frame when none is given."""
+    frames = []
+    if folder:
+        for name in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, name))
+            if img is not None:
+                frames.append(img)
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [np.zeros((480, 640, 3), dtype=np.uint8),
+                  rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)]
+    return frames
+
+
+def check_boxes(boxes, img):
+    boxes = np.asarray(boxes)
+    assert boxes.ndim == 2 and boxes.shape[1] == 4, boxes.shape
+    height, width = img.shape[:2]
+    for x, y, w, h in boxes:
+        assert 0 <= x < width and 0 <= y < height and w > 0 and h > 0
+        assert x + w <= width and y + h <= height
+
+
+def run_backend(name, frames):
+    """detect_faces / detect_faces_in_rois with the `name` backend in place of the configured one."""
+    detector = create_detector(name)
+    configured = recognition_pipeline.get_face_detector
+    recognition_pipeline.get_face_detector = lambda *args: detector
+    try:
+        for img in frames:
+            check_boxes(detect_faces(img), img)
+            check_boxes(detect_faces(img, lenient_fallback=True), img)
+            check_boxes(detect_faces(img, min_size=80, max_size=200, scale_factor=1.15), img)
+            check_boxes(detect_faces_in_rois(img, [(100, 100, 200, 200), (-20, -20, 150, 150)]), img)
+    finally:
+        recognition_pipeline.get_face_detector = configured
+    print(f"✅ {detector.name}: {len(frames)} frames")
+
+
+def test_configured_detector_runs_on_ndarrays(folder=None):
+    run_backend(recognition_pipeline.FACE_DETECTOR, load_frames(folder))
+
+
+def test_every_available_backend_runs_on_ndarrays(folder=None):
+    frames = load_frames(folder)
+    for name in DETECTORS:
+        if resolve_detector(name) == name:
+            run_backend(name, frames)
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    test_configured_detector_runs_on_ndarrays(folder)
+    test_every_available_backend_runs_on_ndarrays(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Frame-gate replays stay inside their camera feed: an unchanged frame from
+one session must never return another session's previous result, even when
+both feeds look at the same scene for the same subject.
+
+Usage: python test_frame_gate.py   (or pytest test_frame_gate.py)
+"""
+
+import cv2
+import numpy as np
+
+from recognition_session import get_session
+
+
+def encoded_frame(value=0):
+    img = np.full((480, 640, 3), value, dtype=np.uint8)
+    cv2.rectangle(img, (200, 150), (440, 330), (255, 255, 255), -1)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def process(session, thumb, response):
+    """What recognize_image does after a processed frame."""
+    session.gate.processed(thumb)
+    session.last_response = response
+
+
+def test_unchanged_frame_replays_only_its_own_session():
+    from frame_gate import frame_thumbnail
+
+    thumb = frame_thumbnail(encoded_frame())
+    a, b = get_session("http:camera-a"), get_session("http:camera-b")
+    assert a is not b
+    process(a, thumb, {"status": "recognized", "faces": [{"student_id": "s1"}]})
+
+    assert not b.gate.unchanged(thumb), "camera B has processed nothing yet, its frame must be processed"
+    assert a.gate.unchanged(thumb)
+    replay = a.replay_last()
+    assert replay["skipped"] and replay["faces"] == [{"student_id": "s1"}]
+
+
+def test_same_session_id_returns_same_session():
+    assert get_session("http:camera-c") is get_session("http:camera-c")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,58 @@
+"""
+IVFIndex: a student's rows share one inverted list, an index saved for the
+same rows is restored, and a query whose lists were not probed still finds
+its student through the exact fallback.
+
+Usage: python test_gallery_index.py   (or pytest test_gallery_index.py)
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from bench_prototypes import THRESHOLD, probes, synthetic_gallery
+from gallery_index import IVFIndex, rank_students
+
+
+def test_student_rows_share_a_list():
+    matrix, student_ids, _ = synthetic_gallery(200, 5)
+    index = IVFIndex(matrix, student_ids, nlist=20)
+    grown_ids = np.concatenate([student_ids, np.array(["new"] * 5, dtype=object)])
+    grown = index.updated(np.vstack([matrix, matrix[:5]]), grown_ids, ["new"])
+    for ivf, ids in [(index, student_ids), (grown, grown_ids)]:
+        for student_id in set(ids):
+            assert len(set(ivf.assign[ids == student_id])) == 1, student_id
+    print("✅ student rows share a list")
+
+
+def test_exact_fallback_finds_unprobed_student():
+    matrix, student_ids, identities = synthetic_gallery(200, 5)
+    queries, truth = probes(identities, 50)
+    index = IVFIndex(matrix, student_ids, nlist=20, nprobe=1)
+    index.centroids = -index.centroids  # every query now probes its farthest list
+    exact = [[m["student_id"] for m in rank_students(matrix, student_ids, {}, q, THRESHOLD, 5)] for q in queries]
+    assert [[sid for sid, _ in index.search(q, THRESHOLD)] for q in queries] == exact
+    assert any(exact) and any(f == t for f, t in zip((e[0] for e in exact if e), truth))
+
+    index.exact_fallback = False
+    assert not any(index.search(q, THRESHOLD) for q in queries)
+    print("✅ exact fallback finds unprobed student")
+
+
+def test_restore_only_for_same_rows():
+    matrix, student_ids, _ = synthetic_gallery(100, 5)
+    index = IVFIndex(matrix, student_ids, nlist=10)
+    path = os.path.join(tempfile.mkdtemp(), "gallery_ivf.npz")
+    index.save(path, "rows-a")
+
+    restored = IVFIndex.restore(path, matrix, student_ids, "rows-a")
+    assert restored is not None and np.array_equal(restored.assign, index.assign)
+    assert IVFIndex.restore(path, matrix, student_ids, "rows-b") is None
+    print("✅ restore only for same rows")
+
+
+if __name__ == "__main__":
+    test_student_rows_share_a_list()
+    test_exact_fallback_finds_unprobed_student()
+    test_restore_only_for_same_rows()
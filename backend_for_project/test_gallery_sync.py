@@ -0,0 +1,411 @@
+"""
+Replica convergence through the gallery change log, against an in-memory
+stand-in for the Supabase client (no network, no models).
+
+Two FaceGallery replicas share one fake database. Faces registered or
+students deleted through one must show up in the other after a poll,
+without the other reading the whole `faces` table again.
+
+The fake client is installed per test through a fixture, so other test
+modules still import the real supabase_client.
+
+Usage: python test_gallery_sync.py   (runs pytest on this file)
+"""
+
+import importlib
+import itertools
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+DIM = 512
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """The subset of the PostgREST query builder the gallery code uses."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = None
+        self.columns = None
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.row_range = None
+
+    def select(self, columns):
+        self.action, self.columns = "select", [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def execute(self):
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.action == "insert":
+            inserted = [self.db.with_key(self.table, dict(row)) for row in self.payload]
+            rows.extend(inserted)
+            return FakeResponse(inserted)
+
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.action == "delete":
+            self.db.tables[self.table] = [r for r in rows if r not in matched]
+            return FakeResponse(matched)
+        if self.action == "update":
+            for row in matched:
+                row.update(self.payload)
+            return FakeResponse(matched)
+
+        self.db.reads.append((self.table, tuple(self.columns), bool(self.filters)))
+        if self.order_by:
+            column, desc = self.order_by
+            matched.sort(key=lambda r: r[column], reverse=desc)
+        if self.row_range:
+            matched = matched[self.row_range[0]:self.row_range[1] + 1]
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        return FakeResponse([{c: r.get(c) for c in self.columns} for r in matched])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {}
+        self.reads = []  # (table, columns, filtered) of every select
+        self._ids = itertools.count(1)
+        self.seqs = itertools.count(1)  # the change log's bigserial
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def with_key(self, table, row):
+        if table == "face_changes":
+            row.setdefault("seq", next(self.seqs))
+        elif "id" not in row:
+            row["id"] = f"{table}-{next(self._ids)}"
+        return row
+
+    def full_face_downloads(self):
+        return sum(1 for table, columns, filtered in self.reads
+                   if table == "faces" and "embedding" in columns and not filtered)
+
+
+def fresh_import(monkeypatch, name):
+    """Import `name` again (against the stubbed modules); monkeypatch restores or drops the old entry afterwards."""
+    monkeypatch.setitem(sys.modules, name, sys.modules.get(name))
+    monkeypatch.delitem(sys.modules, name)
+    return importlib.import_module(name)
+
+
+class Replicas:
+    """A fake database with face_gallery / gallery_changes imported against it, and the API's write paths."""
+
+    def __init__(self, db, face_gallery_module, gallery_changes_module):
+        self.db = db
+        self.face_gallery = face_gallery_module
+        self.gallery_changes = gallery_changes_module.gallery_changes
+        self.rng = np.random.default_rng(0)
+        for i in range(3):
+            db.table("students").insert({"id": f"s{i}", "name": f"Student {i}"}).execute()
+            db.table("faces").insert(
+                [{"student_id": f"s{i}", "embedding": self.rng.standard_normal(DIM).tolist()} for _ in range(2)]
+            ).execute()
+
+    def gallery(self, cls=None):
+        return (cls or self.face_gallery.FaceGallery)()
+
+    def register(self, replica, student_id, count=2):
+        """What the /register-face endpoints do: insert rows, update the local gallery, log the change."""
+        rows = self.db.table("faces").insert(
+            [{"student_id": student_id, "embedding": self.rng.standard_normal(DIM).tolist()} for _ in range(count)]
+        ).execute().data
+        face_ids = [r["id"] for r in rows]
+        replica.add_faces(student_id, [r["embedding"] for r in rows], face_ids)
+        self.gallery_changes.record_inserts(student_id, face_ids)
+
+    def delete_student(self, replica, student_id):
+        """What DELETE /students/{id} does (faces go with the student)."""
+        self.db.table("students").delete().eq("id", student_id).execute()
+        self.db.table("faces").delete().eq("student_id", student_id).execute()
+        replica.remove_student(student_id)
+        self.gallery_changes.record_student_removed(student_id)
+
+    def db_face_ids(self):
+        return sorted(r["id"] for r in self.db.tables["faces"])
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    """Fresh fake database per test; the stubbed supabase_client and re-imported modules are undone afterwards."""
+    db = FakeSupabase()
+    monkeypatch.setitem(sys.modules, "supabase_client", types.SimpleNamespace(supabase=db))
+    monkeypatch.setenv("GALLERY_SNAPSHOT_PATH", "")
+    changes = fresh_import(monkeypatch, "gallery_changes")
+    return Replicas(db, fresh_import(monkeypatch, "face_gallery"), changes)
+
+
+def gallery_face_ids(gallery):
+    return sorted(gallery._face_ids)
+
+
+def test_replicas_converge_without_full_reload(replicas):
+    db = replicas.db
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    b.load()
+    assert a.seq == b.seq == 0
+    downloads = db.full_face_downloads()
+
+    replicas.register(a, "s0")
+    db.table("students").insert({"id": "s3", "name": "Student 3"}).execute()
+    replicas.register(a, "s3", count=3)
+    replicas.delete_student(b, "s1")
+
+    a.catch_up()
+    b.catch_up()
+    assert gallery_face_ids(a) == gallery_face_ids(b) == replicas.db_face_ids()
+    assert a.seq == b.seq == replicas.gallery_changes.latest_seq()
+    assert "s1" not in set(a._student_ids)
+    assert b.search(db.tables["faces"][-1]["embedding"], 0.9)[0]["student_id"] == "s3"
+    assert db.full_face_downloads() == downloads
+
+
+def test_own_changes_are_not_applied_twice(replicas):
+    a = replicas.gallery()
+    a.load()
+    replicas.register(a, "s2")
+    a.catch_up()
+    assert len(a) == len(replicas.db.tables["faces"])
+
+
+def test_restart_from_snapshot_replays_only_new_changes(replicas, monkeypatch, tmp_path):
+    monkeypatch.setattr(replicas.face_gallery, "GALLERY_SNAPSHOT_PATH", str(tmp_path / "gallery.snapshot"))
+    a = replicas.gallery()
+    a.load()  # first start writes the snapshot
+    replicas.register(a, "s0")
+    replicas.delete_student(a, "s2")
+
+    downloads = replicas.db.full_face_downloads()
+    restarted = replicas.gallery()
+    restarted.load()
+    restarted.catch_up()  # also started in the background by load()
+    assert gallery_face_ids(restarted) == replicas.db_face_ids()
+    assert replicas.db.full_face_downloads() == downloads
+
+
+def test_change_committed_out_of_order_is_not_skipped(replicas):
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    b.load()
+    late = next(replicas.db.seqs)  # a registration on another replica whose log row is not committed yet
+    replicas.register(a, "s0")  # logged as late + 1, visible first
+
+    b.catch_up()
+    assert b.seq == late - 1 and gallery_face_ids(b) != replicas.db_face_ids()
+
+    rows = replicas.db.table("faces").insert([{"student_id": "s2", "embedding": [1.0] * DIM}]).execute().data
+    replicas.db.table("face_changes").insert(
+        {"seq": late, "op": "insert", "face_id": rows[0]["id"], "student_id": "s2"}
+    ).execute()
+    b.catch_up()
+    assert b.seq == replicas.gallery_changes.latest_seq() and gallery_face_ids(b) == replicas.db_face_ids()
+
+
+def test_rolled_back_seq_is_skipped_after_the_gap_timeout(replicas, monkeypatch):
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    b.load()
+    next(replicas.db.seqs)  # taken by an insert that rolled back
+    replicas.register(a, "s0")
+
+    b.catch_up()
+    assert b.seq == 0
+    monkeypatch.setattr(replicas.face_gallery, "GALLERY_SYNC_GAP_SECONDS", 0)
+    b.catch_up()
+    assert b.seq == replicas.gallery_changes.latest_seq() and gallery_face_ids(b) == replicas.db_face_ids()
+
+
+def test_renames_and_face_deletes_reach_other_replicas(replicas):
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    b.load()
+
+    # What PUT /students/{id} does
+    replicas.db.table("students").update({"name": "Renamed"}).eq("id", "s0").execute()
+    a.set_student_name("s0", "Renamed")
+    replicas.gallery_changes.record_student_renamed("s0")
+    # A face deleted on its own
+    face_id = replicas.db.tables["faces"][0]["id"]
+    replicas.db.table("faces").delete().eq("id", face_id).execute()
+    a.remove_faces([face_id])
+    replicas.gallery_changes.record_faces_removed([face_id])
+
+    b.catch_up()
+    assert b._student_names["s0"] == "Renamed"
+    assert gallery_face_ids(b) == gallery_face_ids(a) == replicas.db_face_ids()
+
+
+def test_sync_reloads_once_the_change_log_is_back(replicas, monkeypatch):
+    gallery_sync = fresh_import(monkeypatch, "gallery_sync")
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    with monkeypatch.context() as outage:
+        outage.setattr(replicas.gallery_changes, "latest_seq", lambda: None)
+        b.load()
+        assert b.seq is None
+        replicas.register(a, "s0")
+        sync = gallery_sync.GallerySync(b, interval=1)
+        sync.tick()  # log still down: nothing to resume from
+        assert b.seq is None
+
+    sync._resume_at = 0.0  # skip the GALLERY_RESUME_SECONDS wait
+    sync.tick()
+    assert b.seq == replicas.gallery_changes.latest_seq()
+    assert gallery_face_ids(b) == replicas.db_face_ids()
+
+    replicas.register(a, "s1")
+    sync.tick()
+    assert gallery_face_ids(b) == replicas.db_face_ids()
+
+
+def test_snapshot_write_maps_the_rows_again(replicas, monkeypatch, tmp_path):
+    path = tmp_path / "gallery.snapshot"
+    monkeypatch.setattr(replicas.face_gallery, "GALLERY_SNAPSHOT_PATH", str(path))
+    a, b = replicas.gallery(), replicas.gallery()
+    a.load()
+    assert isinstance(a._matrix, np.memmap)
+    b.load()
+
+    replicas.register(a, "s0")
+    assert not isinstance(a._matrix, np.memmap)  # the change copied the rows to the heap
+    a.catch_up()
+    assert a.save_snapshot() and isinstance(a._matrix, np.memmap)
+    written = path.stat().st_ino
+
+    b.catch_up()  # the other worker at the same seq adopts a's file rather than writing its own
+    assert b.save_snapshot() and isinstance(b._matrix, np.memmap)
+    assert path.stat().st_ino == written
+    query = replicas.db.tables["faces"][-1]["embedding"]
+    assert b.search(query, 0.99, top_k=1)[0]["student_id"] == "s0"
+
+
+def racing_gallery(face_gallery_class):
+    class RacingGallery(face_gallery_class):
+        """Runs `race` right after search first reads the gallery rows, like a removal on another thread."""
+
+        race = None
+
+        def __getattribute__(self, name):
+            value = super().__getattribute__(name)
+            if name in ("_rows", "_matrix"):
+                race = super().__getattribute__("race")
+                if race is not None:
+                    self.race = None
+                    race()
+            return value
+
+    return RacingGallery
+
+
+def test_search_racing_a_removal_sees_consistent_rows(replicas):
+    """A search must never pair the matrix it read with student ids published after it."""
+    gallery = replicas.gallery(racing_gallery(replicas.face_gallery.FaceGallery))
+    gallery.load()
+    replicas.register(gallery, "s3", count=3)
+    query = replicas.db.tables["faces"][-1]["embedding"]  # a row of s3, the last student in the matrix
+
+    gallery.race = lambda: gallery.remove_student("s0")
+    matches = gallery.search(query, 0.99, top_k=1)
+    assert gallery.race is None and "s0" not in set(gallery._student_ids)
+    assert [m["student_id"] for m in matches] == ["s3"]
+
+
+def test_rename_during_registration_is_kept(replicas):
+    gallery = replicas.gallery()
+    gallery.load()
+    replicas.db.table("students").insert({"id": "s3", "name": "Old name"}).execute()
+
+    def fetch_racing_a_rename(student_id):
+        gallery.set_student_name(student_id, "New name")  # PUT /students/{id} while add_faces reads the name
+        return "Old name"
+
+    gallery._fetch_student_name = fetch_racing_a_rename
+    replicas.register(gallery, "s3")
+    query = replicas.db.tables["faces"][-1]["embedding"]
+    assert gallery.search(query, 0.99, top_k=1)[0]["student_name"] == "New name"
+
+
+def test_ensure_loaded_is_single_flight(replicas):
+    gallery = replicas.gallery()
+    downloads = replicas.db.full_face_downloads()
+    threads = [threading.Thread(target=gallery.ensure_loaded) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert gallery.loaded
+    assert replicas.db.full_face_downloads() == downloads + 1
+
+
+def test_failed_load_is_not_retried_per_caller(replicas):
+    gallery = replicas.gallery()
+    calls = []
+
+    def failing_load():
+        calls.append(1)
+        raise RuntimeError("database down")
+
+    gallery.load = failing_load
+    for _ in range(5):
+        try:
+            gallery.ensure_loaded()
+        except RuntimeError:
+            pass
+    assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
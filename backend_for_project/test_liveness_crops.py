@@ -0,0 +1,101 @@
+"""
+MiniFASNet crops: each model's crop scale comes from its file name as in
+SilentFace, crops are SilentFace's CropImage geometry (grown around the
+face, shifted to stay in the frame), and liveness_scores hands every model
+its own crops, for live frames and registration uploads alike.
+
+Usage: python test_liveness_crops.py   (or pytest test_liveness_crops.py)
+"""
+
+import numpy as np
+import pytest
+
+import recognition_pipeline
+from recognition_pipeline import LIVENESS_BBOX_SCALE, liveness_crop, liveness_crop_scale, liveness_scores
+
+
+class FakeEngine:
+    """Records the crops each model was given; scores every face 0.9 "Real"."""
+
+    def __init__(self, model_paths):
+        self.model_paths = model_paths
+        self.crops_per_model = None
+
+    def real_scores_per_model(self, crops_per_model):
+        self.crops_per_model = crops_per_model
+        return np.full(len(crops_per_model[0]), 0.9, dtype=np.float32)
+
+
+def gradient_frame(height=480, width=640):
+    """Frame whose pixels encode their own column, so a crop shows which columns it covers."""
+    cols = np.tile(np.linspace(0, 255, width, dtype=np.float32), (height, 1))
+    return np.repeat(cols[:, :, None], 3, axis=2).astype(np.uint8)
+
+
+def test_scale_parsed_from_model_file_name():
+    assert liveness_crop_scale("models/2.7_80x80_MiniFASNetV2.pth") == 2.7
+    assert liveness_crop_scale("4_0_0_80x80_MiniFASNetV1SE.pth") == 4.0
+    assert liveness_crop_scale("org_1_80x60_MiniFASNetV1SE.pth") is None
+    assert liveness_crop_scale("custom_MiniFASNet.onnx") == LIVENESS_BBOX_SCALE
+    print("✅ scale parsed from model file name")
+
+
+def test_crop_is_shifted_into_frame():
+    img = gradient_frame()
+    for box in [(300, 200, 60, 60), (0, 0, 60, 60), (600, 440, 40, 40), (100, 100, 400, 400)]:
+        for scale in (2.7, 4.0, None):
+            assert liveness_crop(img, box, scale).shape == (80, 80, 3)
+
+    # A face at the left edge keeps its full 2.7x context, shifted right rather than clipped
+    crop = liveness_crop(img, (0, 200, 60, 60), 2.7)
+    assert crop[:, 0].mean() < 2 and abs(int(crop[:, -1].mean()) - int(162 * 255 / 639)) <= 2
+    print("✅ crop shifted into frame")
+
+
+def test_larger_scale_covers_more_context():
+    img = gradient_frame()
+    box = (300, 200, 60, 60)
+    spread = [np.ptp(liveness_crop(img, box, scale)[:, :, 0].astype(int)) for scale in (1.35, 2.7, 4.0)]
+    assert spread[0] < spread[1] < spread[2], spread
+    print("✅ larger scale covers more context")
+
+
+def test_each_model_gets_its_own_crops():
+    img = gradient_frame()
+    boxes = [(300, 200, 60, 60), (100, 100, 80, 80)]
+    engine = FakeEngine(["2.7_80x80_MiniFASNetV2.pth", "4_0_0_80x80_MiniFASNetV1SE.pth"])
+
+    scores = liveness_scores(engine, img, boxes)
+    assert scores.shape == (2,)
+    v2, v1se = engine.crops_per_model
+    assert len(v2) == len(v1se) == 2
+    for box, a, b in zip(boxes, v2, v1se):
+        assert np.array_equal(a, liveness_crop(img, box, 2.7))
+        assert np.array_equal(b, liveness_crop(img, box, 4.0))
+        assert not np.array_equal(a, b)
+    print("✅ each model gets its own crops")
+
+
+def test_registration_batch_uses_the_same_crops():
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8) for _ in range(2)]
+    box = (300, 200, 100, 100)
+    engine = FakeEngine(["2.7_80x80_MiniFASNetV2.pth", "4_0_0_80x80_MiniFASNetV1SE.pth"])
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(recognition_pipeline, "detect_faces", lambda img: [box])
+        mp.setattr(recognition_pipeline, "embed_faces", lambda crops: [[float(c.shape[0])] for c in crops])
+        embeddings, errors = recognition_pipeline.analyze_registration_batch(images, engine, skip_liveness=False)
+
+    assert errors == [] and embeddings == [[100.0], [100.0]]
+    for scale, crops in zip((2.7, 4.0), engine.crops_per_model):
+        assert all(np.array_equal(crop, liveness_crop(img, box, scale)) for crop, img in zip(crops, images))
+    print("✅ registration batch uses the same crops")
+
+
+if __name__ == "__main__":
+    test_scale_parsed_from_model_file_name()
+    test_crop_is_shifted_into_frame()
+    test_larger_scale_covers_more_context()
+    test_each_model_gets_its_own_crops()
+    test_registration_batch_uses_the_same_crops()
@@ -0,0 +1,87 @@
+"""
+Parity check for INFERENCE_BACKEND=onnx.
+ArcFace embeddings from the exported graph must stay within MIN_COSINE of
+the DeepFace ones, and MiniFASNet must make the same real/spoof decision at
+LIVENESS_THRESHOLD as the PyTorch models, on the same crops.
+
+Run export_onnx.py first. ONNX_INT8=true checks the quantised copies.
+
+Usage: python test_onnx_parity.py [folder_with_face_images]
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from face_embedding import embed_faces_native, embed_faces_onnx
+from liveness_engine import LivenessEngine, liveness_model_paths
+from onnx_backend import ONNX_INT8, OnnxLivenessEngine
+from recognition_pipeline import LIVENESS_THRESHOLD, liveness_scores
+from test_embedding_parity import CASCADE_PATH, cosine
+
+MIN_COSINE = 0.99
+MAX_SCORE_DIFF_FP32 = 1e-3  # float export: only kernel rounding differs
+
+
+def load_faces(folder=None, count=8):
+    """(image, face box) pairs from a folder of photos, or random images filled by one box when none is given."""
+    faces = []
+    if folder:
+        detector = cv2.CascadeClassifier(CASCADE_PATH)
+        for name in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, name))
+            if img is None:
+                continue
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            for box in detector.detectMultiScale(gray, 1.3, 5, minSize=(60, 60)):
+                faces.append((img, tuple(int(v) for v in box)))
+    if not faces:
+        rng = np.random.default_rng(0)
+        for s in rng.integers(80, 240, size=count):
+            img = rng.integers(0, 256, size=(int(s), int(s), 3), dtype=np.uint8)
+            faces.append((img, (0, 0, int(s), int(s))))
+    return faces
+
+
+def test_arcface_embeddings_match(folder=None):
+    crops = [img[y:y+h, x:x+w] for img, (x, y, w, h) in load_faces(folder)]
+    native, exported = embed_faces_native(crops), embed_faces_onnx(crops)
+    assert len(exported) == len(crops)
+
+    sims = [cosine(a, b) for a, b in zip(native, exported)]
+    for idx, (crop, sim) in enumerate(zip(crops, sims)):
+        print(f"   Crop {idx+1} {crop.shape[1]}x{crop.shape[0]}: cosine={sim:.6f}")
+    print(f"\n📊 Worst ArcFace cosine ONNX vs DeepFace: {min(sims):.6f} (required ≥ {MIN_COSINE})")
+    assert min(sims) >= MIN_COSINE, f"ONNX ArcFace drifted from DeepFace ({min(sims):.6f})"
+
+
+def test_liveness_decisions_match(folder=None):
+    faces = load_faces(folder)
+    paths = liveness_model_paths()
+    native_engine, exported_engine = LivenessEngine(paths), OnnxLivenessEngine(paths)
+    native = np.concatenate([liveness_scores(native_engine, img, [box]) for img, box in faces])
+    exported = np.concatenate([liveness_scores(exported_engine, img, [box]) for img, box in faces])
+
+    diff = float(np.abs(native - exported).max())
+    flipped = int(np.sum((native >= LIVENESS_THRESHOLD) != (exported >= LIVENESS_THRESHOLD)))
+    print(f"📊 Liveness: max |score diff| {diff:.5f}, {flipped}/{len(faces)} decisions differ "
+          f"at threshold {LIVENESS_THRESHOLD}")
+    assert flipped == 0, f"{flipped} liveness decisions differ between ONNX and PyTorch"
+    if not ONNX_INT8:
+        assert diff <= MAX_SCORE_DIFF_FP32, f"float ONNX liveness scores drifted ({diff:.5f})"
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    print("=" * 60)
+    print(f"ONNX PARITY ({'int8' if ONNX_INT8 else 'float'} exports) vs DeepFace / PyTorch")
+    print("=" * 60)
+    test_arcface_embeddings_match(folder)
+    test_liveness_decisions_match(folder)
+    print("✅ ONNX models match the native ones")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,12 @@ export default function LiveAttendanceSubjectPage() {
   const canvasRef = useRef<HTMLCanvasElement | null>(null);
   const timerRef = useRef<number | undefined>(undefined);
   const shouldStopRef = useRef<boolean>(false);
+  // One backend recognition session (face tracker, frame gate) per camera feed in this tab
+  const sessionIdRef = useRef<string>(
+    typeof crypto !== "undefined" && "randomUUID" in crypto
+      ? crypto.randomUUID()
+      : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+  );
 
   const [subjectName, setSubjectName] = useState<string>("Subject");
   const [subjectCode, setSubjectCode] = useState<string | null>(null);
@@ -223,6 +229,7 @@ export default function LiveAttendanceSubjectPage() {
     if (subjectId) {
       form.append("subject_id", subjectId);
     }
+    form.append("session_id", sessionIdRef.current);
 
     try {
       const res = await fetch(`${BACKEND}/recognize_frame`, {